@@ -0,0 +1,191 @@
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+
+"""
+This module times and memory profiles every stage of the pipeline on a dataset directory.
+
+Every stage runs in its own spawned process with the dataset directory as working directory,
+so the peak RSS of a stage is not hidden by the memory of the stages before it.
+For every stage the wall clock time, the CPU time and the peak RSS are measured and
+appended together with the telemetry records of its steps,
+the git commit and the scale to benchmarks/results.jsonl.
+The peak RSS of a stage is the larger one of the stage process and its largest worker process,
+both are recorded on their own as well.
+Comparing the records of two commits shows regressions per stage.
+
+Run it with:
+    python src/benchmark/bench.py <root> --generate --kreise 10
+"""
+
+RESULTS_FILE = './benchmarks/results.jsonl'
+# stages of the pipeline in execution order, stages later in the list need the output of earlier ones
+STAGES = ['data_helper', 'ev', 'simple_split', 'kmeans_batched', 'parking', 'coverage', 'viz']
+# maximum number of charging stations per parking space used in the parking stage
+PARKING_THRESHOLD = 4
+
+
+def run_stage(stage: str, algorithm: int) -> None:
+    """
+    Runs one stage of the pipeline in the current working directory.
+
+    Args:
+        stage (str): The name of the stage
+        algorithm (int): The bubble algorithm used by the parking stage, 1 simple split, 2 KMeans
+    """
+    from helper import stages
+    if stage == 'parking':
+        stages.run_stage(stage, algorithm, threshold=PARKING_THRESHOLD)
+    else:
+        stages.run_stage(stage)
+
+
+def profile_stage(root: str, stage: str, algorithm: int, queue, trace_memory: bool) -> None:
+    """
+    Entry point of the stage process. Puts the measurement of the stage into `queue`.
+    """
+    os.chdir(root)
+    sys.stdout = open(os.devnull, 'w')
+    if trace_memory:
+        import tracemalloc
+        tracemalloc.start()
+    from helper import telemetry
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    with telemetry.stage(stage):
+        run_stage(stage, algorithm)
+    result = {'wall_s': time.perf_counter() - wall,
+              'cpu_s': time.process_time() - cpu,
+              'steps': telemetry.records()[:-1]}
+    if trace_memory:
+        result['python_peak_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    result['cpu_s'] += children.ru_utime + children.ru_stime
+    # ru_maxrss is in kilobytes on Linux. The telemetry resets the peak of the process
+    # for every step, the record of the stage keeps the peak over all of its steps.
+    result['self_peak_rss_mb'] = max(usage.ru_maxrss / 1024, telemetry.records()[-1]['peak_rss_mb'])
+    # the peak of the largest terminated worker process
+    result['children_peak_rss_mb'] = children.ru_maxrss / 1024
+    result['peak_rss_mb'] = max(result['self_peak_rss_mb'], result['children_peak_rss_mb'])
+    queue.put(result)
+
+
+def git_commit() -> str | None:
+    """
+    Returns the current git commit, or None outside of a git repository.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(root: str, stages: list[str] = STAGES, scale: dict | None = None,
+                  results_file: str = RESULTS_FILE, trace_memory: bool = False) -> list[dict]:
+    """
+    Runs the stages one after another on the datasets in <root>/datasets.
+
+    Args:
+        root (str): The directory with the datasets folder
+        stages (list[str], optional): The stages to run. Defaults to STAGES.
+        scale (dict, optional): The parameters the datasets were generated with. Defaults to None.
+        results_file (str, optional): The file the records are appended to. Defaults to RESULTS_FILE.
+        trace_memory (bool, optional): Additionally trace the peak of Python allocations.
+                                       Slows the stages down. Defaults to False.
+
+    Returns:
+        list[dict]: One record per stage
+    """
+    root = os.path.abspath(root)
+    algorithm = 2 if 'kmeans_batched' in stages and 'simple_split' not in stages else 1
+    context = multiprocessing.get_context('spawn')
+    commit = git_commit()
+    timestamp = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    records = []
+    for stage in stages:
+        queue = context.Queue()
+        process = context.Process(target=profile_stage,
+                                  args=(root, stage, algorithm, queue, trace_memory))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            raise RuntimeError(f"Stage {stage} failed with exit code {process.exitcode}")
+        record = {'commit': commit, 'timestamp': timestamp, 'stage': stage, 'scale': scale or {}}
+        record.update(queue.get())
+        records.append(record)
+        print(f"{stage:<15} {record['wall_s']:8.2f}s wall {record['cpu_s']:8.2f}s cpu "
+              f"{record['peak_rss_mb']:8.1f}MB peak ({record['children_peak_rss_mb']:.1f}MB workers)")
+
+    os.makedirs(os.path.dirname(results_file), exist_ok=True)
+    with open(results_file, 'a') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+    return records
+
+
+def compare(results_file: str = RESULTS_FILE, base: str | None = None, head: str | None = None) -> pd.DataFrame:
+    """
+    Compares the measurements of two commits per stage.
+    Only records with the same scale are compared, the last record of a commit and stage wins.
+
+    Args:
+        results_file (str, optional): The file with the records. Defaults to RESULTS_FILE.
+        base (str, optional): The commit to compare against. Defaults to the second to last commit.
+        head (str, optional): The compared commit. Defaults to the last commit.
+
+    Returns:
+        pd.DataFrame: Per stage the measurements of both commits and their ratio
+    """
+    df = pd.read_json(results_file, lines=True)
+    df['scale'] = df['scale'].apply(lambda scale: json.dumps(scale, sort_keys=True))
+    commits = list(dict.fromkeys(df['commit']))
+    if (base is None or head is None) and len(commits) < 2:
+        raise ValueError(f"{results_file} contains the records of less than two commits")
+    head = head or commits[-1]
+    base = base or commits[-2]
+    scale = df.loc[df['commit'] == head, 'scale'].iloc[-1]
+    df = df[df['scale'] == scale].drop_duplicates(['commit', 'stage'], keep='last').set_index('stage')
+    metrics = ['wall_s', 'cpu_s', 'peak_rss_mb']
+    result = df.loc[df['commit'] == base, metrics].join(
+        df.loc[df['commit'] == head, metrics], lsuffix='_base', rsuffix='_head', how='inner')
+    for metric in metrics:
+        result[f'{metric}_ratio'] = result[f'{metric}_head'] / result[f'{metric}_base']
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the stages of the pipeline.')
+    parser.add_argument('root', help='the directory with the datasets folder')
+    parser.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES)
+    parser.add_argument('--generate', action='store_true',
+                        help='generate synthetic datasets in root first')
+    parser.add_argument('--kreise', type=int, default=1)
+    parser.add_argument('--cells-per-kreis', type=int, default=7_500)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--trace-memory', action='store_true')
+    parser.add_argument('--results', default=RESULTS_FILE)
+    parser.add_argument('--compare', nargs='*', metavar='COMMIT',
+                        help='compare two commits instead of running the stages')
+    args = parser.parse_args()
+
+    if args.compare is not None:
+        print(compare(args.results, *args.compare).to_string())
+        sys.exit(0)
+    scale = {'kreise': args.kreise, 'cells_per_kreis': args.cells_per_kreis, 'seed': args.seed}
+    if args.generate:
+        from benchmark import synthetic
+        synthetic.generate_datasets(args.root, args.kreise, args.cells_per_kreis, args.seed)
+    run_benchmark(args.root, args.stages, scale, args.results, args.trace_memory)
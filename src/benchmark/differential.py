@@ -0,0 +1,386 @@
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+from benchmark import bench  # noqa: E402
+from helper import scope, workspace  # noqa: E402
+
+
+"""
+This module checks that a faster engine produces the same results as the current implementation.
+
+A candidate engine replaces functions of the pipeline, e.g. a faster `split_area`, and/or sets
+environment variables, e.g. POWERUP_EXECUTOR=serial. The reference and the candidate run the same
+stages on the same datasets (synthetic or real) in <root>/differential/reference and
+<root>/differential/candidate. Before every stage the candidate gets a copy of the files the reference
+had before that stage, so every stage is compared on identical inputs and a difference is reported
+at the stage that caused it instead of every stage after it.
+
+The files written by a stage are compared by their content, not their bytes:
+bubbles are matched by their Hausdorff distance in EPSG:3035, the EV grid by its cell id and the
+charging points by their OSM id, floats with a relative and an absolute tolerance and other tables
+independent of their row order. Every stage runs in its own process like in bench.py,
+so the report also shows the speedup and the difference of the peak memory.
+
+    python src/benchmark/differential.py /tmp/powerup-bench --generate --kreise 2 \\
+        --replace redistricting.simple_split.split_area=fast_split:split_area
+    python src/benchmark/differential.py /tmp/powerup-bench --env POWERUP_EXECUTOR=serial
+
+The module of a replacement has to be importable, e.g. from the PYTHONPATH. A replaced function is set
+on the module or class that defines it. Modules that imported it with `from ... import` keep the
+original, their name has to be replaced as well.
+"""
+
+DIFFERENTIAL_PATH = 'differential'
+REPORT_FILE = 'report.json'
+# stages compared by default, the expensive kmeans_batched stage only if it is selected
+DEFAULT_STAGES = ['data_helper', 'ev', 'simple_split', 'parking']
+RTOL = 1e-7
+ATOL = 1e-9
+# meters two bubbles may be apart to be the same bubble
+GEOMETRY_TOLERANCE = 0.01
+BUBBLE_FILES = ['hulls_split.csv', 'hulls_batched.csv', 'filtered_bubbles.csv']
+# the column that identifies the rows of a table, tables without key are compared independent of their order
+TABLE_KEYS = {'merged_100m_cleared.parquet': 'id',
+              'cleared_ev.parquet': 'id',
+              'charging_points.parquet': 'osm_id',
+              'charging_points.csv': 'osm_id'}
+COMPARED_SUFFIXES = ('.parquet', '.csv', '.geojson')
+IGNORED_FILES = ['run_state.json', 'trace.json', 'trace.csv', 'trace_tasks.csv']
+
+
+def resolve(path: str) -> tuple[object, str]:
+    """
+    Finds the owner of a dotted name, e.g. the class ParkingService for
+    'parkingspotfilter.parking.ParkingService.find_nearest_point_ckdtree'.
+
+    Returns:
+        tuple[object, str]: The module or class and the name of the attribute
+    """
+    parts = path.split('.')
+    for split in range(len(parts) - 1, 0, -1):
+        try:
+            owner = importlib.import_module('.'.join(parts[:split]))
+        except ImportError:
+            continue
+        for part in parts[split:-1]:
+            owner = getattr(owner, part)
+        if not hasattr(owner, parts[-1]):
+            raise AttributeError(f"{path} does not exist")
+        return owner, parts[-1]
+    raise ImportError(f"No module found for {path}")
+
+
+def load_replacement(path: str) -> object:
+    """
+    Imports a replacement given as 'module:name'.
+    """
+    module_name, _, name = path.partition(':')
+    replacement = importlib.import_module(module_name)
+    for part in name.split('.') if name else []:
+        replacement = getattr(replacement, part)
+    return replacement
+
+
+def apply_engine(replacements: dict, environment: dict) -> None:
+    """
+    Sets the environment variables and replaces the functions of an engine in the current process.
+
+    Args:
+        replacements (dict): The dotted name of the replaced function and 'module:name' of the replacement
+        environment (dict): The environment variables of the engine
+    """
+    os.environ.update({key: str(value) for key, value in environment.items()})
+    for target, replacement in replacements.items():
+        owner, name = resolve(target)
+        setattr(owner, name, load_replacement(replacement))
+
+
+def profile_engine(root: str, stage: str, algorithm: int, replacements: dict, environment: dict, queue) -> None:
+    """
+    Entry point of the stage process of an engine. Puts the measurement of the stage into `queue`.
+    """
+    apply_engine(replacements, environment)
+    bench.profile_stage(root, stage, algorithm, queue, False)
+
+
+def run_engine_stage(directory: str, stage: str, algorithm: int, replacements: dict, environment: dict) -> dict:
+    """
+    Runs one stage in its own process in `directory`.
+
+    Returns:
+        dict: The wall clock time, CPU time and peak RSS of the stage
+    """
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=profile_engine,
+                              args=(directory, stage, algorithm, replacements, environment, queue))
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        raise RuntimeError(f"Stage {stage} failed with exit code {process.exitcode} in {directory}")
+    return queue.get()
+
+
+def prepare_directory(root: str, name: str) -> str:
+    """
+    Creates an empty run directory with links to the raw datasets of <root>/datasets.
+    """
+    directory = os.path.join(root, DIFFERENTIAL_PATH, name)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(os.path.join(directory, 'datasets', 'generated'))
+    for file_name in scope.RAW_DATASETS:
+        workspace.link(os.path.join(root, 'datasets', file_name), os.path.join(directory, 'datasets', file_name))
+    return directory
+
+
+def snapshot(directory: str) -> dict:
+    """
+    Returns the size and modification time of the compared files in datasets/generated.
+    """
+    generated = os.path.join(directory, 'datasets', 'generated')
+    result = {}
+    for entry in os.scandir(generated):
+        if entry.is_file() and entry.name.endswith(COMPARED_SUFFIXES) and entry.name not in IGNORED_FILES:
+            stat = entry.stat()
+            result[entry.name] = (stat.st_size, stat.st_mtime_ns)
+    return result
+
+
+def copy_generated(source: str, target: str) -> None:
+    """
+    Replaces the generated files of `target` with a copy of the ones of `source`.
+    The modification times are kept, so fingerprints of persisted indexes stay valid.
+    """
+    generated = os.path.join(target, 'datasets', 'generated')
+    shutil.rmtree(generated)
+    shutil.copytree(os.path.join(source, 'datasets', 'generated'), generated)
+
+
+def read_table(path: str) -> pd.DataFrame:
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    if path.endswith('.geojson'):
+        with open(path, 'r') as f:
+            features = json.load(f)['features']
+        return pd.DataFrame({'feature': [json.dumps(feature, sort_keys=True) for feature in features]})
+    return pd.read_csv(path)
+
+
+def compare_tables(reference: pd.DataFrame, candidate: pd.DataFrame, key: str | None = None,
+                   rtol: float = RTOL, atol: float = ATOL) -> dict:
+    """
+    Compares two tables column by column. Numeric columns are compared with a tolerance,
+    all other columns exactly. Rows are matched by `key` or, without key, by sorting all columns.
+
+    Args:
+        reference (pd.DataFrame): The result of the reference
+        candidate (pd.DataFrame): The result of the candidate
+        key (str, optional): The column that identifies the rows. Defaults to None.
+        rtol (float, optional): The relative tolerance of numeric values. Defaults to RTOL.
+        atol (float, optional): The absolute tolerance of numeric values. Defaults to ATOL.
+
+    Returns:
+        dict: equal, the rows of both tables, the rows missing in and added by the candidate,
+              the matched rows that differ, the differing columns and the largest absolute difference
+    """
+    result = {'rows_reference': len(reference), 'rows_candidate': len(candidate),
+              'missing': 0, 'extra': 0, 'mismatched': 0, 'columns': [], 'max_abs_diff': 0.0}
+    if list(reference.columns) != list(candidate.columns):
+        result['columns'] = sorted(set(reference.columns) ^ set(candidate.columns))
+        result['equal'] = False
+        return result
+    if key is not None and key in reference.columns:
+        reference, candidate = reference.set_index(key), candidate.set_index(key)
+        result['missing'] = int((~reference.index.isin(candidate.index)).sum())
+        result['extra'] = int((~candidate.index.isin(reference.index)).sum())
+        common = reference.index.intersection(candidate.index)
+        reference, candidate = reference.loc[common], candidate.loc[common]
+    else:
+        columns = list(reference.columns)
+        reference = reference.sort_values(columns, ignore_index=True)
+        candidate = candidate.sort_values(columns, ignore_index=True)
+        rows = min(len(reference), len(candidate))
+        result['missing'] = max(len(reference) - rows, 0)
+        result['extra'] = max(len(candidate) - rows, 0)
+        reference, candidate = reference.iloc[:rows], candidate.iloc[:rows]
+    differs = np.zeros(len(reference), dtype=bool)
+    for column in reference.columns:
+        left, right = reference[column], candidate[column]
+        if pd.api.types.is_numeric_dtype(left) and pd.api.types.is_numeric_dtype(right):
+            left, right = left.to_numpy(dtype=np.float64), right.to_numpy(dtype=np.float64)
+            column_differs = ~np.isclose(left, right, rtol=rtol, atol=atol, equal_nan=True)
+            if len(left):
+                diff = np.abs(left - right)
+                result['max_abs_diff'] = max(result['max_abs_diff'], float(np.nanmax(diff, initial=0.0)))
+        else:
+            # missing values are rendered the same way, so they are equal to each other
+            column_differs = left.astype(str).to_numpy() != right.astype(str).to_numpy()
+        if column_differs.any():
+            result['columns'].append(column)
+        differs |= column_differs
+    result['mismatched'] = int(differs.sum())
+    result['equal'] = result['missing'] == result['extra'] == result['mismatched'] == 0
+    return result
+
+
+def compare_bubbles(reference: pd.Series, candidate: pd.Series, tolerance: float = GEOMETRY_TOLERANCE) -> dict:
+    """
+    Matches the bubbles of two runs one to one. Two bubbles match if their Hausdorff distance
+    in EPSG:3035 is at most `tolerance` meters, which works for polygons, lines and points alike
+    and does not depend on the order of the bubbles or the start point of their rings.
+
+    Args:
+        reference (pd.Series): The WKT hulls of the reference
+        candidate (pd.Series): The WKT hulls of the candidate
+        tolerance (float, optional): The maximum distance in meters. Defaults to GEOMETRY_TOLERANCE.
+
+    Returns:
+        dict: equal, the bubbles of both runs, the unmatched bubbles of both and the largest distance of a match
+    """
+    import geopandas as gpd
+    reference = gpd.GeoSeries.from_wkt(reference.values, crs="EPSG:4326").to_crs("EPSG:3035")
+    candidate = gpd.GeoSeries.from_wkt(candidate.values, crs="EPSG:4326").to_crs("EPSG:3035")
+    matched, max_distance = 0, 0.0
+    if len(reference) and len(candidate):
+        reference_idx, candidate_idx = candidate.sindex.query_bulk(
+            reference.buffer(max(tolerance, 1e-6)), predicate='intersects')
+        distance = np.array([reference.iloc[i].hausdorff_distance(candidate.iloc[j])
+                             for i, j in zip(reference_idx, candidate_idx)])
+        # the closest pairs are matched first, every bubble at most once
+        used_reference, used_candidate = set(), set()
+        for pair in np.argsort(distance, kind='stable'):
+            if distance[pair] > tolerance:
+                break
+            if reference_idx[pair] in used_reference or candidate_idx[pair] in used_candidate:
+                continue
+            used_reference.add(reference_idx[pair])
+            used_candidate.add(candidate_idx[pair])
+            max_distance = float(distance[pair])
+        matched = len(used_reference)
+    return {'equal': matched == len(reference) == len(candidate),
+            'rows_reference': len(reference), 'rows_candidate': len(candidate),
+            'missing': len(reference) - matched, 'extra': len(candidate) - matched,
+            'max_distance_m': max_distance}
+
+
+def compare_file(reference_dir: str, candidate_dir: str, file_name: str, rtol: float = RTOL, atol: float = ATOL,
+                 geometry_tolerance: float = GEOMETRY_TOLERANCE) -> dict:
+    """
+    Compares a file of datasets/generated with the comparison that suits it.
+    """
+    reference_path = os.path.join(reference_dir, 'datasets', 'generated', file_name)
+    candidate_path = os.path.join(candidate_dir, 'datasets', 'generated', file_name)
+    if not os.path.exists(candidate_path):
+        return {'equal': False, 'missing_file': True}
+    reference, candidate = read_table(reference_path), read_table(candidate_path)
+    if file_name in BUBBLE_FILES:
+        return compare_bubbles(reference['hull'], candidate['hull'], geometry_tolerance)
+    return compare_tables(reference, candidate, TABLE_KEYS.get(file_name), rtol, atol)
+
+
+def compare_engines(root: str, replacements: dict | None = None, environment: dict | None = None,
+                    stages: list[str] = DEFAULT_STAGES, rtol: float = RTOL, atol: float = ATOL,
+                    geometry_tolerance: float = GEOMETRY_TOLERANCE) -> pd.DataFrame:
+    """
+    Runs the reference and the candidate engine stage by stage and compares the files every stage writes.
+    The stages before the compared ones only run for the reference, to create their inputs.
+
+    Args:
+        root (str): The directory with the datasets folder
+        replacements (dict, optional): The functions replaced by the candidate, see `apply_engine`
+        environment (dict, optional): The environment variables of the candidate
+        stages (list[str], optional): The compared stages of bench.STAGES. Defaults to DEFAULT_STAGES.
+        rtol (float, optional): The relative tolerance of numeric values. Defaults to RTOL.
+        atol (float, optional): The absolute tolerance of numeric values. Defaults to ATOL.
+        geometry_tolerance (float, optional): The meters two bubbles may be apart. Defaults to GEOMETRY_TOLERANCE.
+
+    Returns:
+        pd.DataFrame: One row per stage and written file with the result of the comparison,
+                      the time and peak memory of both engines, the speedup and the memory delta
+    """
+    root = os.path.abspath(root)
+    unknown = set(stages) - set(bench.STAGES)
+    if unknown:
+        raise ValueError(f"Unknown stages: {', '.join(sorted(unknown))}")
+    last = max(bench.STAGES.index(stage) for stage in stages)
+    run_stages = [stage for stage in bench.STAGES[:last + 1] if stage != 'kmeans_batched' or stage in stages]
+    algorithm = 2 if 'kmeans_batched' in run_stages and 'simple_split' not in run_stages else 1
+    reference_dir = prepare_directory(root, 'reference')
+    candidate_dir = prepare_directory(root, 'candidate')
+    rows = []
+    for stage in run_stages:
+        before = snapshot(reference_dir)
+        if stage in stages:
+            copy_generated(reference_dir, candidate_dir)
+        reference = run_engine_stage(reference_dir, stage, algorithm, {}, {})
+        if stage not in stages:
+            continue
+        candidate = run_engine_stage(candidate_dir, stage, algorithm, replacements or {}, environment or {})
+        measurement = {'stage': stage,
+                       'wall_s_reference': reference['wall_s'], 'wall_s_candidate': candidate['wall_s'],
+                       'speedup': reference['wall_s'] / max(candidate['wall_s'], 1e-9),
+                       'peak_rss_mb_reference': reference['peak_rss_mb'],
+                       'peak_rss_mb_candidate': candidate['peak_rss_mb'],
+                       'peak_rss_mb_delta': candidate['peak_rss_mb'] - reference['peak_rss_mb']}
+        after = snapshot(reference_dir)
+        written = sorted(name for name, state in after.items() if before.get(name) != state)
+        for file_name in written:
+            result = compare_file(reference_dir, candidate_dir, file_name, rtol, atol, geometry_tolerance)
+            rows.append({**measurement, 'file': file_name, **result})
+        print(f"{stage:<15} {'equal' if all(row['equal'] for row in rows if row['stage'] == stage) else 'DIFFERENT':<10} "
+              f"{measurement['speedup']:6.2f}x speedup {measurement['peak_rss_mb_delta']:+8.1f}MB peak")
+    report = pd.DataFrame(rows)
+    with open(os.path.join(root, DIFFERENTIAL_PATH, REPORT_FILE), 'w') as f:
+        json.dump({'replacements': replacements or {}, 'environment': environment or {},
+                   'results': json.loads(report.to_json(orient='records'))}, f, indent=2)
+    return report
+
+
+def parse_assignments(values: list[str] | None) -> dict:
+    """
+    Parses 'name=value' arguments into a dict.
+    """
+    result = {}
+    for value in values or []:
+        name, separator, assigned = value.partition('=')
+        if not separator:
+            raise ValueError(f"{value} is not of the form name=value")
+        result[name] = assigned
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the results of a candidate engine with the reference.')
+    parser.add_argument('root', help='the directory with the datasets folder')
+    parser.add_argument('--stages', nargs='+', default=DEFAULT_STAGES, choices=bench.STAGES)
+    parser.add_argument('--replace', nargs='+', metavar='TARGET=MODULE:NAME',
+                        help='replace a function of the pipeline with the one of the candidate')
+    parser.add_argument('--env', nargs='+', metavar='NAME=VALUE', help='environment variables of the candidate')
+    parser.add_argument('--rtol', type=float, default=RTOL)
+    parser.add_argument('--atol', type=float, default=ATOL)
+    parser.add_argument('--geometry-tolerance', type=float, default=GEOMETRY_TOLERANCE,
+                        help='meters two bubbles may be apart')
+    parser.add_argument('--generate', action='store_true', help='generate synthetic datasets in root first')
+    parser.add_argument('--kreise', type=int, default=1)
+    parser.add_argument('--cells-per-kreis', type=int, default=7_500)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.generate:
+        from benchmark import synthetic
+        synthetic.generate_datasets(args.root, args.kreise, args.cells_per_kreis, args.seed)
+    report = compare_engines(args.root, parse_assignments(args.replace), parse_assignments(args.env),
+                             args.stages, args.rtol, args.atol, args.geometry_tolerance)
+    print(report.drop(columns=[column for column in report.columns if column.startswith(('wall_s', 'peak_rss'))],
+                      errors='ignore').to_string())
+    sys.exit(0 if report.empty or report['equal'].all() else 1)
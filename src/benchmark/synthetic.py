@@ -0,0 +1,288 @@
+import argparse
+import io
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from pyproj import Transformer
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+
+"""
+This module generates synthetic input datasets in the format of the real downloads.
+
+The generated Kreise are laid out on a grid over the extent of Germany in EPSG:3035.
+Every Kreis consists of a few towns whose population decreases with the distance to the
+town centre. One Kreis with the default number of cells is a small rural district,
+400 Kreise with the default number of cells are roughly the size of all of Germany
+(about three million populated cells).
+
+All files are written to <root>/datasets with the names listed in the README,
+so the pipeline can be run unchanged with <root> as working directory.
+"""
+
+# Extent of Germany in EPSG:3035
+EXTENT = (4_030_000, 2_690_000, 4_670_000, 3_550_000)
+# Land keys used for the generated Kreise. 13 is left out, because the census data of
+# Mecklenburg-Vorpommern is reformed by hand in data_helper.fix_changes_in_municipality_data
+LAENDER = ['01', '02', '03', '04', '05', '06', '07', '08', '09', '10', '11', '12', '14', '15', '16']
+GEOGITTER_FILES = 60
+
+
+def kreis_keys(kreise: int) -> list[str]:
+    """
+    Returns five digit Kreis keys that are not touched by the manual corrections of the census data.
+    """
+    return [f"{LAENDER[i % len(LAENDER)]}{101 + i // len(LAENDER):03d}" for i in range(kreise)]
+
+
+def grid_id(x_mp: np.ndarray, y_mp: np.ndarray) -> np.ndarray:
+    """
+    Returns the INSPIRE ids of 100m cells from the coordinates of their centres.
+    """
+    x_sw = (x_mp - 50).astype(np.int64).astype(str)
+    y_sw = (y_mp - 50).astype(np.int64).astype(str)
+    return np.char.add(np.char.add(np.char.add('CRS3035RES100mN', y_sw), 'E'), x_sw)
+
+
+def generate_cells(kreise: int, cells_per_kreis: int, rng: np.random.Generator) -> pd.DataFrame:
+    """
+    Generates the populated 100m cells of all Kreise.
+
+    Returns:
+        pd.DataFrame: The columns x_mp, y_mp, Einwohner and ags
+    """
+    columns = int(np.ceil(np.sqrt(kreise)))
+    rows = int(np.ceil(kreise / columns))
+    width = (EXTENT[2] - EXTENT[0]) // columns
+    height = (EXTENT[3] - EXTENT[1]) // rows
+    frames = []
+    for i, kreis in enumerate(kreis_keys(kreise)):
+        x0 = EXTENT[0] + (i % columns) * width
+        y0 = EXTENT[1] + (i // columns) * height
+        towns = rng.integers(3, 9)
+        centres = np.column_stack([rng.uniform(x0 + width * 0.1, x0 + width * 0.9, towns),
+                                   rng.uniform(y0 + height * 0.1, y0 + height * 0.9, towns)])
+        sizes = rng.pareto(1.2, towns) + 1
+        town = rng.choice(towns, size=cells_per_kreis * 2, p=sizes / sizes.sum())
+        spread = 300 + 1_500 * np.sqrt(sizes[town])
+        xy = centres[town] + rng.normal(0, 1, (len(town), 2)) * spread[:, None]
+        xy[:, 0] = np.clip(xy[:, 0], x0, x0 + width - 1)
+        xy[:, 1] = np.clip(xy[:, 1], y0, y0 + height - 1)
+        cells = np.unique(np.floor(xy / 100).astype(np.int64), axis=0)[:cells_per_kreis]
+        x_mp = cells[:, 0] * 100 + 50
+        y_mp = cells[:, 1] * 100 + 50
+        # population density falls off with the distance to the nearest town centre
+        distance = np.min(np.hypot(x_mp[:, None] - centres[:, 0], y_mp[:, None] - centres[:, 1]), axis=1)
+        expected = 3 + 60 * np.exp(-distance / 2_000)
+        frames.append(pd.DataFrame({
+            'x_mp': x_mp,
+            'y_mp': y_mp,
+            'Einwohner': rng.poisson(expected) + 1,
+            'ags': [f"{kreis}{rng.integers(0, 1000):03d}" for _ in range(len(x_mp))],
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def write_census(cells: pd.DataFrame, datasets: str, rng: np.random.Generator) -> None:
+    """
+    Writes Zensus_Bevoelkerung_100m-Gitter.csv. A few cells have the value -1,
+    which marks cells without residents in the census.
+    """
+    einwohner = cells['Einwohner'].values.copy()
+    einwohner[rng.random(len(einwohner)) < 0.02] = -1
+    pd.DataFrame({'Gitter_ID_100m': grid_id(cells['x_mp'].values, cells['y_mp'].values),
+                  'x_mp_100m': cells['x_mp'],
+                  'y_mp_100m': cells['y_mp'],
+                  'Einwohner': einwohner}
+                 ).to_csv(os.path.join(datasets, 'Zensus_Bevoelkerung_100m-Gitter.csv'), sep=';', index=False)
+
+
+def write_geogitter(cells: pd.DataFrame, datasets: str, rng: np.random.Generator) -> None:
+    """
+    Writes the 60 files of the INSPIRE grid with the AGS of every cell.
+    Next to the populated cells the grid contains unpopulated cells.
+    """
+    empty = cells.sample(frac=0.3, random_state=int(rng.integers(1 << 31))).copy()
+    empty['x_mp'] += 100 * rng.integers(-20, 21, len(empty))
+    empty['y_mp'] += 100 * rng.integers(-20, 21, len(empty))
+    grid = pd.concat([cells, empty]).drop_duplicates(['x_mp', 'y_mp'])
+    grid = pd.DataFrame({
+        'id': grid_id(grid['x_mp'].values, grid['y_mp'].values),
+        'x_sw': grid['x_mp'] - 50,
+        'y_sw': grid['y_mp'] - 50,
+        'x_mp': grid['x_mp'],
+        'y_mp': grid['y_mp'],
+        'f_staat': 1, 'f_land': 1, 'f_wasser': 0,
+        'p_staat': 100.0, 'p_land': 100.0, 'p_wasser': 0.0,
+        'ags': grid['ags'],
+    })
+    path = os.path.join(datasets, 'DE_Grid_ETRS89-LAEA_100m', 'geogitter')
+    os.makedirs(path, exist_ok=True)
+    for i, part in enumerate(np.array_split(grid, GEOGITTER_FILES)):
+        part.to_csv(os.path.join(path, f'DE_Grid_ETRS89-LAEA_100m_{i:02d}.csv'),
+                    sep=';', header=False, index=False)
+
+
+def write_excel(df: pd.DataFrame, sheet_name: str, skiprows: int, file_name: str) -> None:
+    """
+    Writes a sheet with `skiprows` leading rows of notes like the official spreadsheets.
+    The file is written in the xlsx format, pandas detects the format from the content.
+    """
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
+        pd.DataFrame({'': ['Synthetic dataset']}).to_excel(
+            writer, sheet_name=sheet_name, index=False, header=False)
+        df.to_excel(writer, sheet_name=sheet_name, index=False, header=df.columns[0] != 0,
+                    startrow=skiprows)
+    with open(file_name, 'wb') as f:
+        f.write(buffer.getvalue())
+
+
+def write_fz27(cells: pd.DataFrame, datasets: str, rng: np.random.Generator) -> None:
+    """
+    Writes fz27_202207.xlsx with the vehicle register per Kreis.
+    """
+    population = cells.groupby(cells['ags'].str[:5])['Einwohner'].sum()
+    cars = np.round(population.values * rng.uniform(0.5, 0.65, len(population)))
+    bev = np.round(cars * rng.uniform(0.005, 0.03, len(population)))
+    phev = np.round(cars * rng.uniform(0.005, 0.02, len(population)))
+    hybrid = np.round(cars * rng.uniform(0.02, 0.06, len(population)))
+    gas = np.round(cars * rng.uniform(0.002, 0.01, len(population)))
+    alternative = bev + phev + hybrid + gas
+
+    def number(values):
+        return [f"{value:.1f}".replace('.', ',') for value in values]
+
+    rows = pd.DataFrame({
+        0: '',
+        1: [f"Land {kreis[:2]}" for kreis in population.index],
+        2: population.index,
+        3: [f"KREIS {kreis}" for kreis in population.index],
+        4: number(cars),
+        5: number(alternative),
+        6: number(100 * alternative / cars),
+        7: number(bev + phev),
+        8: number(100 * (bev + phev) / cars),
+        9: number(bev),
+        10: number(phev),
+        11: number(hybrid),
+        12: number(hybrid * 0.8),
+        13: number(hybrid * 0.2),
+        14: number(gas),
+    })
+    footer = pd.DataFrame([[''] + ['0'] * 14] * 5)
+    write_excel(pd.concat([rows, footer], ignore_index=True), 'FZ 27.15', 12,
+                os.path.join(datasets, 'fz27_202207.xlsx'))
+
+
+def write_municipalities(cells: pd.DataFrame, datasets: str) -> None:
+    """
+    Writes 1A_EinwohnerzahlGeschlecht.xls with the population per Kreis in thousands.
+    """
+    population = cells.groupby(cells['ags'].str[:5])['Einwohner'].sum()
+    df = pd.DataFrame({'AGS': population.index,
+                       'Name': [f"Kreis {kreis}" for kreis in population.index],
+                       'BFS_EWZ': population.values / 1000})
+    # the sheet contains the Länder as well, they are dropped by their two digit key
+    laender = pd.DataFrame({'AGS': sorted(population.index.str[:2].unique()),
+                            'Name': 'Land', 'BFS_EWZ': 0.0})
+    write_excel(pd.concat([laender, df], ignore_index=True), 'Tabelle_1A', 12,
+                os.path.join(datasets, '1A_EinwohnerzahlGeschlecht.xls'))
+
+
+def to_lonlat(x: np.ndarray, y: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    transformer = Transformer.from_crs("EPSG:3035", "EPSG:4326", always_xy=True)
+    return transformer.transform(x, y)
+
+
+def write_parking(cells: pd.DataFrame, datasets: str, rng: np.random.Generator,
+                  cells_per_parking: int) -> None:
+    """
+    Writes export.geojson with parking spaces as points and polygons
+    next to populated cells. Only some of them are publicly accessible.
+    """
+    sample = cells.sample(n=max(len(cells) // cells_per_parking, 1),
+                          random_state=int(rng.integers(1 << 31)))
+    x = sample['x_mp'].values + rng.uniform(-50, 50, len(sample))
+    y = sample['y_mp'].values + rng.uniform(-50, 50, len(sample))
+    lon, lat = to_lonlat(x, y)
+    access = rng.choice(['yes', 'customers', 'electric_vehicle', 'private', 'no', None],
+                        p=[0.5, 0.2, 0.02, 0.13, 0.05, 0.1], size=len(sample))
+    with open(os.path.join(datasets, 'export.geojson'), 'w', encoding='utf-8') as f:
+        f.write('{"type": "FeatureCollection", "generator": "synthetic", "features": [\n')
+        for i in range(len(sample)):
+            properties = {'@id': f"way/{i}", 'amenity': 'parking'}
+            if access[i] is not None:
+                properties['access'] = access[i]
+            if i % 2:
+                d = 0.0003
+                geometry = {'type': 'Polygon', 'coordinates': [[
+                    [lon[i], lat[i]], [lon[i] + d, lat[i]], [lon[i] + d, lat[i] + d],
+                    [lon[i], lat[i] + d], [lon[i], lat[i]]]]}
+            else:
+                geometry = {'type': 'Point', 'coordinates': [lon[i], lat[i]]}
+            feature = {'type': 'Feature', 'id': f"way/{i}", 'properties': properties, 'geometry': geometry}
+            f.write(('' if i == 0 else ',\n') + json.dumps(feature))
+        f.write('\n]}\n')
+
+
+def write_charging_register(cells: pd.DataFrame, datasets: str, rng: np.random.Generator,
+                            cells_per_station: int) -> None:
+    """
+    Writes Ladesaeulenregister.csv with the ten lines of notes in front of the header
+    and coordinates with decimal commas.
+    """
+    sample = cells.sample(n=max(len(cells) // cells_per_station, 1),
+                          random_state=int(rng.integers(1 << 31)))
+    lon, lat = to_lonlat(sample['x_mp'].values + rng.uniform(-50, 50, len(sample)),
+                         sample['y_mp'].values + rng.uniform(-50, 50, len(sample)))
+    with open(os.path.join(datasets, 'Ladesaeulenregister.csv'), 'w', encoding='latin_1') as f:
+        f.write('Ladesäulenregister (synthetisch)\n' + ';\n' * 9)
+        f.write('Betreiber;Straße;Postleitzahl;Ort;Breitengrad;Längengrad;Anzahl Ladepunkte\n')
+        for i in range(len(sample)):
+            f.write(f"Betreiber {i};Straße {i};00000;Ort;"
+                    f"{lat[i]:.6f}".replace('.', ',') + ';' +
+                    f"{lon[i]:.6f}".replace('.', ',') + ';2\n')
+
+
+def generate_datasets(root: str, kreise: int = 1, cells_per_kreis: int = 7_500, seed: int = 0,
+                      cells_per_parking: int = 15, cells_per_station: int = 60) -> pd.DataFrame:
+    """
+    Generates all input datasets under <root>/datasets.
+
+    Args:
+        root (str): The directory the pipeline will be run in
+        kreise (int, optional): The number of Kreise, 1 up to about 400 for Germany. Defaults to 1.
+        cells_per_kreis (int, optional): The populated 100m cells per Kreis. Defaults to 7500.
+        seed (int, optional): The seed of the random generator. Defaults to 0.
+        cells_per_parking (int, optional): Populated cells per parking space. Defaults to 15.
+        cells_per_station (int, optional): Populated cells per existing charging station. Defaults to 60.
+
+    Returns:
+        pd.DataFrame: The generated cells
+    """
+    rng = np.random.default_rng(seed)
+    datasets = os.path.join(root, 'datasets')
+    os.makedirs(os.path.join(datasets, 'generated'), exist_ok=True)
+    cells = generate_cells(kreise, cells_per_kreis, rng)
+    write_census(cells, datasets, rng)
+    write_geogitter(cells, datasets, rng)
+    write_fz27(cells, datasets, rng)
+    write_municipalities(cells, datasets)
+    write_parking(cells, datasets, rng, cells_per_parking)
+    write_charging_register(cells, datasets, rng, cells_per_station)
+    return cells
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate synthetic input datasets.')
+    parser.add_argument('root', help='the directory to write the datasets folder to')
+    parser.add_argument('--kreise', type=int, default=1)
+    parser.add_argument('--cells-per-kreis', type=int, default=7_500)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    generate_datasets(args.root, args.kreise, args.cells_per_kreis, args.seed)
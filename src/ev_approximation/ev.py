@@ -2,8 +2,8 @@ import os
 import sys
 
 import pandas as pd
-from halo import Halo
 
+from helper import handoff, telemetry
 from validation import validation
 
 from .ev_cache import Cache
@@ -47,7 +47,8 @@ def generate_ev_estimates_for_census_data() -> None:
             key, cache) for key in municipality_keys}
 
         df['EV'] = df['Einwohner'] * df['ags'].map(ev_percent_map)
-        df.to_parquet('./datasets/generated/cleared_ev.parquet')
+        telemetry.rows(len(df), len(df))
+        handoff.put('./datasets/generated/cleared_ev.parquet', df, pd.DataFrame.to_parquet)
     except FileNotFoundError as e:
         print(
             f"The File population_per_municipality.parquet or fz_27_15.parquet was not found: {e}")
@@ -116,8 +117,6 @@ def run_ev_calculation() -> None:
     """
     Method to run all necessary steps for the ev calculation.
     """
-    spinner = Halo(text="Calculating EV's For Each Grid")
-    spinner.start()
-    if not validation.check_generated("cleared_ev.parquet"):
-        generate_ev_estimates_for_census_data()
-    spinner.succeed()
+    with telemetry.step("Calculating EV's For Each Grid"):
+        if not validation.check_generated("cleared_ev.parquet"):
+            generate_ev_estimates_for_census_data()
@@ -0,0 +1,244 @@
+import json
+import os
+import sys
+from functools import partial
+
+import numpy as np
+import pandas as pd
+from pyproj import Transformer
+from scipy.spatial import cKDTree
+
+from helper import executor, handoff, telemetry
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+
+"""
+This module measures how well the EVs are covered by charging stations.
+
+For every cell of cleared_ev.parquet the distance to the nearest planned charging station
+(charging_points.parquet) and to the nearest existing one (Ladesäulenregister) is queried from
+KD-trees in EPSG:3035. The cells are queried in chunks with helper.executor, by default in
+parallel threads, because the tree query releases the GIL. The distances are weighted with the EVs of the cells and summarised
+per AGS and for the whole run, so alternative runs can be compared by their summary.
+
+Distances are reported for the existing, the planned and the combined charging stations.
+"""
+
+COVERAGE_FILE = './datasets/generated/coverage_ags.parquet'
+SUMMARY_FILE = './datasets/generated/coverage.json'
+# cells queried per chunk
+CHUNK_SIZE = 250_000
+# percentiles of the EV weighted distance
+QUANTILES = [50, 75, 90, 95, 99]
+# distance in meters within which an EV counts as covered
+COVERAGE_RADIUS = 1_000
+SOURCES = ['existing', 'planned', 'combined']
+
+
+def load_cells(grid_file: str = './datasets/generated/cleared_ev.parquet') -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Reads the cells of the EV grid.
+
+    Returns:
+        tuple: (n, 2) metric coordinates, the EVs and the AGS of the cells
+    """
+    df = handoff.read_parquet(grid_file, columns=['ags', 'x_mp_100m', 'y_mp_100m', 'EV'])
+    # after the transformation to EPSG:4326 x holds the latitude and y the longitude
+    xy = to_metric(df['y_mp_100m'].values, df['x_mp_100m'].values)
+    return xy, df['EV'].values.astype(np.float64), df['ags'].astype(str).values
+
+
+def load_existing_chargers() -> np.ndarray:
+    """
+    Reads the existing charging stations of the charging station register.
+
+    Returns:
+        np.ndarray: (n, 2) metric coordinates of the charging stations
+    """
+    from parkingspotfilter import parking
+    parking.ensure_charging_stations()
+    existing = pd.read_parquet(parking.STATIONS_FILE)
+    return to_metric(existing['Longitude'].values, existing['Latitude'].values)
+
+
+def load_chargers() -> dict:
+    """
+    Reads the planned and the existing charging stations.
+
+    Returns:
+        dict: The (n, 2) metric coordinates of the 'planned' and the 'existing' charging stations
+    """
+    planned = handoff.read_parquet('./datasets/generated/charging_points.parquet', columns=['lon', 'lat'])
+    return {'planned': to_metric(planned['lon'].values, planned['lat'].values),
+            'existing': load_existing_chargers()}
+
+
+def to_metric(lon: np.ndarray, lat: np.ndarray) -> np.ndarray:
+    transformer = Transformer.from_crs("EPSG:4326", "EPSG:3035", always_xy=True)
+    x, y = transformer.transform(lon, lat)
+    return np.column_stack([x, y]).reshape(-1, 2)
+
+
+def query_nearest(tree: cKDTree, points: np.ndarray) -> np.ndarray:
+    """
+    Returns the distance of the points to their nearest neighbour in the tree.
+    """
+    distance, _ = tree.query(points)
+    return distance
+
+
+def nearest_distance(points: np.ndarray, chargers: np.ndarray, chunk_size: int | None = None,
+                     workers: int | None = None) -> np.ndarray:
+    """
+    Queries the distance of every point to the nearest charging station.
+    The points are split into chunks that are queried in parallel.
+
+    Args:
+        points (np.ndarray): (n, 2) metric coordinates of the cells
+        chargers (np.ndarray): (m, 2) metric coordinates of the charging stations
+        chunk_size (int, optional): The number of points per chunk.
+                                    Defaults to POWERUP_COVERAGE_CHUNK_SIZE or CHUNK_SIZE.
+        workers (int, optional): The number of workers.
+                                 Defaults to POWERUP_WORKERS or the number of cores, see helper.executor.
+
+    Returns:
+        np.ndarray: The distances in meters, infinite if there are no charging stations
+    """
+    if len(points) == 0 or len(chargers) == 0:
+        return np.full(len(points), np.inf)
+    query_executor = executor.get_executor('coverage', workers, chunk_size,
+                                           default_kind='threads', default_chunk_size=CHUNK_SIZE)
+    chunks = [points[start:stop] for start, stop in query_executor.chunks(len(points))]
+    return np.concatenate(query_executor.map(partial(query_nearest, cKDTree(chargers)), chunks))
+
+
+def spatial_order(xy: np.ndarray, cell_size: float = 1_000) -> np.ndarray:
+    """
+    Returns an order of the points in which neighbouring points follow each other,
+    column by column of `cell_size` wide stripes. Nearest neighbour queries in this order
+    visit the same nodes of the tree one after another and are about twice as fast.
+    """
+    if len(xy) == 0:
+        return np.arange(0)
+    column = np.floor((xy[:, 0] - xy[:, 0].min()) / cell_size).astype(np.int64)
+    row = np.floor((xy[:, 1] - xy[:, 1].min()) / cell_size).astype(np.int64)
+    return np.argsort(column * (row.max() + 1) + row)
+
+
+def grouped_statistics(codes: np.ndarray, distance: np.ndarray, weights: np.ndarray,
+                       radius: float = COVERAGE_RADIUS, quantiles: list[int] = QUANTILES) -> pd.DataFrame:
+    """
+    Computes the weighted distance statistics of all groups at once.
+    The cells are sorted by group and distance with one sort over `group + scaled distance`,
+    so the weighted percentile of every group is found with one binary search over
+    `group + cumulative share of the group`, which increases monotonically over all groups.
+
+    Args:
+        codes (np.ndarray): The group of every cell, integers from 0 to the number of groups - 1
+        distance (np.ndarray): The distance of every cell to the nearest charging station
+        weights (np.ndarray): The EVs of every cell
+        radius (float, optional): The distance within which an EV is covered. Defaults to COVERAGE_RADIUS.
+        quantiles (list[int], optional): The percentiles to compute. Defaults to QUANTILES.
+
+    Returns:
+        pd.DataFrame: One row per group with the columns cells, ev, mean, covered and p<quantile>
+    """
+    groups = int(codes.max()) + 1 if len(codes) else 0
+    finite = np.isfinite(distance)
+    top = distance[finite].max() if finite.any() else 0.0
+    # the scaled distance lies in [0, 1), so the groups do not mix
+    order = np.argsort(codes + np.where(finite, distance, top) / (top + 1))
+    codes, distance, weights = codes[order], distance[order], weights[order]
+    cells = np.bincount(codes, minlength=groups)
+    totals = np.bincount(codes, weights=weights, minlength=groups)
+    before = np.concatenate([[0.0], np.cumsum(totals)[:-1]])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        share = np.where(totals[codes] > 0, (np.cumsum(weights) - before[codes]) / totals[codes], 1.0)
+        # infinite distances only carry weight if there are no charging stations at all
+        weighted = np.where(weights > 0, weights * distance, 0.0)
+        result = pd.DataFrame({'cells': cells, 'ev': totals,
+                               'mean': np.bincount(codes, weights=weighted, minlength=groups) / totals,
+                               'covered': np.bincount(codes, weights=weights * (distance <= radius),
+                                                      minlength=groups) / totals})
+    key = codes + np.minimum(share, 1.0)
+    last = np.cumsum(cells) - 1
+    for q in quantiles:
+        idx = np.minimum(np.searchsorted(key, np.arange(groups) + q / 100), last)
+        result[f'p{q}'] = distance[idx] if len(distance) else np.empty(0)
+    return result
+
+
+def weighted_statistics(distance: np.ndarray, weights: np.ndarray, radius: float = COVERAGE_RADIUS,
+                        quantiles: list[int] = QUANTILES) -> dict:
+    """
+    Computes the weighted distance statistics of all cells.
+    Infinite values (no charging station at all) are returned as None.
+
+    Returns:
+        dict: The cells, ev, mean, covered and p<quantile> values
+    """
+    if len(distance) == 0:
+        return {'cells': 0, 'ev': 0.0, 'mean': None, 'covered': None, **{f'p{q}': None for q in quantiles}}
+    row = grouped_statistics(np.zeros(len(distance), dtype=np.int64), distance, weights,
+                             radius, quantiles).iloc[0]
+    result = {key: (float(value) if np.isfinite(value) else None) for key, value in row.items()}
+    result['cells'] = int(row['cells'])
+    return result
+
+
+def compute_coverage(xy: np.ndarray, ev: np.ndarray, ags: np.ndarray, chargers: dict,
+                     radius: float = COVERAGE_RADIUS, workers: int | None = None) -> tuple[pd.DataFrame, dict]:
+    """
+    Computes the coverage of the cells by the existing, planned and combined charging stations.
+
+    Args:
+        xy (np.ndarray): (n, 2) metric coordinates of the cells
+        ev (np.ndarray): The EVs of the cells
+        ags (np.ndarray): The AGS of the cells
+        chargers (dict): The metric coordinates of the 'planned' and 'existing' charging stations
+        radius (float, optional): The distance within which an EV is covered. Defaults to COVERAGE_RADIUS.
+        workers (int, optional): The number of workers. Defaults to POWERUP_WORKERS or the number of cores.
+
+    Returns:
+        tuple[pd.DataFrame, dict]: The statistics per source and AGS in long format
+                                   and the statistics per source of all cells
+    """
+    order = spatial_order(xy)
+    xy, ev, ags = xy[order], ev[order], ags[order]
+    distances = {source: nearest_distance(xy, chargers[source], workers=workers)
+                 for source in ['existing', 'planned']}
+    distances['combined'] = np.minimum(distances['existing'], distances['planned'])
+    codes, uniques = pd.factorize(ags, sort=True)
+    tables, summary = [], {}
+    for source in SOURCES:
+        table = grouped_statistics(codes, distances[source], ev, radius)
+        table.insert(0, 'ags', uniques)
+        table.insert(0, 'source', source)
+        tables.append(table)
+        summary[source] = weighted_statistics(distances[source], ev, radius)
+    return pd.concat(tables, ignore_index=True), summary
+
+
+def run_coverage(radius: float = COVERAGE_RADIUS) -> dict:
+    """
+    Measures the coverage of the current run and saves the statistics per AGS
+    to COVERAGE_FILE and the statistics of the whole run to SUMMARY_FILE.
+
+    Args:
+        radius (float, optional): The distance within which an EV is covered. Defaults to COVERAGE_RADIUS.
+
+    Returns:
+        dict: The statistics per source of all cells
+    """
+    with telemetry.step("Reading Cells And Charging Stations"):
+        xy, ev, ags = load_cells()
+        chargers = load_chargers()
+    with telemetry.step("Measuring Coverage", rows_in=len(xy)) as step:
+        table, summary = compute_coverage(xy, ev, ags, chargers, radius)
+        step.rows_out = len(table)
+    table.to_parquet(COVERAGE_FILE, index=False)
+    with open(SUMMARY_FILE, 'w') as f:
+        json.dump({'radius': radius, **summary}, f, indent=2)
+    return summary
+
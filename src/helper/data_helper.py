@@ -1,11 +1,11 @@
 import os
 import sys
+from functools import partial
 
-import dask.dataframe as dd
 import pandas as pd
-from halo import Halo
 from pyproj import Transformer
 
+from helper import executor, scope, telemetry
 from validation import validation
 
 sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
@@ -22,10 +22,24 @@ def create_parquet_without_rows_with_no_residents() -> None:
     """
     Method drops every row in the census dataset without residents.
     Result is saved as a parquet file for efficient future handling.
+    In a region run the file is read in chunks and only the cells of the
+    region grid in combined_grid.parquet are kept.
     """
-    df = pd.read_csv(
-        "./datasets/Zensus_Bevoelkerung_100m-Gitter.csv", sep=";")
+    region = scope.current()
+    if region is None:
+        df = pd.read_csv(
+            "./datasets/Zensus_Bevoelkerung_100m-Gitter.csv", sep=";")
+        rows_in = len(df)
+    else:
+        ids = pd.read_parquet('./datasets/generated/combined_grid.parquet', columns=['id'])['id']
+        rows_in = 0
+        chunks = []
+        for chunk in pd.read_csv("./datasets/Zensus_Bevoelkerung_100m-Gitter.csv", sep=";", chunksize=1_000_000):
+            rows_in += len(chunk)
+            chunks.append(chunk[chunk['Gitter_ID_100m'].isin(ids)])
+        df = pd.concat(chunks, ignore_index=True)
     df = df[df.Einwohner != -1]
+    telemetry.rows(rows_in, len(df))
     df.to_parquet('./datasets/generated/100m_cleared.parquet', index=False)
 
 
@@ -41,6 +55,7 @@ def create_parquet_without_rows_with_no_residents() -> None:
 #     Learn more about dask here:
 #     https://docs.dask.org/en/stable/
 #     """
+#     import dask.dataframe as dd
 #     df1 = dd.read_parquet('./datasets/generated/combined_grid.parquet')
 #     df2 = dd.read_parquet(
 #         "./datasets/generated/100m_cleared_4326.parquet")
@@ -66,10 +81,27 @@ def join_grid_with_census() -> None:
     merged_df = pd.merge(df_A, df_B, on='id', how='inner')
 
     merged_df = merged_df[merged_df.Einwohner != -1]
+    telemetry.rows(len(df_B), len(merged_df))
     merged_df.to_parquet(
         './datasets/generated/merged_100m_cleared.parquet', index=False)
 
 
+def correct_grid_ags(ags: pd.Series) -> pd.Series:
+    """
+    Corrects the outdated AGS of the grid, so they match the AGS of the f27 dataset.
+    A region run applies it to the raw grid before its cells are filtered by AGS.
+
+    Args:
+        ags (pd.Series): The AGS of the cells
+
+    Returns:
+        pd.Series: The corrected AGS
+    """
+    # Fix AGS for Trier-Saarburg
+    ags = ags.where(~ags.str.startswith('079', na=False), '072' + ags.str[3:])
+    return ags.where(~ags.str.startswith('16056000', na=False), '16063105' + ags.str[3:])
+
+
 def cleanup_grid_census() -> None:
     """
     Some values in the census data of 2011 are incorrect. 
@@ -80,11 +112,7 @@ def cleanup_grid_census() -> None:
         './datasets/generated/merged_100m_cleared.parquet')
     # Remove Trier, City since it is not in the f27 dataset :(
     df = df[~df['ags'].str.startswith('07211')]
-    # Fix AGS for Trier-Saarburg
-    df['ags'] = df['ags'].apply(
-        lambda x: '072' + x[3:] if x.startswith('079') else x)
-    df['ags'] = df['ags'].apply(
-        lambda x: '16063105' + x[3:] if x.startswith('16056000') else x)
+    df['ags'] = correct_grid_ags(df['ags'])
     df.to_parquet(
         './datasets/generated/merged_100m_cleared.parquet', index=False)
 
@@ -213,24 +241,42 @@ def transform_municipality_census_to_parquet() -> None:
         './datasets/generated/population_per_municipality.parquet', index=False)
 
 
+def read_grid_file(file_path: str, region: scope.Region | None = None) -> tuple[int, pd.DataFrame]:
+    """
+    Reads one CSV file of the grid. In a region run the AGS are corrected
+    and only the candidate cells of the region are kept.
+
+    Returns:
+        tuple[int, pd.DataFrame]: The number of rows in the file and the kept rows
+    """
+    df = pd.read_csv(file_path,
+                     sep=';',
+                     dtype=str,
+                     header=None)
+    rows_in = len(df)
+    if region is not None:
+        # the AGS prefixes of the region are given in the corrected AGS
+        df[11] = correct_grid_ags(df[11])
+        df = df[region.candidate_mask(df[3], df[4], df[11])]
+    return rows_in, df
+
+
 def concat_csv_to_parquet() -> None:
     """
     For faster performance and better handling, 
     this method merges the csv files of the census data in a 100x100m grid into one large parquet file. 
-    Only the columns id and ags are kept. This File is then saved
+    The files are read in parallel threads with helper.executor.
+    Only the columns id and ags are kept. This File is then saved.
+    In a region run only the cells of the region and its halo are kept.
     """
     csv_folder_path = "./datasets/DE_Grid_ETRS89-LAEA_100m/geogitter"
-    dataframes = []
-
-    for filename in os.listdir(csv_folder_path):
-        if filename.endswith('.csv'):
-            file_path = os.path.join(csv_folder_path, filename)
-            df = pd.read_csv(file_path,
-                             sep=';',
-                             dtype=str,
-                             header=None)
-            dataframes.append(df)
-    df = pd.concat(dataframes, ignore_index=True)
+    region = scope.current()
+    file_paths = [os.path.join(csv_folder_path, filename)
+                  for filename in sorted(os.listdir(csv_folder_path)) if filename.endswith('.csv')]
+    results = executor.get_executor('data_helper', default_kind='threads').map(
+        partial(read_grid_file, region=region), file_paths)
+    rows_in = sum(rows for rows, _ in results)
+    df = pd.concat([df for _, df in results], ignore_index=True)
 
     df.columns = ["id",
                   "x_sw",
@@ -244,6 +290,9 @@ def concat_csv_to_parquet() -> None:
                   "p_land",
                   "p_wasser",
                   "ags"]
+    if region is not None:
+        df = df[region.cell_mask(df['x_mp'], df['y_mp'], df['ags'])]
+    telemetry.rows(rows_in, len(df))
 
     df.drop(["x_sw",
              "y_sw",
@@ -259,43 +308,63 @@ def concat_csv_to_parquet() -> None:
     df.to_parquet('./datasets/generated/combined_grid.parquet', index=False)
 
 
+def cut_region_from_national_census(region: scope.Region, national_file: str) -> None:
+    """
+    Reads the cells of a region and its halo from the merged census data of the national run.
+    Only the Länder of the region are read from the parquet file.
+
+    Args:
+        region (scope.Region): The region of the run
+        national_file (str): The merged_100m_cleared.parquet file of the national run
+    """
+    df = pd.read_parquet(national_file, filters=region.parquet_filters())
+    transformer = Transformer.from_crs("EPSG:4326", "EPSG:3035", always_xy=True)
+    # after the transformation to EPSG:4326 x holds the latitude and y the longitude
+    x, y = transformer.transform(df['y_mp_100m'].values, df['x_mp_100m'].values)
+    rows_in = len(df)
+    df = df[region.cell_mask(x, y, df['ags'])]
+    telemetry.rows(rows_in, len(df))
+    df.to_parquet('./datasets/generated/merged_100m_cleared.parquet', index=False)
+
+
 def run_data_preparation() -> None:
     """
     This Method runs all data preparation steps.
-    It uses the Halo library to display a loading spinner 
-    during each step of the data preparation process. The spinner indicates 
-    which dataset is currently being processed, and whether the step was successful.
+    Every step is shown with a spinner and recorded by the telemetry,
+    the spinner indicates which dataset is currently being processed, and whether the step was successful.
+    In a region run the region is cut out of the national census data, if the national run is done.
+    The grid is prepared before the census data, so a region run only reads the census cells of its grid.
+    The intermediate files are only created if the merged census data does not exist yet.
     """
-
-    spinner = Halo("Loading")
-    spinner.start(text="filtering Census Dataset")
-    if not validation.check_generated('100m_cleared.parquet'):
-        create_parquet_without_rows_with_no_residents()
-    spinner.succeed()
-
-    spinner.start(text="Transforming To EPSG:4326")
-    if not validation.check_generated('100m_cleared_4326.parquet'):
-        create_parquet_with_4326_crs()
-    spinner.succeed()
-
-    spinner.start(text="Preparing Vehicle Registration Dataset")
-    if not validation.check_generated('fz_27_15.parquet'):
-        transform_f27_to_parquet()
-    spinner.succeed()
-
-    spinner.start(text="Transforming 100x100m Grid CSV To Parquet Files")
-    if not validation.check_generated('combined_grid.parquet'):
-        concat_csv_to_parquet()
-    spinner.succeed()
-    spinner.start(
-        text="Merging Census Data (This Step May Take A While: > 20 min on Apple M1)")
-    if not validation.check_generated('merged_100m_cleared.parquet'):
-        join_grid_with_census()
-    spinner.succeed()
-    spinner.start(text="Correcting Values In Census Data")
-    cleanup_grid_census()
-    spinner.succeed()
-    spinner.start(text="Preparing Municipality Population Dataset")
-    if not validation.check_generated('population_per_municipality.parquet'):
-        transform_municipality_census_to_parquet()
-    spinner.succeed()
+    region = scope.current()
+    if region is not None and not validation.check_generated('merged_100m_cleared.parquet'):
+        national_file = region.national_file('merged_100m_cleared.parquet')
+        if national_file is not None:
+            with telemetry.step("Reading The Region From The National Census Data"):
+                cut_region_from_national_census(region, national_file)
+    merged = validation.check_generated('merged_100m_cleared.parquet')
+
+    with telemetry.step("Transforming 100x100m Grid CSV To Parquet Files"):
+        if not merged and not validation.check_generated('combined_grid.parquet'):
+            concat_csv_to_parquet()
+
+    with telemetry.step("filtering Census Dataset"):
+        if not merged and not validation.check_generated('100m_cleared.parquet'):
+            create_parquet_without_rows_with_no_residents()
+
+    with telemetry.step("Transforming To EPSG:4326"):
+        if not merged and not validation.check_generated('100m_cleared_4326.parquet'):
+            create_parquet_with_4326_crs()
+
+    with telemetry.step("Preparing Vehicle Registration Dataset"):
+        if not validation.check_generated('fz_27_15.parquet'):
+            transform_f27_to_parquet()
+
+    with telemetry.step("Merging Census Data (This Step May Take A While: > 20 min on Apple M1)"):
+        if not validation.check_generated('merged_100m_cleared.parquet'):
+            join_grid_with_census()
+    with telemetry.step("Correcting Values In Census Data"):
+        cleanup_grid_census()
+    with telemetry.step("Preparing Municipality Population Dataset"):
+        if not validation.check_generated('population_per_municipality.parquet'):
+            transform_municipality_census_to_parquet()
@@ -0,0 +1,169 @@
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Iterable
+
+from helper import telemetry
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+
+"""
+This module runs the chunked and partitioned work of the stages.
+
+A stage gets an Executor by name and submits its tasks with `map`. How the tasks run is configured
+by environment variables, so the concurrency can be tuned per machine without code changes.
+A variable for a name (e.g. POWERUP_COVERAGE_WORKERS) wins over the general one (POWERUP_WORKERS),
+arguments passed by the caller win over both:
+
+    POWERUP_EXECUTOR              serial, threads, processes or dask
+    POWERUP_WORKERS               number of threads or processes, defaults to the number of cores
+    POWERUP_<NAME>_CHUNK_SIZE     number of items per task for work that is split into chunks,
+                                  only per name, because the items differ between the stages
+
+Threads suit work that releases the GIL (KD-tree queries, reading files), processes suit
+Python heavy work. With dask the tasks run on the active dask.distributed client, if one was
+started (e.g. with a LocalCluster), and on the local process scheduler of dask otherwise.
+The duration of every task is recorded by the telemetry and written next to the trace.
+"""
+
+KINDS = ['serial', 'threads', 'processes', 'dask']
+
+
+def setting(name: str, key: str, general: bool = True) -> str | None:
+    """
+    Returns the environment variable POWERUP_<NAME>_<KEY>, or POWERUP_<KEY> if it is not set and `general` is True.
+    """
+    value = os.environ.get(f'POWERUP_{name.upper()}_{key}')
+    if value or not general:
+        return value
+    return os.environ.get(f'POWERUP_{key}')
+
+
+class Timed:
+    """
+    Wraps a task function, so the duration and the worker of every task are returned with its result.
+    It is picklable if the function is, so it can be sent to worker processes.
+    """
+
+    def __init__(self, function: Callable) -> None:
+        self.function = function
+
+    def __call__(self, item) -> tuple:
+        start = time.perf_counter()
+        result = self.function(item)
+        return result, time.perf_counter() - start, f'{os.getpid()}/{threading.get_ident()}'
+
+
+class Executor:
+    """
+    Runs the tasks of a stage serially, in a thread pool, in a process pool or with dask.
+
+    Attributes
+    ----------
+    name : str
+        The name of the work, used for the environment variables and the telemetry.
+    kind : str
+        One of KINDS.
+    workers : int
+        The number of threads or processes.
+    chunk_size : int | None
+        The number of items per task for work that is split into chunks.
+    """
+
+    def __init__(self, name: str, kind: str, workers: int, chunk_size: int | None = None) -> None:
+        if kind not in KINDS:
+            raise ValueError(f"The executor has to be one of {', '.join(KINDS)}, not {kind}")
+        if workers < 1 or (chunk_size is not None and chunk_size < 1):
+            raise ValueError("The number of workers and the chunk size have to be at least 1")
+        self.name = name
+        # a single worker runs the tasks in this process
+        self.kind = 'serial' if workers == 1 else kind
+        self.workers = workers
+        self.chunk_size = chunk_size
+
+    def chunks(self, length: int) -> list[tuple[int, int]]:
+        """
+        Splits `length` items into chunks of `chunk_size` items.
+
+        Returns:
+            list[tuple[int, int]]: The start and stop of every chunk
+        """
+        size = self.chunk_size or max(length, 1)
+        return [(start, min(start + size, length)) for start in range(0, length, size)]
+
+    def map(self, function: Callable, items: Iterable) -> list:
+        """
+        Runs `function` for every item and returns the results in the order of the items.
+        Tasks only run in parallel if there is more than one, so small inputs do not pay
+        for starting a pool.
+
+        Args:
+            function (Callable): The task, it has to be picklable for processes and dask
+            items (Iterable): The arguments of the tasks
+
+        Returns:
+            list: The results of the tasks
+        """
+        items = list(items)
+        timed = Timed(function)
+        kind = self.kind if len(items) > 1 else 'serial'
+        progress = telemetry.progress(len(items))
+        if kind == 'serial':
+            results = []
+            for item in items:
+                results.append(timed(item))
+                progress.advance()
+        elif kind in ('threads', 'processes'):
+            pool_type = ThreadPoolExecutor if kind == 'threads' else ProcessPoolExecutor
+            results = []
+            with pool_type(max_workers=self.workers) as pool:
+                # the results arrive in the order of the items, the progress follows the first unfinished task
+                for result in pool.map(timed, items):
+                    results.append(result)
+                    progress.advance()
+        else:
+            results = self.__map_dask(timed, items)
+            progress.advance(len(results))
+        for index, (_, seconds, worker) in enumerate(results):
+            telemetry.task(self.name, kind, index, seconds, worker)
+        return [result for result, _, _ in results]
+
+    def __map_dask(self, timed: Timed, items: list) -> list:
+        import dask
+        try:
+            from distributed import default_client
+            default_client()
+            scheduler = None
+        except (ImportError, ValueError):
+            scheduler = 'processes'
+        tasks = [dask.delayed(timed)(item) for item in items]
+        return list(dask.compute(*tasks, scheduler=scheduler, num_workers=self.workers))
+
+
+def get_executor(name: str, workers: int | None = None, chunk_size: int | None = None, kind: str | None = None,
+                 default_kind: str = 'processes', default_chunk_size: int | None = None) -> Executor:
+    """
+    Returns the executor of a stage or a part of it.
+    Arguments win over the environment variables, the environment variables over the defaults.
+
+    Args:
+        name (str): The name of the work, e.g. 'coverage'
+        workers (int, optional): The number of threads or processes. Defaults to POWERUP_WORKERS or the number of cores.
+        chunk_size (int, optional): The number of items per task.
+                                    Defaults to POWERUP_<NAME>_CHUNK_SIZE or `default_chunk_size`.
+        kind (str, optional): One of KINDS. Defaults to POWERUP_EXECUTOR or `default_kind`.
+        default_kind (str, optional): The kind that suits the work. Defaults to 'processes'.
+        default_chunk_size (int, optional): The chunk size that suits the work. Defaults to no chunks.
+
+    Returns:
+        Executor: The executor
+    """
+    if workers is None:
+        workers = int(setting(name, 'WORKERS') or os.cpu_count() or 1)
+    if chunk_size is None:
+        configured = setting(name, 'CHUNK_SIZE', general=False)
+        chunk_size = int(configured) if configured else default_chunk_size
+    return Executor(name, kind or setting(name, 'EXECUTOR') or default_kind, workers, chunk_size)
@@ -0,0 +1,174 @@
+import os
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+
+"""
+This module hands the results of a stage to the next stage in memory.
+
+Without the handoff the stages communicate through the files in ./datasets/generated:
+the EV grid is written to parquet, the bubbles to WKT CSV files and the charging points to
+parquet and CSV, and the next stage reads and parses them again. With `enable` the stages keep
+their results in memory instead: `put` stores the DataFrame and `get` returns it to the next
+stage, so the EV grid is not read again and the bubbles are not parsed from WKT again.
+The files are still written, but in the background by one writer thread, while the next
+stage is already running. Every file is written to a temporary file first and renamed,
+so it is never read half written. `flush` waits until all files are written.
+Without persistence no file is written at all.
+
+The artifacts are identified by their path, so the stages keep using their usual paths.
+Without the handoff `put` writes the file right away and `get` reads it, as before.
+Objects returned by `get` may be shared with other stages and the writer, they must not be changed.
+"""
+
+_enabled = False
+_persist = True
+_store: dict[str, object] = {}
+_pending: list[Future] = []
+_writer: ThreadPoolExecutor | None = None
+_lock = threading.Lock()
+
+
+def enable(persist: bool = True) -> None:
+    """
+    Starts handing the results of the stages over in memory.
+
+    Args:
+        persist (bool, optional): Write the files in the background. Defaults to True.
+    """
+    global _enabled, _persist, _writer
+    disable()
+    _enabled, _persist = True, persist
+    if persist:
+        _writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='handoff-writer')
+
+
+def disable() -> None:
+    """
+    Waits for the pending writes and drops the results held in memory.
+    """
+    global _enabled, _writer
+    try:
+        flush()
+    finally:
+        if _writer is not None:
+            _writer.shutdown()
+        _enabled, _writer = False, None
+        _store.clear()
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def persisting() -> bool:
+    """
+    Returns whether the results are written to their files, right away or in the background.
+    """
+    return not _enabled or _persist
+
+
+def key(path: str) -> str:
+    # links of a workspace resolve to the artifact of the base directory
+    return os.path.realpath(path)
+
+
+def write_atomic(write: Callable[[object, str], None], value: object, path: str) -> None:
+    """
+    Writes `value` with `write` to a temporary file and renames it to `path`.
+    """
+    temporary = f'{path}.tmp'
+    write(value, temporary)
+    os.replace(temporary, path)
+
+
+def put(path: str, value: object, write: Callable[[object, str], None]) -> None:
+    """
+    Hands the result of a stage to the next stages.
+
+    Args:
+        path (str): The file of the result, e.g. './datasets/generated/cleared_ev.parquet'
+        value (object): The result
+        write (Callable[[object, str], None]): Writes the result to a file
+    """
+    if not _enabled:
+        write(value, path)
+        return
+    with _lock:
+        _store[key(path)] = value
+        if _persist:
+            # one writer thread, so the writes of the same file happen in order
+            _pending.append(_writer.submit(write_atomic, write, value, key(path)))
+
+
+def get(path: str, read: Callable[[str], object]) -> object:
+    """
+    Returns the result held in memory or reads it from its file with `read`.
+    """
+    with _lock:
+        if key(path) in _store:
+            return _store[key(path)]
+    return read(path)
+
+
+def flush() -> None:
+    """
+    Waits until all pending files are written.
+
+    Raises:
+        Exception: The first error of a write
+    """
+    with _lock:
+        pending = list(_pending)
+        _pending.clear()
+    for future in pending:
+        future.result()
+
+
+def write_parquet(df, path: str) -> None:
+    df.to_parquet(path, index=False)
+
+
+def write_csv(df, path: str) -> None:
+    df.to_csv(path, index=False)
+
+
+def read_parquet(path: str, columns: list[str] | None = None):
+    """
+    Returns the columns of a parquet result, from memory if it is held there.
+    """
+    import pandas as pd
+    df = get(path, lambda file: pd.read_parquet(file, columns=columns))
+    return df[columns] if columns is not None else df
+
+
+def write_wkt_csv(df, path: str) -> None:
+    """
+    Writes a table with shapely geometries in the column 'hull' as CSV with WKT geometries.
+    The WKT read from a file (column 'wkt') is written unchanged instead of being created again.
+    """
+    import shapely.wkt
+    texts = df['wkt'].values if 'wkt' in df.columns else [None] * len(df)
+    hull = [text if isinstance(text, str) else shapely.wkt.dumps(hull) for text, hull in zip(texts, df['hull'])]
+    df.drop(columns=['wkt'], errors='ignore').assign(hull=hull).to_csv(path, index=False)
+
+
+def read_wkt_csv(path: str):
+    """
+    Returns a table of bubbles with shapely geometries in the column 'hull',
+    from memory if it is held there, otherwise parsed from the WKT in the CSV file.
+    The WKT of the file is kept in the column 'wkt'.
+    """
+    import geopandas as gpd
+    import pandas as pd
+
+    def read(file: str):
+        df = pd.read_csv(file)
+        df['wkt'] = df['hull']
+        df['hull'] = gpd.GeoSeries.from_wkt(df['wkt']).values
+        return df
+    return get(path, read)
@@ -0,0 +1,241 @@
+import hashlib
+import json
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+
+"""
+This module limits a run of the pipeline to a region.
+
+A region is given by AGS prefixes (e.g. '07235' for a Kreis, '07' for a Land), a bounding box
+in EPSG:4326 or both. The region of the current run is set with `set_region` and every stage
+pushes it down into its reads: the grid and census files are filtered while they are read
+(or cut out of the national parquet files, if they exist), the parking spaces and charging
+stations are filtered to the extent of the region and the bubbles to the ones inside the region.
+
+Bubbles at the border are handled with a halo: the cells within HALO meters around the region
+are processed as well, so bubbles crossing the border are not cut in two. Afterwards only the
+bubbles whose centre lies inside the region are kept, so every bubble belongs to exactly one region.
+
+A region run works in its own directory ./regions/<key> that links the raw datasets,
+so its generated files never mix with the ones of the national run.
+"""
+
+# meters of neighbouring cells processed around the region
+HALO = 2_000
+# meters around the processed cells in which parking spaces and charging stations are kept
+PARKING_MARGIN = 5_000
+REGIONS_PATH = './regions'
+RAW_DATASETS = ['Zensus_Bevoelkerung_100m-Gitter.csv',
+                'fz27_202207.xlsx',
+                '1A_EinwohnerzahlGeschlecht.xls',
+                'export.geojson',
+                'Ladesaeulenregister.csv',
+                'DE_Grid_ETRS89-LAEA_100m']
+
+
+class Region:
+    """
+    A region given by AGS prefixes and/or a bounding box (min_lon, min_lat, max_lon, max_lat).
+    Cells have to match both, if both are given.
+    The processed cells and the tree over them are read and built on first use and reused,
+    cleared_ev.parquet is not changed by the stages that use them.
+    """
+
+    def __init__(self, ags: list[str] | None = None, bbox: list[float] | None = None, root: str = '.') -> None:
+        if not ags and bbox is None:
+            raise ValueError("A region needs AGS prefixes or a bounding box")
+        if bbox is not None and (len(bbox) != 4 or bbox[0] >= bbox[2] or bbox[1] >= bbox[3]):
+            raise ValueError("The bounding box has to be min_lon, min_lat, max_lon, max_lat")
+        self.ags = sorted(str(prefix) for prefix in ags or [])
+        self.bbox = tuple(float(value) for value in bbox) if bbox is not None else None
+        # the directory of the national run
+        self.root = os.path.abspath(root)
+        self._xy = None
+        self._ags = None
+        self._tree = None
+
+    @property
+    def key(self) -> str:
+        """
+        The name of the directory of the region.
+        """
+        parts = []
+        if self.ags:
+            parts.append('ags-' + '-'.join(self.ags))
+        if self.bbox is not None:
+            parts.append('bbox-' + hashlib.sha1(json.dumps(self.bbox).encode()).hexdigest()[:10])
+        return '_'.join(parts)
+
+    def to_dict(self) -> dict:
+        return {'ags': self.ags, 'bbox': list(self.bbox) if self.bbox else None}
+
+    def lands(self) -> list[str]:
+        """
+        Returns the two digit keys of the Länder of the AGS prefixes.
+        """
+        return sorted({prefix[:2] for prefix in self.ags})
+
+    def parquet_filters(self) -> list | None:
+        """
+        Returns pyarrow filters that only read the Länder of the region from a file with an 'ags' column.
+        """
+        if not self.ags:
+            return None
+        return [[('ags', '>=', land), ('ags', '<', f"{int(land) + 1:02d}")] for land in self.lands()]
+
+    def ags_mask(self, ags):
+        """
+        Returns which AGS start with one of the prefixes of the region.
+        """
+        import numpy as np
+        if not self.ags:
+            return np.ones(len(ags), dtype=bool)
+        return ags.str.startswith(tuple(self.ags)).values
+
+    def metric_bbox(self, margin: float = 0) -> tuple[float, float, float, float] | None:
+        """
+        Returns the bounding box in EPSG:3035, enlarged by `margin` meters.
+        """
+        if self.bbox is None:
+            return None
+        from pyproj import Transformer
+        transformer = Transformer.from_crs("EPSG:4326", "EPSG:3035", always_xy=True)
+        x0, y0, x1, y1 = transformer.transform_bounds(*self.bbox)
+        return x0 - margin, y0 - margin, x1 + margin, y1 + margin
+
+    def cell_mask(self, x, y, ags):
+        """
+        Returns which cells of the 100m grid are processed for the region,
+        the cells of the region and the cells in the halo around it.
+
+        Args:
+            x (np.ndarray): The x coordinates of the cells in EPSG:3035
+            y (np.ndarray): The y coordinates of the cells in EPSG:3035
+            ags (pd.Series): The AGS of the cells
+        """
+        import numpy as np
+        x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+        inside = self.ags_mask(ags)
+        if self.bbox is not None:
+            x0, y0, x1, y1 = self.metric_bbox()
+            inside &= (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)
+        if not inside.any():
+            return inside
+        x0, x1 = x[inside].min() - HALO, x[inside].max() + HALO
+        y0, y1 = y[inside].min() - HALO, y[inside].max() + HALO
+        return (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)
+
+    def candidate_mask(self, x, y, ags):
+        """
+        Returns a cheap superset of `cell_mask` that can be applied to every file of the grid on its own:
+        the cells in the Länder of the region and in the bounding box with its halo.
+        """
+        import numpy as np
+        x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+        mask = np.ones(len(x), dtype=bool)
+        if self.ags:
+            mask &= ags.str[:2].isin(self.lands()).values
+        if self.bbox is not None:
+            x0, y0, x1, y1 = self.metric_bbox(HALO)
+            mask &= (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)
+        return mask
+
+    def national_file(self, file_name: str) -> str | None:
+        """
+        Returns the path of a generated file of the national run, if it exists.
+        """
+        path = os.path.join(self.root, 'datasets', 'generated', file_name)
+        return path if os.path.exists(path) else None
+
+    def cells(self):
+        """
+        Returns the processed cells as (n, 2) array in EPSG:3035 and their AGS.
+        """
+        if self._xy is None:
+            import numpy as np
+            from pyproj import Transformer
+
+            from helper import handoff
+            df = handoff.read_parquet('./datasets/generated/cleared_ev.parquet',
+                                      columns=['x_mp_100m', 'y_mp_100m', 'ags'])
+            # after the transformation to EPSG:4326 x holds the latitude and y the longitude
+            transformer = Transformer.from_crs("EPSG:4326", "EPSG:3035", always_xy=True)
+            self._xy = np.column_stack(transformer.transform(df['y_mp_100m'].values, df['x_mp_100m'].values))
+            self._ags = df['ags'].reset_index(drop=True)
+        return self._xy, self._ags
+
+    def tree(self):
+        """
+        Returns a cKDTree over the processed cells in EPSG:3035.
+        """
+        if self._tree is None:
+            from scipy.spatial import cKDTree
+            self._tree = cKDTree(self.cells()[0])
+        return self._tree
+
+    def lonlat_bounds(self, margin: float = PARKING_MARGIN) -> tuple[float, float, float, float]:
+        """
+        Returns the extent (min_lon, min_lat, max_lon, max_lat) of the processed cells,
+        enlarged by `margin` meters, so parking spaces just outside the region can be used.
+        """
+        from pyproj import Transformer
+        xy = self.cells()[0]
+        x0, y0 = xy.min(axis=0)
+        x1, y1 = xy.max(axis=0)
+        to_lonlat = Transformer.from_crs("EPSG:3035", "EPSG:4326", always_xy=True)
+        return to_lonlat.transform_bounds(x0 - margin, y0 - margin, x1 + margin, y1 + margin)
+
+    def contains(self, lon, lat):
+        """
+        Returns which points lie inside the region. For AGS prefixes the AGS of the nearest
+        processed cell is used, so points in the halo belong to the neighbouring region.
+        """
+        import numpy as np
+        lon, lat = np.asarray(lon, dtype=float), np.asarray(lat, dtype=float)
+        mask = np.ones(len(lon), dtype=bool)
+        if self.bbox is not None:
+            mask &= (lon >= self.bbox[0]) & (lon <= self.bbox[2]) & (lat >= self.bbox[1]) & (lat <= self.bbox[3])
+        if self.ags and len(lon):
+            from pyproj import Transformer
+            transformer = Transformer.from_crs("EPSG:4326", "EPSG:3035", always_xy=True)
+            _, idx = self.tree().query(np.column_stack(transformer.transform(lon, lat)))
+            mask &= self.ags_mask(self.cells()[1].iloc[idx])
+        return mask
+
+
+_region: Region | None = None
+
+
+def set_region(region: Region | None) -> None:
+    """
+    Sets the region of the current run, None runs all of Germany.
+    """
+    global _region
+    _region = region
+
+
+def current() -> Region | None:
+    return _region
+
+
+def prepare_workdir(region: Region) -> str:
+    """
+    Creates the directory of a region run with links to the raw datasets of the national run.
+
+    Returns:
+        str: The directory of the region run
+    """
+    workdir = os.path.normpath(os.path.join(region.root, REGIONS_PATH, region.key))
+    datasets = os.path.join(workdir, 'datasets')
+    os.makedirs(os.path.join(datasets, 'generated'), exist_ok=True)
+    for name in RAW_DATASETS:
+        source = os.path.join(region.root, 'datasets', name)
+        link = os.path.join(datasets, name)
+        if os.path.exists(source) and not os.path.lexists(link):
+            os.symlink(source, link)
+    with open(os.path.join(workdir, 'region.json'), 'w') as f:
+        json.dump(region.to_dict(), f)
+    return workdir
@@ -0,0 +1,49 @@
+import importlib
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+
+"""
+This module runs the stages of the pipeline by name.
+
+The module of a stage is only imported when the stage is run, so heavy dependencies
+(geopandas, sklearn, scipy, folium, matplotlib, ...) are only loaded by the stages that need them
+and starting the program or running a single stage does not pay for all of them.
+Modules that are imported at startup must not import a stage module at the top level.
+"""
+
+# stage name: (module, function) in execution order
+STAGES = {
+    'data_helper': ('helper.data_helper', 'run_data_preparation'),
+    'ev': ('ev_approximation.ev', 'run_ev_calculation'),
+    'simple_split': ('redistricting.simple_split', 'run_splitting'),
+    'kmeans_batched': ('redistricting.kmeans_batched', 'run_kmeans_batched'),
+    'shared_parking': ('parkingspotfilter.parking', 'prepare_shared_parking'),
+    'parking': ('parkingspotfilter.parking', 'run_parking_search'),
+    'sweep': ('parkingspotfilter.parking', 'run_threshold_sweep'),
+    'max_coverage': ('parkingspotfilter.max_coverage', 'run_max_coverage'),
+    'coverage': ('evaluation.coverage', 'run_coverage'),
+    'viz': ('visualization.viz', 'run_visualization'),
+}
+# modules that have to stay out of the startup imports
+HEAVY_MODULES = ['geopandas', 'sklearn', 'scipy', 'folium', 'matplotlib', 'rtree', 'dask',
+                 'pandas', 'numpy', 'pyproj', 'shapely', 'PIL']
+
+
+def run_stage(name: str, *args, **kwargs):
+    """
+    Imports the module of a stage and runs it.
+
+    Args:
+        name (str): The name of the stage in STAGES
+        *args, **kwargs: Passed on to the function of the stage
+
+    Returns:
+        The return value of the function of the stage
+    """
+    if name not in STAGES:
+        raise ValueError(f"Unknown stage {name}")
+    module_name, function_name = STAGES[name]
+    return getattr(importlib.import_module(module_name), function_name)(*args, **kwargs)
@@ -0,0 +1,375 @@
+import csv
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from halo import Halo
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+
+"""
+This module records what every stage of the pipeline costs.
+
+A stage (data preparation, EV calculation, ...) consists of steps. Every step shows a spinner
+and records its wall clock time, CPU time (including worker processes), peak RSS,
+the bytes read and written and the number of rows going in and out.
+The records are written as a JSON and a CSV trace with `write_trace`.
+The tasks run by helper.executor are recorded as well and written to <trace>_tasks.csv.
+Long loops report their progress with `progress`, the finished tasks of helper.executor
+and the written Kreise of the regions are shown in the spinner of the running step.
+
+The stages listed in the environment variable POWERUP_PROFILE (comma separated, or 'all')
+are profiled. The sampling profiler pyinstrument is used if it is installed, cProfile otherwise.
+Another profiler can be set with `set_profiler`.
+
+Peak RSS and the byte counters are read from /proc. On systems without /proc
+the peak RSS is the peak of the whole process and the byte counters are empty.
+To measure the peak of every step, the peak RSS of the process (VmHWM) is reset at the start
+of every stage and step by writing to /proc/self/clear_refs. Tools that read VmHWM of the
+process while it runs only see the peak since the current step started.
+"""
+
+TRACE_PATH = './datasets/generated/trace'
+# minimum number of seconds between two updates of a progress text
+PROGRESS_INTERVAL = 0.5
+TRACE_COLUMNS = ['stage', 'step', 'status', 'start_s', 'wall_s', 'cpu_s', 'peak_rss_mb',
+                 'rows_in', 'rows_out', 'bytes_read', 'bytes_written']
+TASK_COLUMNS = ['stage', 'step', 'executor', 'kind', 'task', 'wall_s', 'worker']
+
+_records: list[dict] = []
+_tasks: list[dict] = []
+_open_steps: list = []
+_stage: str | None = None
+_origin = time.perf_counter()
+
+
+def io_counters() -> tuple[int | None, int | None]:
+    """
+    Returns the bytes read and written by this process so far.
+    """
+    try:
+        with open('/proc/self/io', 'r') as f:
+            counters = dict(line.split(': ') for line in f.read().splitlines())
+        return int(counters['rchar']), int(counters['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def peak_rss() -> int:
+    """
+    Returns the peak resident set size in bytes since the last `reset_peak_rss`.
+    """
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def reset_peak_rss() -> None:
+    """
+    Resets the peak RSS to the current RSS, so the peak of a step can be measured.
+    This writes to /proc/self/clear_refs at the start of every stage and step.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def cpu_time() -> float:
+    """
+    Returns the CPU time of this process and of all terminated worker processes.
+    """
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+class Progress:
+    """
+    Shows the progress of a loop in the text of a spinner.
+    `advance` only counts, the text is updated at most every PROGRESS_INTERVAL seconds.
+    Without a spinner it only counts.
+    """
+
+    def __init__(self, spinner: Halo | None, text: str, total: int, interval: float = PROGRESS_INTERVAL) -> None:
+        self.spinner = spinner
+        self.text = text
+        self.total = total
+        self.interval = interval
+        self.count = 0
+        self.__check_at = 1
+        self.__start = self.__last = time.perf_counter()
+
+    def advance(self, n: int = 1) -> None:
+        self.count += n
+        if self.count >= self.__check_at or self.count >= self.total:
+            self.__refresh()
+
+    def __refresh(self) -> None:
+        now = time.perf_counter()
+        elapsed = now - self.__last
+        # the last count is always shown, so the spinner does not end on an older one
+        if (elapsed >= self.interval or self.count >= self.total) and self.spinner is not None:
+            self.spinner.text = f"{self.text} ({self.count}/{self.total})"
+            self.__last = now
+            elapsed = 0
+        # look at the clock again after about a quarter of the interval
+        rate = self.count / max(now - self.__start, 1e-9)
+        self.__check_at = self.count + max(1, int(rate * (self.interval - elapsed) / 4))
+
+
+class Step:
+    """
+    A running step. The rows going in and out of a step can be set by the step itself.
+    """
+
+    def __init__(self, text: str, spinner: Halo | None) -> None:
+        self.text = text
+        self.spinner = spinner
+        self.rows_in: int | None = None
+        self.rows_out: int | None = None
+        self.status = 'ok'
+        self.peak = 0
+
+    def progress(self, total: int) -> Progress:
+        """
+        Returns a throttled progress counter shown in the spinner of the step.
+        """
+        return Progress(self.spinner, self.text, total)
+
+    def skip(self) -> None:
+        """
+        Marks the step as skipped, the spinner fails when the step ends.
+        """
+        self.status = 'skipped'
+
+
+def _default_profiler(name: str):
+    """
+    Profiles a stage with pyinstrument if it is installed, with cProfile otherwise.
+    """
+    directory = os.path.dirname(TRACE_PATH)
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        import cProfile
+
+        @contextmanager
+        def profile():
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                profiler.dump_stats(os.path.join(directory, f'profile_{name}.prof'))
+        return profile()
+
+    @contextmanager
+    def sample():
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            with open(os.path.join(directory, f'profile_{name}.html'), 'w') as f:
+                f.write(profiler.output_html())
+    return sample()
+
+
+_profiler: Callable = _default_profiler
+
+
+def set_profiler(factory: Callable) -> None:
+    """
+    Sets the profiler of the stages listed in POWERUP_PROFILE.
+
+    Args:
+        factory (Callable): Gets the name of the stage and returns a context manager that profiles it
+    """
+    global _profiler
+    _profiler = factory
+
+
+def profiled(name: str) -> bool:
+    stages = os.environ.get('POWERUP_PROFILE', '')
+    return stages == 'all' or name in stages.split(',')
+
+
+@contextmanager
+def stage(name: str) -> Iterator[Step]:
+    """
+    Records a stage of the pipeline. All steps inside belong to this stage.
+
+    Args:
+        name (str): The name of the stage
+    """
+    global _stage
+    previous, _stage = _stage, name
+    try:
+        with _measure(name, None, None) as current:
+            if profiled(name):
+                with _profiler(name):
+                    yield current
+            else:
+                yield current
+    finally:
+        _stage = previous
+
+
+@contextmanager
+def step(text: str, rows_in: int | None = None) -> Iterator[Step]:
+    """
+    Shows a spinner with `text` while the step runs and records the step.
+
+    Args:
+        text (str): The text of the spinner and the name of the step
+        rows_in (int, optional): The number of rows going into the step. Defaults to None.
+    """
+    spinner = Halo("Loading")
+    spinner.start(text=text)
+    with _measure(text, spinner, rows_in) as current:
+        yield current
+
+
+@contextmanager
+def _measure(name: str, spinner: Halo | None, rows_in: int | None) -> Iterator[Step]:
+    """
+    Measures a stage (without spinner) or a step (with spinner) and appends its record.
+    """
+    current = Step(name, spinner)
+    current.rows_in = rows_in
+    # the peak of the enclosing steps is saved before it is reset for this step
+    peak = peak_rss()
+    for parent in _open_steps:
+        parent.peak = max(parent.peak, peak)
+    reset_peak_rss()
+    _open_steps.append(current)
+    read, written = io_counters()
+    start = time.perf_counter()
+    cpu = cpu_time()
+    try:
+        yield current
+    except BaseException:
+        current.status = 'failed'
+        raise
+    finally:
+        wall = time.perf_counter() - start
+        cpu = cpu_time() - cpu
+        _open_steps.pop()
+        current.peak = max(current.peak, peak_rss())
+        if _open_steps:
+            _open_steps[-1].peak = max(_open_steps[-1].peak, current.peak)
+        read_end, written_end = io_counters()
+        _records.append({
+            'stage': _stage,
+            'step': None if spinner is None else name,
+            'status': current.status,
+            'start_s': round(start - _origin, 6),
+            'wall_s': round(wall, 6),
+            'cpu_s': round(cpu, 6),
+            'peak_rss_mb': round(current.peak / 2 ** 20, 3),
+            'rows_in': current.rows_in,
+            'rows_out': current.rows_out,
+            'bytes_read': None if read is None else read_end - read,
+            'bytes_written': None if written is None else written_end - written,
+        })
+        if spinner is not None and current.status == 'ok':
+            spinner.succeed()
+        elif spinner is not None:
+            spinner.fail()
+
+
+def progress(total: int) -> Progress:
+    """
+    Returns a throttled progress counter shown in the spinner of the innermost running step.
+    Outside of a step the counter shows nothing, so loops can report their progress wherever they are called from.
+    """
+    if not _open_steps:
+        return Progress(None, '', total)
+    return _open_steps[-1].progress(total)
+
+
+def rows(rows_in: int | None = None, rows_out: int | None = None) -> None:
+    """
+    Sets the rows going in and out of the innermost running step.
+    Does nothing outside of a step, so functions can report their rows wherever they are called from.
+    """
+    if not _open_steps:
+        return
+    if rows_in is not None:
+        _open_steps[-1].rows_in = rows_in
+    if rows_out is not None:
+        _open_steps[-1].rows_out = rows_out
+
+
+def task(executor: str, kind: str, index: int, seconds: float, worker: str) -> None:
+    """
+    Records a task run by helper.executor in the innermost running step.
+
+    Args:
+        executor (str): The name of the executor
+        kind (str): How the task ran, serial, threads, processes or dask
+        index (int): The position of the task
+        seconds (float): The wall clock time of the task
+        worker (str): The process and thread that ran the task
+    """
+    _tasks.append({'stage': _stage,
+                   'step': _open_steps[-1].text if _open_steps else None,
+                   'executor': executor,
+                   'kind': kind,
+                   'task': index,
+                   'wall_s': round(seconds, 6),
+                   'worker': worker})
+
+
+def task_records() -> list[dict]:
+    """
+    Returns the records of all tasks run by helper.executor.
+    """
+    return list(_tasks)
+
+
+def records() -> list[dict]:
+    """
+    Returns the records of all finished steps and stages in the order they finished.
+    """
+    return list(_records)
+
+
+def clear() -> None:
+    _records.clear()
+    _tasks.clear()
+
+
+def write_trace(path: str = TRACE_PATH) -> None:
+    """
+    Writes the records as <path>.json and <path>.csv and the tasks as <path>_tasks.csv.
+
+    Args:
+        path (str, optional): The path of the trace files without extension. Defaults to TRACE_PATH.
+    """
+    with open(f'{path}.json', 'w') as f:
+        json.dump(_records, f, indent=1)
+    with open(f'{path}.csv', 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=TRACE_COLUMNS)
+        writer.writeheader()
+        writer.writerows(_records)
+    if _tasks:
+        with open(f'{path}_tasks.csv', 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=TASK_COLUMNS)
+            writer.writeheader()
+            writer.writerows(_tasks)
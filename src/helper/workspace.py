@@ -0,0 +1,132 @@
+import json
+import os
+import re
+import sys
+from contextlib import contextmanager
+
+from helper import handoff, scope
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+
+"""
+This module isolates the runs of different scenarios from each other.
+
+A workspace is a directory ./runs/<name> below the base directory (the working directory of the
+run, or the directory of its region, see helper.scope). It has its own datasets/generated and maps
+folders, so the bubbles, charging points, maps and the trace of one scenario never overwrite the ones
+of another and scenarios can run at the same time on one machine.
+
+The expensive artifacts that do not depend on the scenario (the cleaned grid, the EV estimates,
+the filtered parking spaces, the parking index and the charging station register) are only prepared
+once in the base directory and linked into every workspace. Only the base stages write them:
+they run in the base directory while holding a lock, so concurrent scenarios neither prepare
+them twice nor read them half written. The scenario stages only read them through the links.
+"""
+
+WORKSPACES_PATH = './runs'
+# generated files and directories shared read-only by all workspaces of a base directory
+BASE_ARTIFACTS = ['combined_grid.parquet',
+                  '100m_cleared.parquet',
+                  '100m_cleared_4326.parquet',
+                  'fz_27_15.parquet',
+                  'merged_100m_cleared.parquet',
+                  'population_per_municipality.parquet',
+                  'cleared_ev.parquet',
+                  'filtered_parking_spaces.geojson',
+                  'charging_stations.parquet',
+                  'charging_stations.json',
+                  'parking_index']
+# stages that write base artifacts, they always run in the base directory
+BASE_STAGES = ['data_helper', 'ev']
+LOCK_FILE = 'datasets/generated/.base.lock'
+NAME_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.-]*$')
+
+
+class Workspace:
+    """
+    The directory of one scenario run that shares the base artifacts of `base`.
+
+    Attributes
+    ----------
+    name : str
+        The name of the scenario, letters, digits, '_', '.' and '-'.
+    base : str
+        The absolute path of the base directory with the shared artifacts.
+    path : str
+        The absolute path of the workspace.
+    """
+
+    def __init__(self, name: str, base: str = '.') -> None:
+        if not NAME_PATTERN.match(str(name)):
+            raise ValueError(f"Invalid workspace name {name}, use letters, digits, '_', '.' and '-'")
+        self.name = str(name)
+        self.base = os.path.abspath(base)
+        self.path = os.path.normpath(os.path.join(self.base, WORKSPACES_PATH, self.name))
+
+    def prepare(self) -> str:
+        """
+        Creates the workspace with links to the raw datasets and the base artifacts that exist.
+
+        Returns:
+            str: The directory of the workspace
+        """
+        os.makedirs(os.path.join(self.path, 'datasets', 'generated'), exist_ok=True)
+        os.makedirs(os.path.join(self.path, 'maps'), exist_ok=True)
+        for name in scope.RAW_DATASETS:
+            link(os.path.join(self.base, 'datasets', name), os.path.join(self.path, 'datasets', name))
+        self.link()
+        with open(os.path.join(self.path, 'workspace.json'), 'w') as f:
+            json.dump({'name': self.name, 'base': self.base}, f)
+        return self.path
+
+    def link(self) -> None:
+        """
+        Links the base artifacts that exist into the workspace, e.g. after a base stage created them.
+        """
+        for name in BASE_ARTIFACTS:
+            link(os.path.join(self.base, 'datasets', 'generated', name),
+                 os.path.join(self.path, 'datasets', 'generated', name))
+
+    @contextmanager
+    def shared(self):
+        """
+        Runs the enclosed code in the base directory while holding the lock of the base artifacts.
+        Afterwards the new base artifacts are written, linked and the working directory is restored.
+        """
+        cwd = os.getcwd()
+        os.makedirs(os.path.join(self.base, 'datasets', 'generated'), exist_ok=True)
+        with open(os.path.join(self.base, LOCK_FILE), 'w') as lock:
+            acquire(lock)
+            try:
+                os.chdir(self.base)
+                yield self.base
+            finally:
+                os.chdir(cwd)
+                # other scenarios read the base artifacts from their files
+                handoff.flush()
+                self.link()
+
+
+def link(source: str, target: str) -> None:
+    """
+    Links `target` to `source` if the source exists and the target does not.
+    A file that was generated in the workspace itself is never replaced.
+    """
+    if os.path.lexists(target) and not os.path.exists(target):
+        # the link of a base artifact that was removed, e.g. to prepare it again
+        os.remove(target)
+    if os.path.exists(source) and not os.path.lexists(target):
+        os.symlink(source, target)
+
+
+def acquire(lock) -> None:
+    """
+    Blocks until the exclusive lock on the open file `lock` is acquired, it is released when the file is closed.
+    Without fcntl (Windows) the lock is skipped, so concurrent scenarios have to prepare the base first.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        return
+    fcntl.flock(lock, fcntl.LOCK_EX)
@@ -0,0 +1,273 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from helper import executor
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+
+"""
+This module assigns bubbles to parking spaces while respecting the maximum
+number of charging stations per parking space.
+
+All coordinates are metric (EPSG:3035). Parking spaces are referenced by their
+integer id, which is their position in the parking index.
+"""
+
+# Edge length of a shard in meters
+TILE_SIZE = 50_000
+# Parking spaces this far outside of a shard are still candidates for its bubbles
+HALO = 5_000
+
+
+def nearest_free(tree: cKDTree, point: np.ndarray, counts: np.ndarray, capacity: int, k: int) -> int:
+    """
+    Finds the nearest parking space of `point` that has not reached the capacity yet.
+    The number of queried neighbours is doubled until a free parking space is found.
+
+    Args:
+        tree (cKDTree): The tree over the parking spaces
+        point (np.ndarray): The metric coordinates of the bubble
+        counts (np.ndarray): The number of bubbles already assigned to each parking space
+        capacity (int): The maximum number of charging stations per parking space
+        k (int): The number of neighbours that were already checked
+
+    Returns:
+        int: The id of the parking space or -1 if every parking space is full
+    """
+    while k < tree.n:
+        k = min(2 * k, tree.n)
+        _, idx = tree.query(point, k=k)
+        free = idx[counts[idx] < capacity]
+        if len(free):
+            return free[0]
+    return -1
+
+
+def nearest_candidates(tree: cKDTree, points: np.ndarray, k: int) -> np.ndarray:
+    """
+    Queries the k nearest parking spaces of all points in one batch.
+
+    Args:
+        tree (cKDTree): The tree over the parking spaces
+        points (np.ndarray): (n, 2) array with the metric coordinates of the bubbles
+        k (int): The number of candidates per point, at most the number of parking spaces
+
+    Returns:
+        np.ndarray: (n, k) array with the ids of the candidates, nearest first
+    """
+    k = min(k, tree.n)
+    _, candidates = tree.query(points, k=k)
+    return candidates.reshape(len(points), k)
+
+
+def assign_with_capacity(tree: cKDTree, points: np.ndarray, capacity: int,
+                         counts: np.ndarray | None = None, k: int = 8,
+                         candidates: np.ndarray | None = None) -> np.ndarray:
+    """
+    Assigns every point to its nearest parking space that has not reached the capacity yet.
+    Points are processed in the given order, so earlier points get the closer parking spaces.
+    The k nearest candidates of all points are queried in one batch,
+    only points whose candidates are all full are queried again.
+
+    Args:
+        tree (cKDTree): The tree over the parking spaces
+        points (np.ndarray): (n, 2) array with the metric coordinates of the bubbles
+        capacity (int): The maximum number of charging stations per parking space
+        counts (np.ndarray, optional): Assignments that already exist per parking space.
+                                       The array is updated in place. Defaults to no assignments.
+        k (int, optional): The number of candidates queried in the batch. Defaults to 8.
+        candidates (np.ndarray, optional): Already queried (n, k) candidates of the points,
+                                           see `nearest_candidates`. Defaults to querying them.
+
+    Returns:
+        np.ndarray: The id of the parking space for each point, -1 if no parking space was free
+    """
+    if counts is None:
+        counts = np.zeros(tree.n, dtype=np.int64)
+    assigned = np.full(len(points), -1, dtype=np.int64)
+    if len(points) == 0 or tree.n == 0:
+        return assigned
+    if candidates is None:
+        candidates = nearest_candidates(tree, points, k)
+    k = candidates.shape[1]
+    for i, row in enumerate(candidates):
+        free = row[counts[row] < capacity]
+        p = free[0] if len(free) else nearest_free(
+            tree, points[i], counts, capacity, k)
+        if p >= 0:
+            counts[p] += 1
+            assigned[i] = p
+    return assigned
+
+
+def group_by_tile(xy: np.ndarray, tile_size: float) -> dict:
+    """
+    Groups coordinates by the tile they lie in.
+
+    Args:
+        xy (np.ndarray): (n, 2) array of metric coordinates
+        tile_size (float): The edge length of a tile in meters
+
+    Returns:
+        dict: The ids of the coordinates per (column, row) key of a tile, sorted by the key
+    """
+    keys = np.floor(np.asarray(xy) / tile_size).astype(np.int64)
+    if len(keys) == 0:
+        return {}
+    unique_keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    groups = np.split(np.argsort(inverse, kind='stable'),
+                      np.cumsum(np.bincount(inverse))[:-1])
+    return {(int(col), int(row)): ids for (col, row), ids in zip(unique_keys, groups)}
+
+
+def assign_tile(task: tuple) -> tuple:
+    """
+    Assigns the bubbles of one tile to the parking spaces of the tile and its halo.
+    The capacity is only respected locally, conflicts with other tiles are resolved in `reconcile`.
+    This function runs in a worker process.
+
+    Args:
+        task (tuple): bubble ids, bubble coordinates, parking ids, parking coordinates and capacity
+
+    Returns:
+        tuple: The bubble ids and the assigned parking ids (-1 if nothing was free)
+    """
+    bubble_ids, points, parking_ids, parking_xy, capacity = task
+    if len(parking_ids) == 0:
+        return bubble_ids, np.full(len(bubble_ids), -1, dtype=np.int64)
+    local = assign_with_capacity(cKDTree(parking_xy), points, capacity)
+    return bubble_ids, np.where(local >= 0, parking_ids[local], -1)
+
+
+def make_tasks(parking_xy: np.ndarray, points: np.ndarray, capacity: int,
+               tile_size: float, halo: float) -> list:
+    """
+    Splits the bubbles into tiles and collects the parking spaces inside each tile and its halo.
+
+    Returns:
+        list: One task per tile for `assign_tile`, ordered by the tile key
+    """
+    parking_tiles = group_by_tile(parking_xy, tile_size)
+    tasks = []
+    for (col, row), bubble_ids in group_by_tile(points, tile_size).items():
+        # The halo is smaller than a tile, so only the neighbouring tiles have to be checked
+        neighbours = [parking_tiles[(col + dc, row + dr)]
+                      for dc in (-1, 0, 1) for dr in (-1, 0, 1)
+                      if (col + dc, row + dr) in parking_tiles]
+        parking_ids = np.sort(np.concatenate(neighbours)) if neighbours else np.empty(0, dtype=np.int64)
+        xy = parking_xy[parking_ids]
+        inside = ((xy[:, 0] >= col * tile_size - halo) & (xy[:, 0] < (col + 1) * tile_size + halo) &
+                  (xy[:, 1] >= row * tile_size - halo) & (xy[:, 1] < (row + 1) * tile_size + halo))
+        parking_ids = parking_ids[inside]
+        tasks.append((bubble_ids, points[bubble_ids], parking_ids,
+                      np.asarray(parking_xy[parking_ids]), capacity))
+    return tasks
+
+
+def reconcile(tree: cKDTree, points: np.ndarray, assigned: np.ndarray, capacity: int) -> np.ndarray:
+    """
+    Merges the assignments of all tiles deterministically.
+    Parking spaces near tile borders can be chosen by bubbles of several tiles.
+    For every parking space the bubbles with the lowest ids keep it up to the capacity,
+    the others are reassigned in order of their id against the global capacity.
+
+    Args:
+        tree (cKDTree): The tree over all parking spaces
+        points (np.ndarray): The metric coordinates of all bubbles
+        assigned (np.ndarray): The parking id chosen for each bubble by its tile
+        capacity (int): The maximum number of charging stations per parking space
+
+    Returns:
+        np.ndarray: The final parking id for each bubble
+    """
+    bubble_ids = np.arange(len(assigned))
+    order = np.lexsort((bubble_ids, assigned))
+    sorted_parking = assigned[order]
+    group_start = np.flatnonzero(np.r_[True, sorted_parking[1:] != sorted_parking[:-1]])
+    group_size = np.diff(np.r_[group_start, len(order)])
+    rank = np.arange(len(order)) - np.repeat(group_start, group_size)
+    accepted = np.empty(len(assigned), dtype=bool)
+    accepted[order] = rank < capacity
+    accepted &= assigned >= 0
+
+    result = np.where(accepted, assigned, -1)
+    counts = np.bincount(result[accepted], minlength=tree.n)
+    conflicts = np.flatnonzero(~accepted)
+    if len(conflicts):
+        result[conflicts] = assign_with_capacity(
+            tree, points[conflicts], capacity, counts)
+    return result
+
+
+def assign_sharded(tree: cKDTree, parking_xy: np.ndarray, points: np.ndarray, capacity: int,
+                   workers: int | None = None, tile_size: float = TILE_SIZE, halo: float = HALO) -> np.ndarray:
+    """
+    Assigns the bubbles to the parking spaces tile by tile in parallel worker processes
+    and reconciles the capacity conflicts at the tile borders afterwards.
+    The result does not depend on the number of workers.
+
+    Args:
+        tree (cKDTree): The tree over all parking spaces
+        parking_xy (np.ndarray): The metric coordinates of all parking spaces
+        points (np.ndarray): The metric coordinates of all bubbles
+        capacity (int): The maximum number of charging stations per parking space
+        workers (int, optional): The number of worker processes.
+                                 Defaults to POWERUP_WORKERS or the number of cores, see helper.executor.
+        tile_size (float, optional): The edge length of a tile in meters. Defaults to TILE_SIZE.
+        halo (float, optional): The margin around a tile in meters. Defaults to HALO.
+
+    Returns:
+        np.ndarray: The parking id for each bubble, -1 if no parking space was free
+    """
+    if halo >= tile_size:
+        raise ValueError("The halo has to be smaller than a tile")
+    assigned = np.full(len(points), -1, dtype=np.int64)
+    tasks = make_tasks(np.asarray(parking_xy), points, capacity, tile_size, halo)
+    results = executor.get_executor('assignment', workers).map(assign_tile, tasks)
+    for bubble_ids, parking_ids in results:
+        assigned[bubble_ids] = parking_ids
+    return reconcile(tree, points, assigned, capacity)
+
+
+def sweep_max_stations(tree: cKDTree, points: np.ndarray, thresholds: list[int],
+                       k: int = 32) -> tuple[dict, pd.DataFrame]:
+    """
+    Assigns the bubbles once for every maximum number of charging stations per parking space.
+    The k nearest candidates of all bubbles are queried only once and shared by all thresholds.
+
+    Args:
+        tree (cKDTree): The tree over the parking spaces
+        points (np.ndarray): (n, 2) array with the metric coordinates of the bubbles
+        thresholds (list[int]): The values of threshold_max_stations to compare
+        k (int, optional): The number of shared candidates per bubble. Defaults to 32.
+
+    Returns:
+        tuple[dict, pd.DataFrame]: The parking id of each bubble per threshold and a summary
+                                   with the number of used parking spaces, unassigned bubbles
+                                   and the mean and 95th percentile bubble to parking space
+                                   distance in meters per threshold.
+    """
+    candidates = nearest_candidates(tree, points, k)
+    assignments = {}
+    summary = []
+    for threshold in thresholds:
+        assigned = assign_with_capacity(
+            tree, points, threshold, candidates=candidates)
+        valid = assigned >= 0
+        distances = np.hypot(*(points[valid] - tree.data[assigned[valid]]).T)
+        assignments[threshold] = assigned
+        summary.append({
+            'threshold': threshold,
+            'bubbles': len(assigned),
+            'unassigned': int((~valid).sum()),
+            'used_lots': len(np.unique(assigned[valid])),
+            'mean_distance': distances.mean() if len(distances) else np.nan,
+            'p95_distance': np.percentile(distances, 95) if len(distances) else np.nan,
+        })
+    return assignments, pd.DataFrame(summary)
@@ -0,0 +1,222 @@
+import heapq
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+
+from evaluation import coverage
+from helper import executor, handoff, telemetry
+from validation import validation
+
+from .parking import filter_parking_spaces
+from .parking_index import load_parking_index
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+
+"""
+This module places charging stations so that they cover as many EVs as possible.
+
+Instead of one charging station per bubble, `chargers` parking spaces are chosen that maximise
+the EVs living within `radius` meters of a chosen parking space. EVs that are already covered by
+an existing charging station do not count. The problem is solved greedily, which is within
+1 - 1/e of the optimum. The marginal gains are evaluated lazily (CELF): a gain can only shrink
+when other parking spaces are chosen, so the stale gain in the priority queue is an upper bound
+and only the gain at the top of the queue has to be evaluated again.
+
+The cells covered by each parking space are precomputed with ball queries on a KD-tree over the
+cells and stored as a sparse matrix. Parking spaces whose coverage sets do not overlap, even
+through other parking spaces, form independent components. Their greedy sequences do not
+influence each other, so the components are solved in parallel worker processes and their
+sequences are merged by gain, which gives the same result as one greedy run over all of them.
+"""
+
+# distance in meters within which a charging station covers an EV
+RADIUS = coverage.COVERAGE_RADIUS
+
+
+def coverage_lists(cell_xy: np.ndarray, candidate_xy: np.ndarray, radius: float = RADIUS) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Finds the cells within `radius` of every candidate.
+
+    Args:
+        cell_xy (np.ndarray): (n, 2) metric coordinates of the cells
+        candidate_xy (np.ndarray): (m, 2) metric coordinates of the parking spaces
+        radius (float, optional): The covered distance in meters. Defaults to RADIUS.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The covered cells of candidate i are indices[indptr[i]:indptr[i + 1]]
+    """
+    if len(cell_xy) == 0 or len(candidate_xy) == 0:
+        return np.zeros(len(candidate_xy) + 1, dtype=np.int64), np.empty(0, dtype=np.int64)
+    # one dual tree traversal finds all pairs, a cell at the same position as a parking space is kept as explicit 0
+    pairs = cKDTree(candidate_xy).sparse_distance_matrix(cKDTree(cell_xy), radius, output_type='coo_matrix').tocsr()
+    pairs.sort_indices()
+    return pairs.indptr.astype(np.int64), pairs.indices.astype(np.int64)
+
+
+def lazy_greedy(indptr: np.ndarray, indices: np.ndarray, weights: np.ndarray, budget: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Chooses up to `budget` candidates that greedily maximise the covered weight (CELF).
+
+    Args:
+        indptr (np.ndarray): The offsets of the coverage lists, see `coverage_lists`
+        indices (np.ndarray): The covered cells of all candidates
+        weights (np.ndarray): The weight of every cell, 0 for cells that are already covered
+        budget (int): The maximum number of chosen candidates
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The chosen candidates and their marginal gains in the order
+                                       they were chosen. Candidates without gain are never chosen.
+    """
+    candidates = len(indptr) - 1
+    # reduceat fails for a trailing candidate without cells, bincount handles empty coverage lists
+    gains = np.bincount(np.repeat(np.arange(candidates), np.diff(indptr)), weights=weights[indices],
+                        minlength=candidates)
+    # the queue holds (-gain, candidate, number of chosen candidates when the gain was evaluated)
+    queue = [(-gain, candidate, 0) for candidate, gain in enumerate(gains) if gain > 0]
+    heapq.heapify(queue)
+    covered = np.zeros(len(weights), dtype=bool)
+    chosen, chosen_gains = [], []
+    while queue and len(chosen) < budget:
+        gain, candidate, evaluated = heapq.heappop(queue)
+        if evaluated == len(chosen):
+            cells = indices[indptr[candidate]:indptr[candidate + 1]]
+            covered[cells] = True
+            chosen.append(candidate)
+            chosen_gains.append(-gain)
+            continue
+        cells = indices[indptr[candidate]:indptr[candidate + 1]]
+        gain = weights[cells[~covered[cells]]].sum()
+        if gain > 0:
+            heapq.heappush(queue, (-gain, candidate, len(chosen)))
+    return np.array(chosen, dtype=np.int64), np.array(chosen_gains, dtype=np.float64)
+
+
+def solve_components(task: tuple) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Runs the lazy greedy over a group of independent components.
+    This function runs in a worker process.
+
+    Args:
+        task (tuple): candidate ids, their coverage lists with local cell ids, the weights of the cells and budget
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The chosen candidate ids and their gains
+    """
+    candidate_ids, indptr, indices, weights, budget = task
+    chosen, gains = lazy_greedy(indptr, indices, weights, budget)
+    return candidate_ids[chosen], gains
+
+
+def make_tasks(indptr: np.ndarray, indices: np.ndarray, weights: np.ndarray, budget: int,
+               tasks: int) -> list:
+    """
+    Splits the candidates into groups of components whose coverage sets do not overlap.
+    The components are distributed over `tasks` groups of about the same number of coverage entries.
+
+    Returns:
+        list: One task per non empty group for `solve_components`
+    """
+    candidates = len(indptr) - 1
+    lengths = np.diff(indptr)
+    # a candidate and the cells it covers are connected, candidates sharing a cell end up in one component
+    rows = np.repeat(np.arange(candidates), lengths)
+    graph = coo_matrix((np.ones(len(indices), dtype=np.int8), (rows, candidates + indices)),
+                       shape=(candidates + len(weights),) * 2)
+    _, labels = connected_components(graph, directed=False)
+    labels = labels[:candidates]
+    # the largest components are assigned first, always to the smallest group
+    sizes = np.bincount(labels, weights=lengths)
+    loads = [(0.0, group) for group in range(tasks)]
+    group_of = np.empty(len(sizes), dtype=np.int64)
+    for label in np.argsort(-sizes, kind='stable'):
+        load, group = heapq.heappop(loads)
+        group_of[label] = group
+        heapq.heappush(loads, (load + sizes[label], group))
+    groups = group_of[labels]
+    result = []
+    for group in range(tasks):
+        candidate_ids = np.flatnonzero((groups == group) & (lengths > 0))
+        if len(candidate_ids) == 0:
+            continue
+        sub_lengths = lengths[candidate_ids]
+        sub_indptr = np.concatenate([[0], np.cumsum(sub_lengths)])
+        # the positions of the coverage lists of the candidates in `indices`
+        positions = np.repeat(indptr[candidate_ids] - sub_indptr[:-1], sub_lengths) + np.arange(sub_indptr[-1])
+        cells, local = np.unique(indices[positions], return_inverse=True)
+        result.append((candidate_ids, sub_indptr, local.ravel(), weights[cells], budget))
+    return result
+
+
+def place_max_coverage(cell_xy: np.ndarray, weights: np.ndarray, candidate_xy: np.ndarray, budget: int,
+                       radius: float = RADIUS, workers: int | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Chooses `budget` parking spaces that greedily maximise the EVs within `radius`.
+    The result does not depend on the number of workers.
+
+    Args:
+        cell_xy (np.ndarray): (n, 2) metric coordinates of the cells
+        weights (np.ndarray): The EVs of the cells, 0 for cells that are already covered
+        candidate_xy (np.ndarray): (m, 2) metric coordinates of the parking spaces
+        budget (int): The number of charging stations
+        radius (float, optional): The covered distance in meters. Defaults to RADIUS.
+        workers (int, optional): The number of worker processes.
+                                 Defaults to POWERUP_WORKERS or the number of cores, see helper.executor.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The chosen parking ids and their marginal gains in the greedy order
+    """
+    indptr, indices = coverage_lists(cell_xy, candidate_xy, radius)
+    weights = np.asarray(weights, dtype=np.float64)
+    greedy_executor = executor.get_executor('max_coverage', workers)
+    if greedy_executor.kind == 'serial':
+        return lazy_greedy(indptr, indices, weights, budget)
+    tasks = make_tasks(indptr, indices, weights, budget, greedy_executor.workers)
+    results = greedy_executor.map(solve_components, tasks)
+    # every sequence has decreasing gains, so merging them by gain repeats the global greedy order
+    merged = list(heapq.merge(*[zip(-gains, chosen) for chosen, gains in results]))[:budget]
+    return (np.array([candidate for _, candidate in merged], dtype=np.int64),
+            np.array([-gain for gain, _ in merged], dtype=np.float64))
+
+
+def run_max_coverage(chargers: int, radius: float = RADIUS, workers: int | None = None) -> None:
+    """
+    Places `chargers` charging stations with the maximum coverage algorithm and saves them
+    like the parking stage to charging_points.parquet and charging_points.csv,
+    with one charging station per parking space and the newly covered EVs in the column 'gain'.
+
+    Args:
+        chargers (int): The number of charging stations
+        radius (float, optional): The covered distance in meters. Defaults to RADIUS.
+        workers (int, optional): The number of worker processes.
+                                 Defaults to POWERUP_WORKERS or the number of cores, see helper.executor.
+    """
+    with telemetry.step("Applying Filters To Parking Spaces"):
+        if not validation.check_generated("filtered_parking_spaces.geojson"):
+            filter_parking_spaces()
+    with telemetry.step("Reading Cells And Charging Stations"):
+        parking_index = load_parking_index('./datasets/generated/filtered_parking_spaces.geojson')
+        cell_xy, ev, _ = coverage.load_cells()
+        # EVs that are already covered by an existing charging station are not covered again
+        weights = np.where(coverage.nearest_distance(cell_xy, coverage.load_existing_chargers()) <= radius, 0.0, ev)
+    with telemetry.step("Choosing Parking Spaces With Maximum Coverage", rows_in=len(parking_index)) as step:
+        chosen, gains = place_max_coverage(cell_xy, weights, np.asarray(parking_index.xy),
+                                           chargers, radius, workers)
+        step.rows_out = len(chosen)
+    with telemetry.step("Saving Charging Points"):
+        lonlat = parking_index.lonlat[chosen]
+        result = pd.DataFrame({'id': chosen,
+                               'osm_id': parking_index.ids[chosen],
+                               'lon': lonlat[:, 0],
+                               'lat': lonlat[:, 1],
+                               'count': np.ones(len(chosen), dtype=np.int64),
+                               'gain': gains})
+        attributes = parking_index.attributes().iloc[chosen].reset_index(drop=True)
+        result = pd.concat([result, attributes], axis=1)
+        handoff.put('./datasets/generated/charging_points.parquet', result, handoff.write_parquet)
+        handoff.put('./datasets/generated/charging_points.csv', result, handoff.write_csv)
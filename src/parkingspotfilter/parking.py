@@ -1,21 +1,22 @@
+import json
 import math
 import os
 import sys
+from typing import Iterator, TextIO
 
-import geojson
 import geopandas as gpd
+import numpy as np
 import pandas as pd
 from geopandas import GeoDataFrame
-from halo import Halo
-from progress.bar import IncrementalBar
-from rtree import index
 from scipy.spatial import cKDTree
-from shapely.geometry import LineString, Point, Polygon, shape
-from shapely.wkt import dumps, loads
+from shapely.geometry import LineString, Point, Polygon
 
-from helper import user_interface_helper
+from helper import handoff, scope, telemetry, user_interface_helper
 from validation import validation
 
+from . import assignment
+from .parking_index import ATTRIBUTES, ParkingIndex, load_parking_index
+
 sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
 
 
@@ -26,56 +27,53 @@ class ParkingService:
 
     def __init__(self, csv_file: str, json_file: str) -> None:
         self.bubbles_df: pd.DataFrame = self.init_csv_df(csv_file)
-        self.parking_spaces_gdf: gpd.GeoDataFrame = self.init_gdf_df(json_file)
-        self.tree: cKDTree = cKDTree(self.parking_spaces_gdf.geometry.apply(lambda p: (
-            self.turn_any_geometry_into_point(p).x, self.turn_any_geometry_into_point(p).y)).tolist())
+        self.parking_index: ParkingIndex = load_parking_index(json_file)
+        self.tree: cKDTree = self.parking_index.tree
         self.threshold_max_stations: int = 10
-        self.ignore_list: dict = {}
-        self.point_list: dict = {}
-        self.bar = IncrementalBar(
-            'Bubbles Processed', max=len(self.bubbles_df.index))
+        # the number of bubbles assigned to every parking space
+        self.counts: np.ndarray = np.zeros(len(self.parking_index), dtype=np.int64)
 
     def init_csv_df(self, csv_file: str) -> pd.DataFrame:
         """
         This function reads the csv file with the filtered bubbles 
         and converts the geometries from the WKT format into shapely objects. 
+        With the in-memory handoff the bubbles of the previous step are used directly.
         Args:
             csv_file (str): The path to the csv file containing the bubbles
 
         Returns:
             pd.DataFrame: The processed dataframe
         """
-        csv_df = pd.read_csv(csv_file)
-        csv_df['hull'] = csv_df['hull'].apply(lambda x: loads(x))
+        # the bubbles may be shared with the previous step, the assignment adds columns to a copy
+        csv_df = handoff.read_wkt_csv(csv_file).drop(columns=['wkt'], errors='ignore')
         csv_df = GeoDataFrame(csv_df, geometry="hull")
         csv_df = csv_df.set_crs("EPSG:4326")
         return csv_df
 
-    def init_gdf_df(self, json_file: str) -> gpd.GeoDataFrame:
+    def find_nearest_parking_id(self, geometry: Point | LineString | Polygon) -> int:
         """
-        This function reads the geojson file with the filtered parking spaces. 
-        To be able to handle the coordinates of the parking spaces 
-        better later on, they are converted into shapely points.
+        Given a Point, LineString, or Polygon geometry object, find the nearest parking space to that geometry object.
+        The geometry represents a bubble.
+        The nearest parking space is only accepted if it was not found already x times. Where x is the number
+        of the maximal accepted amount of chargers at a parking space.
+        To make this search more efficient a cKDTree is used. The tree is built in the
+        metric CRS EPSG:3035, so the candidates are ranked by their true distance.
 
         Args:
-            json_file (str): The path to the geojson file containing the parking spaces
+        - geometry: A Point, LineString, or Polygon geometry object representing bubble for which to find the
+        nearest parking space.
 
         Returns:
-            gpd.GeoDataFrame: The processed dataframe
+        - The integer id of the nearest parking space in the parking index, -1 if every parking space is full
         """
-        geojson_gdf = gpd.read_file(json_file)
-        geojson_gdf['geometry'] = geojson_gdf['geometry'].apply(
-            lambda x: shape(x))
-        geojson_gdf['geometry'] = geojson_gdf['geometry'].set_crs("EPSG:4326")
-        return geojson_gdf
+        point = self.turn_any_geometry_into_point(geometry)
+        metric_point = self.parking_index.to_metric(point.x, point.y)
+        return int(assignment.assign_with_capacity(
+            self.tree, metric_point, self.threshold_max_stations, self.counts)[0])
 
     def find_nearest_point_ckdtree(self, geometry: Point | LineString | Polygon) -> Point:
         """
-        Given a Point, LineString, or Polygon geometry object, find the nearest point to that geometry object.
-        The geometry represents a bubble while the nearest point is the nearest parking spot.
-        The nearest point is only accepted if it was not found already x times. Where x is the number
-        of the maximal accepted amount of chargers at a parking space.
-        To make this search more efficient a cKDTree is used.
+        Same as `find_nearest_parking_id`, but returns the location of the parking space.
 
         Args:
         - geometry: A Point, LineString, or Polygon geometry object representing bubble for which to find the
@@ -84,21 +82,11 @@ class ParkingService:
         Returns:
         - A Point object representing the nearest parking space
         """
-        point = self.turn_any_geometry_into_point(geometry)
-        start_idx = 2
-        while True:
-            dist, idx = self.tree.query((point.x, point.y), k=start_idx)
-            nearest_point = self.parking_spaces_gdf.loc[idx,
-                                                        'geometry'].iloc[start_idx-2]
-            point_tuple = (nearest_point.x, nearest_point.y)
-            if point_tuple not in self.ignore_list:
-                break
-            start_idx += 1
-        self.point_list[point_tuple] = self.point_list.get(point_tuple, 0) + 1
-        if self.point_list[point_tuple] == self.threshold_max_stations:
-            self.ignore_list[point_tuple] = True
-        self.bar.next()
-        return nearest_point
+        parking_id = self.find_nearest_parking_id(geometry)
+        if parking_id < 0:
+            raise ValueError("There are not enough parking spaces to calculate this.")
+        lon, lat = self.parking_index.lonlat[parking_id]
+        return Point(lon, lat)
 
     def turn_any_geometry_into_point(self, geometry: Point | LineString | Polygon) -> Point:
         """
@@ -124,16 +112,25 @@ class ParkingService:
         """
         The method saves a file containing all found parking spaces with 
         their respective index of how many time 
-        they where chosen as the nearest point
+        they where chosen as the nearest point.
+        The counts are taken from the integer parking ids with a bincount,
+        bubbles without a parking space (id -1) are left out.
+        The result has the columns id, osm_id, lon, lat, count and the OSM attributes
+        of the parking space and is saved as parquet and as CSV.
         """
-        self.bubbles_df['nearest_point'] = self.bubbles_df['nearest_point'].apply(
-            lambda x: dumps(x))
-        unique_values = self.bubbles_df['nearest_point'].unique()
-        value_counts = self.bubbles_df['nearest_point'].value_counts(
-            normalize=False)
-        result = pd.Series(data=value_counts,
-                           index=unique_values, name='Count')
-        result.to_csv('./datasets/generated/charging_points.csv')
+        parking_ids = self.bubbles_df['parking_id'].values
+        counts = np.bincount(parking_ids[parking_ids >= 0], minlength=len(self.parking_index))
+        ids = np.flatnonzero(counts)
+        lonlat = self.parking_index.lonlat[ids]
+        result = pd.DataFrame({'id': ids,
+                               'osm_id': self.parking_index.ids[ids],
+                               'lon': lonlat[:, 0],
+                               'lat': lonlat[:, 1],
+                               'count': counts[ids]})
+        attributes = self.parking_index.attributes().iloc[ids].reset_index(drop=True)
+        result = pd.concat([result, attributes], axis=1)
+        handoff.put('./datasets/generated/charging_points.parquet', result, handoff.write_parquet)
+        handoff.put('./datasets/generated/charging_points.csv', result, handoff.write_csv)
 
     def user_input_max_station(self) -> None:
         """
@@ -142,7 +139,7 @@ class ParkingService:
         If the input is invalid, the function continues to prompt the user until a valid input is received.
         """
         min_value = math.ceil(len(self.bubbles_df) /
-                              len(self.parking_spaces_gdf))
+                              len(self.parking_index))
 
         number = user_interface_helper.fancy_input_number(
             ["  Choose The Maximum Number Of Charging Stations A Parking Space Should Have.",
@@ -152,42 +149,312 @@ class ParkingService:
 
         self.threshold_max_stations = number
 
-    def run(self) -> None:
+    def bubble_points(self) -> np.ndarray:
+        """
+        Returns the metric coordinates of the points representing the bubbles.
+
+        Returns:
+            np.ndarray: (n, 2) array with one point per bubble in EPSG:3035
+        """
+        points = [self.turn_any_geometry_into_point(hull)
+                  for hull in self.bubbles_df['hull']]
+        lon = np.array([point.x for point in points])
+        lat = np.array([point.y for point in points])
+        return self.parking_index.to_metric(lon, lat)
+
+    def assign(self) -> None:
+        """
+        Assigns all bubbles in their order to the nearest parking space that is not full yet,
+        like `find_nearest_parking_id`, but with the candidates of all bubbles queried in one batch.
+        """
+        self.counts = np.zeros(len(self.parking_index), dtype=np.int64)
+        assigned = assignment.assign_with_capacity(
+            self.tree, self.bubble_points(), self.threshold_max_stations, self.counts)
+        if (assigned < 0).any():
+            raise ValueError(
+                "There are not enough parking spaces to calculate this.")
+        self.bubbles_df['parking_id'] = assigned
+
+    def assign_sharded(self, workers: int | None = None) -> None:
+        """
+        Assigns all bubbles to parking spaces in parallel.
+        The country is split into tiles which are assigned in worker processes,
+        conflicts at the tile borders are reconciled afterwards,
+        so threshold_max_stations is respected globally.
+
+        Args:
+            workers (int, optional): The number of worker processes. Defaults to the number of cores.
+        """
+        assigned = assignment.assign_sharded(
+            self.tree, self.parking_index.xy, self.bubble_points(),
+            self.threshold_max_stations, workers=workers)
+        if (assigned < 0).any():
+            raise ValueError(
+                "There are not enough parking spaces to calculate this.")
+        self.bubbles_df['parking_id'] = assigned
+
+    def sweep(self, thresholds: list[int]) -> pd.DataFrame:
+        """
+        Compares several values of threshold_max_stations in one run.
+        The nearest parking space candidates of all bubbles are searched only once.
+        The assignments of all thresholds are saved as a parquet file in long format,
+        the summary statistics as a CSV file.
+
+        Args:
+            thresholds (list[int]): The maximum numbers of charging stations per parking space to compare
+
+        Returns:
+            pd.DataFrame: The summary with one row per threshold
+        """
+        assignments, summary = assignment.sweep_max_stations(
+            self.tree, self.bubble_points(), thresholds)
+        pd.DataFrame({
+            'threshold': np.repeat(list(assignments), len(self.bubbles_df)),
+            'bubble': np.tile(np.arange(len(self.bubbles_df)), len(assignments)),
+            'parking_id': np.concatenate(list(assignments.values())) if assignments else [],
+        }).to_parquet('./datasets/generated/threshold_sweep.parquet', index=False)
+        summary.to_csv('./datasets/generated/threshold_sweep.csv', index=False)
+        return summary
+
+    def run(self, sharded: bool = False, workers: int | None = None, threshold: int | None = None) -> None:
         """
         Runs the main algorithm to find the nearest parking space for each bubble
         and writes the results to a new CSV file. 
+
+        Args:
+            sharded (bool, optional): Assign the bubbles in parallel tiles. Defaults to False.
+            workers (int, optional): The number of worker processes in sharded mode.
+                                     Defaults to the number of cores.
+            threshold (int, optional): The maximum number of charging stations per parking space.
+                                       Defaults to asking the user.
         """
-        self.user_input_max_station()
-        self.bubbles_df['nearest_point'] = self.bubbles_df['hull'].apply(
-            lambda x: self.find_nearest_point_ckdtree(x))
-        self.bar.finish()
-        spinner = Halo("Loading")
-        spinner.start(text="Saving Charging Points")
-        self.unify_charging_points()
-        spinner.succeed()
+        if threshold is None:
+            self.user_input_max_station()
+        else:
+            self.threshold_max_stations = threshold
+        with telemetry.step("Assigning Bubbles To Parking Spaces", rows_in=len(self.bubbles_df)) as step:
+            if sharded:
+                self.assign_sharded(workers)
+            else:
+                self.assign()
+            step.rows_out = int(self.bubbles_df['parking_id'].nunique())
+        with telemetry.step("Saving Charging Points"):
+            self.unify_charging_points()
+
+
+ACCESS_VALUES = frozenset(["yes", "electric_vehicle", "customers"])
+# Only these properties are used by the later stages, everything else is dropped
+KEPT_PROPERTIES = ["id", "@id"] + ATTRIBUTES
+STATIONS_SOURCE = './datasets/Ladesaeulenregister.csv'
+# The cleaned register and the fingerprint of the register it was prepared from
+STATIONS_FILE = './datasets/generated/charging_stations.parquet'
+STATIONS_META = './datasets/generated/charging_stations.json'
+
+
+def skip_whitespace(buffer: str, pos: int, whitespace: str = ' \t\r\n') -> int:
+    """
+    Returns the position of the next character in `buffer` that is not whitespace.
+
+    Raises:
+        IndexError: If the buffer ends before such a character
+    """
+    while buffer[pos] in whitespace:
+        pos += 1
+    return pos
+
+
+def iter_features(f: TextIO, chunk_size: int = 1 << 20) -> Iterator[dict]:
+    """
+    Parses the features of a GeoJSON FeatureCollection one at a time.
+    The file is read in chunks of `chunk_size` characters, so only the
+    current feature and one chunk are held in memory at any time.
 
+    Args:
+        f (TextIO): The opened GeoJSON file
+        chunk_size (int, optional): The number of characters read at once. Defaults to 1 MiB.
 
-def filter_parking_spaces() -> None:
+    Yields:
+        dict: The next feature of the collection
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    opened = False
+    # Walk the members of the top level object up to the features array,
+    # the other members are decoded as a whole, so a "features" inside them is skipped
+    while True:
+        try:
+            pos = skip_whitespace(buffer, pos, ' \t\r\n,')
+            if not opened:
+                if buffer[pos] != '{':
+                    raise ValueError("The GeoJSON file does not contain an object")
+                opened = True
+                pos += 1
+                continue
+            if buffer[pos] == '}':
+                return
+            name, end = decoder.raw_decode(buffer, pos)
+            end = skip_whitespace(buffer, end)
+            if buffer[end] != ':':
+                raise ValueError(f"Expected ':' after the member {name!r} of the GeoJSON object")
+            end = skip_whitespace(buffer, end + 1)
+            if name == 'features':
+                if buffer[end] != '[':
+                    raise ValueError("The features of the GeoJSON object are not an array")
+                buffer = buffer[end + 1:]
+                break
+            _, end = decoder.raw_decode(buffer, end)
+            # a number at the end of the buffer may continue in the next chunk, the next character is needed
+            skip_whitespace(buffer, end)
+            pos = end
+        except (IndexError, json.JSONDecodeError):
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            buffer = buffer[pos:] + chunk
+            pos = 0
+
+    pos = 0
+    while True:
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+            pos += 1
+        if pos < len(buffer) and buffer[pos] == ']':
+            return
+        try:
+            feature, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # The feature continues in the next chunk
+            chunk = f.read(chunk_size)
+            if not chunk:
+                if pos == len(buffer):
+                    return
+                raise
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+        yield feature
+        if pos > chunk_size:
+            buffer = buffer[pos:]
+            pos = 0
+
+
+def first_coordinate(geometry: dict) -> list[float] | None:
+    """
+    Returns the first coordinate of a GeoJSON geometry, which is
+    close enough to the parking space to decide whether it lies in a region.
+    """
+    if geometry is None:
+        return None
+    if 'geometries' in geometry:
+        return first_coordinate(geometry['geometries'][0]) if geometry['geometries'] else None
+    coordinates = geometry.get('coordinates')
+    while coordinates and isinstance(coordinates[0], list):
+        coordinates = coordinates[0]
+    return coordinates or None
+
+
+def filter_parking_spaces(source: str = "./datasets/export.geojson",
+                          target: str = "./datasets/generated/filtered_parking_spaces.geojson") -> None:
     """
     Filters a GeoJSON file of parking spaces based on whether they have 
     certain access properties, and writes the
     filtered results to a new GeoJSON file.
-    """
-    with open("./datasets/export.geojson", "r", encoding="latin_1") as f:
-        data = geojson.load(f)
+    The file is streamed feature by feature and matches are written incrementally,
+    so the memory usage does not depend on the size of the national export.
+    Only the properties in KEPT_PROPERTIES are kept.
+    In a region run only the parking spaces in the extent of the region are kept.
 
-    property_name = "access"
-    property_values = ["yes", "electric_vehicle", "customers"]
+    Args:
+        source (str, optional): The GeoJSON file to filter. Defaults to "./datasets/export.geojson".
+        target (str, optional): The file to write the filtered parking spaces to.
+                                Defaults to "./datasets/generated/filtered_parking_spaces.geojson".
+    """
+    region = scope.current()
+    bounds = region.lonlat_bounds() if region is not None else None
+    with open(source, "r", encoding="latin_1") as f_in, open(target, "w") as f_out:
+        f_out.write('{"type": "FeatureCollection", "features": [')
+        separator = '\n'
+        rows_in = rows_out = 0
+        for feature in iter_features(f_in):
+            rows_in += 1
+            properties = feature.get("properties") or {}
+            if properties.get("access") not in ACCESS_VALUES:
+                continue
+            if bounds is not None:
+                coordinate = first_coordinate(feature.get("geometry"))
+                if coordinate is None or not (bounds[0] <= coordinate[0] <= bounds[2]
+                                              and bounds[1] <= coordinate[1] <= bounds[3]):
+                    continue
+            rows_out += 1
+            feature["properties"] = {key: properties[key]
+                                     for key in KEPT_PROPERTIES if key in properties}
+            f_out.write(separator)
+            f_out.write(json.dumps(feature))
+            separator = ',\n'
+        f_out.write('\n]}\n')
+    telemetry.rows(rows_in, rows_out)
+
+
+def prepare_charging_stations() -> None:
+    """
+    Reads the coordinates of the charging station register and cleans them up once.
+    Decimal commas are replaced and stray characters are removed for the whole column at once.
+    Rows whose coordinates can not be parsed are dropped.
+    The result is saved as a parquet file with the columns Latitude and Longitude,
+    the fingerprint of the register is stored next to it, see `ensure_charging_stations`.
+    In a region run only the stations in the extent of the region are kept.
+    """
+    if os.path.exists(STATIONS_META):
+        os.remove(STATIONS_META)
+    fingerprint = validation.file_fingerprint(STATIONS_SOURCE)
+    charging_stations_df = pd.read_csv(
+        STATIONS_SOURCE, sep=";", skiprows=10, encoding="latin_1",
+        usecols=['Breitengrad', "Längengrad"], dtype=str)
+    charging_stations_df.columns = ['Latitude', 'Longitude']
+    for column in charging_stations_df.columns:
+        charging_stations_df[column] = pd.to_numeric(
+            charging_stations_df[column].str.replace(',', '.', regex=False)
+                                        .str.replace('[^0-9\\.]', '', regex=True),
+            errors='coerce')
+    charging_stations_df = charging_stations_df.dropna()
+    region = scope.current()
+    if region is not None:
+        min_lon, min_lat, max_lon, max_lat = region.lonlat_bounds()
+        charging_stations_df = charging_stations_df[
+            charging_stations_df['Longitude'].between(min_lon, max_lon)
+            & charging_stations_df['Latitude'].between(min_lat, max_lat)]
+    charging_stations_df.to_parquet(STATIONS_FILE, index=False)
+    # The meta file is written last, so an interrupted run is never picked up
+    with open(STATIONS_META, 'w') as f:
+        json.dump({'fingerprint': fingerprint}, f)
+
+
+def ensure_charging_stations() -> None:
+    """
+    Prepares the cleaned charging station register, unless it was already
+    prepared from the current version of Ladesaeulenregister.csv.
+    """
+    if validation.check_generated(STATIONS_FILE) and os.path.exists(STATIONS_META):
+        with open(STATIONS_META, 'r') as f:
+            meta = json.load(f)
+        if meta['fingerprint'] == validation.file_fingerprint(STATIONS_SOURCE):
+            return
+    prepare_charging_stations()
 
-    filtered_features = []
-    for feature in data["features"]:
-        for property_value in property_values:
-            if property_name in feature["properties"] and feature["properties"][property_name] == property_value:
-                filtered_features.append(feature)
-    filtered_data = geojson.FeatureCollection(filtered_features)
 
-    with open("./datasets/generated/filtered_parking_spaces.geojson", "w") as f:
-        geojson.dump(filtered_data, f)
+def prepare_shared_parking() -> None:
+    """
+    Prepares the parking artifacts that do not depend on the scenario:
+    the filtered parking spaces, their persisted index and the charging station register.
+    Workspaces run this in their base directory before the parking stage, see helper.workspace.
+    """
+    with telemetry.step("Applying Filters To Parking Spaces"):
+        if not validation.check_generated("filtered_parking_spaces.geojson"):
+            filter_parking_spaces()
+    with telemetry.step("Building The Parking Index"):
+        load_parking_index('./datasets/generated/filtered_parking_spaces.geojson')
+    with telemetry.step("Preparing Charging Station Register"):
+        ensure_charging_stations()
 
 
 def remove_bubbles_with_charging_stations(algorithm: int) -> None:
@@ -196,6 +463,10 @@ def remove_bubbles_with_charging_stations(algorithm: int) -> None:
     bubbles that do not yet have a charging station in them. 
     The already existing charging stations are taken 
     from the charging station register. 
+    All stations are matched against the spatial index of the bubbles in one bulk query.
+    With the in-memory handoff the bubbles are taken from the bubble step and passed on without WKT.
+    In a region run only the bubbles whose centre lies inside the region are kept,
+    the bubbles in the halo around the region belong to the neighbouring regions.
 
     Args:
     - algorithm (int):  Tells about if simple_split or KMeans was used.\n
@@ -203,44 +474,32 @@ def remove_bubbles_with_charging_stations(algorithm: int) -> None:
                         if value is 2 -> KMeans
     """
     if algorithm == 1:
-        bubbles_df = pd.read_csv('./datasets/generated/hulls_split.csv')
+        bubbles_df = handoff.read_wkt_csv('./datasets/generated/hulls_split.csv')
     else:
-        bubbles_df = pd.read_csv('./datasets/generated/hulls_batched.csv')
-    bubbles_df['hull'] = bubbles_df['hull'].apply(lambda x: loads(x))
-
-    charging_stations_df = pd.read_csv(
-        './datasets/Ladesaeulenregister.csv', sep=";", skiprows=10, encoding="latin_1", usecols=['Breitengrad', "Längengrad"])
-
-    charging_stations_df.columns = ['Latitude', 'Longitude']
-    charging_stations_df['Latitude'] = charging_stations_df['Latitude'].replace(
-        ',', '.', regex=True)
-    charging_stations_df['Longitude'] = charging_stations_df['Longitude'].replace(
-        ',', '.', regex=True)
-    charging_stations_df['Latitude'] = charging_stations_df['Latitude'].replace(
-        '[^0-9\.]', '', regex=True)
-    charging_stations_df['Longitude'] = charging_stations_df['Longitude'].replace(
-        '[^0-9\.]', '', regex=True)
-    charging_stations_df = charging_stations_df.astype(float)
-
-    idx = index.Index()
-    for i, row in bubbles_df.iterrows():
-        shape = row['hull']
-        bbox = shape.bounds
-        idx.insert(i, bbox)
-
-    to_remove = set()
-    for i, row in charging_stations_df.iterrows():
-        point = Point(row['Longitude'], row['Latitude'])
-        for j in idx.intersection(point.coords[0]):
-            shape = bubbles_df.iloc[j]['hull']
-            if shape.intersects(point):
-                to_remove.add(j)
-
-    bubbles_df = bubbles_df.drop(list(to_remove))
-    bubbles_df.to_csv('./datasets/generated/filtered_bubbles.csv', index=False)
-
-
-def run_parking_search(algorithm: int) -> None:
+        bubbles_df = handoff.read_wkt_csv('./datasets/generated/hulls_batched.csv')
+    hulls = gpd.GeoSeries(bubbles_df['hull'].values, crs="EPSG:4326")
+    rows_in = len(bubbles_df)
+    region = scope.current()
+    if region is not None:
+        bounds = hulls.bounds
+        inside = region.contains(((bounds['minx'] + bounds['maxx']) / 2).values,
+                                 ((bounds['miny'] + bounds['maxy']) / 2).values)
+        bubbles_df = bubbles_df[inside].reset_index(drop=True)
+        hulls = hulls[inside].reset_index(drop=True)
+
+    ensure_charging_stations()
+    charging_stations_df = pd.read_parquet(STATIONS_FILE)
+    stations = gpd.points_from_xy(
+        charging_stations_df['Longitude'], charging_stations_df['Latitude'], crs="EPSG:4326")
+
+    _, bubble_idx = hulls.sindex.query_bulk(stations, predicate='intersects')
+
+    bubbles_df = bubbles_df.drop(bubbles_df.index[np.unique(bubble_idx)])
+    telemetry.rows(rows_in, len(bubbles_df))
+    handoff.put('./datasets/generated/filtered_bubbles.csv', bubbles_df, handoff.write_wkt_csv)
+
+
+def run_parking_search(algorithm: int, sharded: bool = False, threshold: int | None = None) -> None:
     """
     method performs all necessary steps to start the search for a suitable parking space
 
@@ -248,17 +507,43 @@ def run_parking_search(algorithm: int) -> None:
         - algorithm (int):  Tells about if simple_split or KMeans was used.\n
                             if value is 1 -> simple_split \n
                             if value is 2 -> KMeans
+        - sharded (bool):   Assign the bubbles in parallel tiles. Defaults to False.
+        - threshold (int):  The maximum number of charging stations per parking space.
+                            Defaults to asking the user.
+    """
+
+    with telemetry.step("Applying Filters To Parking Spaces"):
+        if not validation.check_generated("filtered_parking_spaces.geojson"):
+            filter_parking_spaces()
+    with telemetry.step("Filtering All Bubbles That Already Have A Charging Station"):
+        remove_bubbles_with_charging_stations(algorithm)
+    s = ParkingService('./datasets/generated/filtered_bubbles.csv',
+                       './datasets/generated/filtered_parking_spaces.geojson')
+    s.run(sharded, threshold=threshold)
+
+
+def run_threshold_sweep(algorithm: int, thresholds: list[int]) -> pd.DataFrame:
     """
+    method performs the same steps as `run_parking_search`, but assigns the bubbles
+    for every value in `thresholds` instead of asking for a single one.
+
+    Args:
+        - algorithm (int):  Tells about if simple_split or KMeans was used.\n
+                            if value is 1 -> simple_split \n
+                            if value is 2 -> KMeans
+        - thresholds (list[int]): The maximum numbers of charging stations per parking space to compare
 
-    spinner = Halo("Loading")
-    spinner.start(text="Applying Filters To Parking Spaces")
-    if not validation.check_generated("filtered_parking_spaces.geojson"):
-        filter_parking_spaces()
-    spinner.succeed()
-    spinner.start(
-        text="Filtering All Bubbles That Already Have A Charging Station")
-    remove_bubbles_with_charging_stations(algorithm)
-    spinner.succeed()
+    Returns:
+        pd.DataFrame: The summary with one row per threshold
+    """
+    with telemetry.step("Applying Filters To Parking Spaces"):
+        if not validation.check_generated("filtered_parking_spaces.geojson"):
+            filter_parking_spaces()
+    with telemetry.step("Filtering All Bubbles That Already Have A Charging Station"):
+        remove_bubbles_with_charging_stations(algorithm)
     s = ParkingService('./datasets/generated/filtered_bubbles.csv',
                        './datasets/generated/filtered_parking_spaces.geojson')
-    s.run()
+    with telemetry.step(f"Comparing {len(thresholds)} Maximum Numbers Of Charging Stations",
+                        rows_in=len(s.bubbles_df)):
+        summary = s.sweep(thresholds)
+    return summary
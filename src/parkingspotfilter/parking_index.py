@@ -0,0 +1,238 @@
+import json
+import os
+import pickle
+import sys
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from pyproj import Transformer
+from scipy.spatial import cKDTree
+from shapely.geometry import LineString, Point, Polygon
+
+from validation import validation
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+
+"""
+This module builds the spatial index over the filtered parking spaces.
+
+The index is built once in the metric CRS EPSG:3035, so that nearest neighbour
+distances are real distances in meters and not anisotropic lon/lat degrees.
+It is persisted in ./datasets/generated/parking_index together with its coordinate
+arrays and feature ids and is keyed by the fingerprint of the source GeoJSON file.
+Later runs memory-map the arrays instead of rebuilding the tree.
+"""
+
+INDEX_PATH = './datasets/generated/parking_index'
+METRIC_CRS = 'EPSG:3035'
+# Increased whenever the files of a persisted index change
+INDEX_VERSION = 2
+# The OSM attributes of the parking spaces that are kept next to the index
+ATTRIBUTES = ['access', 'parking', 'capacity', 'name']
+
+
+def geometry_to_point(geometry: Point | LineString | Polygon) -> Point:
+    """
+    Converts a parking space geometry into a single point.
+    Polygons are represented by their representative point,
+    LineStrings by their midpoint and Points by themselves.
+
+    Args:
+        geometry (Point | LineString | Polygon): The geometry of a parking space
+
+    Returns:
+        Point: The point representing the parking space
+    """
+    if geometry.geom_type == 'Point':
+        return geometry
+    if geometry.geom_type == 'LineString':
+        return geometry.interpolate(geometry.length / 2)
+    return geometry.representative_point()
+
+
+class ParkingIndex:
+    """
+    A cKDTree over the parking spaces in metric coordinates.
+
+    Attributes
+    ----------
+    tree : cKDTree
+        The tree built over `xy`.
+    xy : np.ndarray
+        (n, 2) array with the parking space coordinates in EPSG:3035.
+    lonlat : np.ndarray
+        (n, 2) array with the parking space coordinates in EPSG:4326.
+    ids : np.ndarray
+        The OSM ids of the parking spaces. The position in the arrays is the
+        integer id of a parking space.
+    path : str
+        The directory the index was loaded from, None if it was just built.
+    """
+
+    def __init__(self, tree: cKDTree, xy: np.ndarray, lonlat: np.ndarray, ids: np.ndarray,
+                 attributes: pd.DataFrame | None = None, path: str | None = None) -> None:
+        self.tree = tree
+        self.xy = xy
+        self.lonlat = lonlat
+        self.ids = ids
+        self.path = path
+        self._attributes = attributes
+        self.transformer = Transformer.from_crs(
+            "EPSG:4326", METRIC_CRS, always_xy=True)
+
+    def __len__(self) -> int:
+        return len(self.xy)
+
+    def attributes(self) -> pd.DataFrame:
+        """
+        Returns the OSM attributes of the parking spaces, one row per integer id.
+        A loaded index only reads them from disk when they are needed.
+
+        Returns:
+            pd.DataFrame: The columns of ATTRIBUTES as strings
+        """
+        if self._attributes is None:
+            self._attributes = pd.read_parquet(
+                os.path.join(self.path, 'attributes.parquet'))
+        return self._attributes
+
+    def to_metric(self, lon: np.ndarray, lat: np.ndarray) -> np.ndarray:
+        """
+        Transforms EPSG:4326 coordinates into the metric CRS of the index.
+
+        Args:
+            lon (np.ndarray): The longitudes
+            lat (np.ndarray): The latitudes
+
+        Returns:
+            np.ndarray: (n, 2) array of metric coordinates
+        """
+        x, y = self.transformer.transform(lon, lat)
+        return np.column_stack([x, y])
+
+    def save(self, path: str, fingerprint: str) -> None:
+        """
+        Persists the index into the directory `path`.
+
+        Args:
+            path (str): The directory to save the index to
+            fingerprint (str): The fingerprint of the source file the index was built from
+        """
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        np.save(os.path.join(path, 'xy.npy'), self.xy)
+        np.save(os.path.join(path, 'lonlat.npy'), self.lonlat)
+        np.save(os.path.join(path, 'ids.npy'), self.ids)
+        self.attributes().to_parquet(
+            os.path.join(path, 'attributes.parquet'), index=False)
+        with open(os.path.join(path, 'tree.pickle'), 'wb') as f:
+            pickle.dump(self.tree, f, protocol=pickle.HIGHEST_PROTOCOL)
+        # The meta file is written last, so an interrupted save is never picked up
+        with open(meta_path, 'w') as f:
+            json.dump({'fingerprint': fingerprint,
+                       'version': INDEX_VERSION,
+                       'crs': METRIC_CRS,
+                       'count': len(self.xy)}, f)
+
+    @classmethod
+    def load(cls, path: str) -> 'ParkingIndex':
+        """
+        Loads a persisted index. The coordinate arrays are memory-mapped.
+
+        Args:
+            path (str): The directory the index was saved to
+
+        Returns:
+            ParkingIndex: The loaded index
+        """
+        with open(os.path.join(path, 'tree.pickle'), 'rb') as f:
+            tree = pickle.load(f)
+        return cls(tree,
+                   np.load(os.path.join(path, 'xy.npy'), mmap_mode='r'),
+                   np.load(os.path.join(path, 'lonlat.npy'), mmap_mode='r'),
+                   np.load(os.path.join(path, 'ids.npy'), mmap_mode='r'),
+                   path=path)
+
+    @classmethod
+    def build(cls, json_file: str) -> 'ParkingIndex':
+        """
+        Builds the index from a GeoJSON file containing parking spaces.
+
+        Args:
+            json_file (str): The path to the GeoJSON file
+
+        Returns:
+            ParkingIndex: The built index
+        """
+        gdf = gpd.read_file(json_file)
+        points = gdf.geometry.apply(geometry_to_point)
+        lonlat = np.column_stack(
+            [points.x.values, points.y.values]).astype(np.float64)
+        transformer = Transformer.from_crs(
+            "EPSG:4326", METRIC_CRS, always_xy=True)
+        x, y = transformer.transform(lonlat[:, 0], lonlat[:, 1])
+        xy = np.column_stack([x, y])
+        attributes = pd.DataFrame({column: gdf[column].astype('string') if column in gdf.columns
+                                   else pd.Series(pd.NA, index=gdf.index, dtype='string')
+                                   for column in ATTRIBUTES}).reset_index(drop=True)
+        return cls(cKDTree(xy), xy, lonlat, osm_ids(gdf), attributes)
+
+
+def osm_ids(gdf: gpd.GeoDataFrame) -> np.ndarray:
+    """
+    Returns the OSM ids of the parking spaces. Overpass exports name the
+    id property either 'id' or '@id'. If neither exists, the row position is used.
+
+    Args:
+        gdf (gpd.GeoDataFrame): The parking spaces
+
+    Returns:
+        np.ndarray: A fixed width string array, so it can be memory-mapped
+    """
+    for column in ['id', '@id']:
+        if column in gdf.columns:
+            return gdf[column].astype(str).values.astype(np.str_)
+    return np.arange(len(gdf)).astype(np.str_)
+
+
+def is_current(path: str, fingerprint: str) -> bool:
+    """
+    Checks if the index saved in `path` was built from the source file with the given fingerprint.
+
+    Args:
+        path (str): The directory of the persisted index
+        fingerprint (str): The fingerprint of the source file
+
+    Returns:
+        True if the persisted index can be reused, False otherwise
+    """
+    meta_path = os.path.join(path, 'meta.json')
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path, 'r') as f:
+        meta = json.load(f)
+    return (meta.get('fingerprint') == fingerprint
+            and meta.get('version') == INDEX_VERSION
+            and meta.get('crs') == METRIC_CRS)
+
+
+def load_parking_index(json_file: str, path: str = INDEX_PATH) -> ParkingIndex:
+    """
+    Loads the persisted parking index if it is up to date with `json_file`,
+    otherwise the index is built and saved first.
+
+    Args:
+        json_file (str): The path to the GeoJSON file containing the parking spaces
+        path (str, optional): The directory of the persisted index. Defaults to INDEX_PATH.
+
+    Returns:
+        ParkingIndex: The parking index
+    """
+    fingerprint = validation.file_fingerprint(json_file)
+    if not is_current(path, fingerprint):
+        ParkingIndex.build(json_file).save(path, fingerprint)
+    return ParkingIndex.load(path)
@@ -0,0 +1,137 @@
+import argparse
+import json
+import os
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+from planning.service import PlanningService  # noqa: E402
+
+
+"""
+This module serves the queries of the PlanningService over a local HTTP endpoint.
+
+    python src/planning/server.py --root . --port 8765
+    curl 'localhost:8765/place?chargers=200&ags=07235&threshold=4'
+    curl 'localhost:8765/cover?chargers=200&ags=07235&radius=1000'
+    curl 'localhost:8765/assign?ags=07235&threshold=4'
+    curl 'localhost:8765/coverage?ags=07235&chargers=200&threshold=4&radius=1000'
+    curl 'localhost:8765/stats'
+
+The parameters can also be sent as a JSON object in the body of a POST request.
+AGS prefixes are given as a comma separated list, the bounding box as min_lon,min_lat,max_lon,max_lat.
+"""
+
+QUERIES = ['place', 'cover', 'assign', 'coverage']
+
+
+def parse_params(query: dict) -> dict:
+    """
+    Converts the parameters of a request into the arguments of a query.
+
+    Args:
+        query (dict): The parameters of the URL or of the JSON body
+
+    Returns:
+        dict: The keyword arguments of the query
+
+    Raises:
+        ValueError: If a parameter is unknown or invalid
+    """
+    params = {}
+    for key, value in query.items():
+        if isinstance(value, list) and key not in ('ags', 'bbox'):
+            value = value[-1]
+        if key == 'ags':
+            values = value if isinstance(value, list) else [value]
+            params['ags'] = [prefix for item in values for prefix in str(item).split(',') if prefix]
+        elif key == 'bbox':
+            values = value if isinstance(value, list) else [value]
+            params['bbox'] = [float(item) for value in values for item in str(value).split(',') if item]
+        elif key in ('chargers', 'threshold'):
+            params[key] = int(value)
+        elif key == 'radius':
+            params[key] = float(value)
+        else:
+            raise ValueError(f"Unknown parameter {key}")
+    return params
+
+
+def make_handler(service: PlanningService) -> type:
+    """
+    Returns a request handler class that answers the queries with `service`.
+    """
+
+    class PlanningHandler(BaseHTTPRequestHandler):
+
+        def answer(self, status: int, body: dict) -> None:
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def dispatch(self, query: dict) -> None:
+            name = urlparse(self.path).path.strip('/')
+            if name == 'stats':
+                self.answer(200, service.stats())
+                return
+            if name not in QUERIES:
+                self.answer(404, {'error': f"Unknown query {name}, use one of {', '.join(QUERIES + ['stats'])}"})
+                return
+            try:
+                result = getattr(service, name)(**parse_params(query))
+            except (TypeError, ValueError) as e:
+                self.answer(400, {'error': str(e)})
+                return
+            self.answer(200, result)
+
+        def do_GET(self) -> None:
+            self.dispatch(parse_qs(urlparse(self.path).query))
+
+        def do_POST(self) -> None:
+            length = int(self.headers.get('Content-Length') or 0)
+            try:
+                query = json.loads(self.rfile.read(length) or b'{}')
+            except json.JSONDecodeError as e:
+                self.answer(400, {'error': f"Invalid JSON: {e}"})
+                return
+            self.dispatch(query)
+
+        def log_message(self, format: str, *args) -> None:
+            pass
+
+    return PlanningHandler
+
+
+def make_server(service: PlanningService, host: str = '127.0.0.1', port: int = 8765) -> ThreadingHTTPServer:
+    """
+    Creates the HTTP server, it is started with `serve_forever`.
+
+    Args:
+        service (PlanningService): The loaded service
+        host (str, optional): The address to listen on. Defaults to localhost only.
+        port (int, optional): The port to listen on, 0 picks a free port. Defaults to 8765.
+    """
+    return ThreadingHTTPServer((host, port), make_handler(service))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Answer planning queries over HTTP.')
+    parser.add_argument('--root', default='.', help='the directory with the datasets folder of a finished run')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    service = PlanningService(args.root)
+    server = make_server(service, args.host, args.port)
+    print(f"Loaded {len(service.cells)} cells, {len(service.bubbles)} bubbles and "
+          f"{len(service.parking_index)} parking spaces in {service.load_seconds:.1f}s, "
+          f"listening on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
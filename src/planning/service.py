@@ -0,0 +1,415 @@
+import copy
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from pyproj import Transformer
+from scipy.spatial import cKDTree
+
+from evaluation.coverage import (COVERAGE_RADIUS, nearest_distance,
+                                 weighted_statistics)
+from helper import scope
+from parkingspotfilter import assignment, max_coverage
+from parkingspotfilter.parking_index import (INDEX_PATH, METRIC_CRS,
+                                             geometry_to_point,
+                                             load_parking_index)
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+
+"""
+This module answers planning queries from memory instead of running the pipeline again.
+
+The PlanningService loads the EV grid (cleared_ev.parquet), the bubble store (filtered_bubbles.csv)
+and the parking index of a finished run once. Cells and bubbles are sorted by their AGS,
+so the cells and bubbles of a region are a few slices of the arrays.
+It answers four queries for a region given by AGS prefixes and/or a bounding box, see helper.scope:
+
+    place:    where would `chargers` charging stations go, the bubbles with the most EVs first
+    cover:    where would `chargers` charging stations go to cover the most EVs within a radius
+    assign:   where would the charging stations of all bubbles of the region go
+    coverage: how far are the EVs of the region from the nearest planned or existing charging station
+
+Results are kept in an LRU cache, so repeated queries are answered without any computation.
+The HTTP endpoint in planning.server exposes the same queries.
+"""
+
+BUBBLES_FILE = './datasets/generated/filtered_bubbles.csv'
+PARKING_FILE = './datasets/generated/filtered_parking_spaces.geojson'
+GRID_FILE = './datasets/generated/cleared_ev.parquet'
+STATIONS_FILE = './datasets/generated/charging_stations.parquet'
+# number of cached query results
+CACHE_SIZE = 256
+
+
+class ResultCache:
+    """
+    A thread safe cache of query results that evicts the least recently used result.
+    """
+
+    def __init__(self, maxsize: int = CACHE_SIZE) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._results: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    def get(self, key):
+        """
+        Returns the cached result of `key` and marks it as recently used, None if it is not cached.
+        """
+        with self._lock:
+            if key not in self._results:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._results.move_to_end(key)
+            return self._results[key]
+
+    def put(self, key, result) -> None:
+        """
+        Caches a result, the least recently used result is evicted if the cache is full.
+        """
+        with self._lock:
+            self._results[key] = result
+            self._results.move_to_end(key)
+            while len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._results.clear()
+
+
+def prefix_slices(sorted_ags: np.ndarray, prefixes: list[str]) -> np.ndarray:
+    """
+    Returns the positions of the AGS that start with one of the prefixes.
+
+    Args:
+        sorted_ags (np.ndarray): The sorted AGS as a string array
+        prefixes (list[str]): The AGS prefixes, all positions if empty
+
+    Returns:
+        np.ndarray: The sorted positions
+    """
+    if not prefixes:
+        return np.arange(len(sorted_ags))
+    ranges = []
+    for prefix in prefixes:
+        # every digit sorts before '~', so the range ends behind the last AGS with the prefix
+        lo, hi = np.searchsorted(sorted_ags, [prefix, prefix + '~'])
+        ranges.append(np.arange(lo, hi))
+    return np.unique(np.concatenate(ranges))
+
+
+class PlanningService:
+    """
+    Answers placement, assignment and coverage queries from the files of a finished run.
+
+    Attributes
+    ----------
+    cells : pd.DataFrame
+        The cells of the EV grid sorted by their AGS, with the columns ags, lon, lat, x, y and EV.
+    bubbles : pd.DataFrame
+        The bubbles sorted by their AGS, with the columns ags, lon, lat, x, y and EV.
+        A bubble belongs to the AGS of the cell nearest to its representative point.
+    parking_index : ParkingIndex
+        The KD-tree over the parking spaces.
+    station_distance : np.ndarray
+        The distance in meters of every cell to the nearest existing charging station.
+    cache : ResultCache
+        The results of the last queries.
+    """
+
+    def __init__(self, root: str = '.', cache_size: int = CACHE_SIZE) -> None:
+        """
+        Loads the files of the run in `root`.
+
+        Args:
+            root (str, optional): The directory with the datasets folder. Defaults to '.'.
+            cache_size (int, optional): The number of cached query results. Defaults to CACHE_SIZE.
+        """
+        self.root = os.path.abspath(root)
+        self.cache = ResultCache(cache_size)
+        self.transformer = Transformer.from_crs("EPSG:4326", METRIC_CRS, always_xy=True)
+        start = time.perf_counter()
+        self.cells = self.load_cells()
+        self.cell_tree = cKDTree(self.cells[['x', 'y']].values)
+        self.parking_index = load_parking_index(self.path(PARKING_FILE), self.path(INDEX_PATH))
+        self.bubbles = self.load_bubbles()
+        self.station_distance = self.load_station_distance()
+        self.load_seconds = time.perf_counter() - start
+
+    def path(self, relative: str) -> str:
+        return os.path.normpath(os.path.join(self.root, relative))
+
+    def to_metric(self, lon: np.ndarray, lat: np.ndarray) -> np.ndarray:
+        x, y = self.transformer.transform(lon, lat)
+        return np.column_stack([x, y]).reshape(-1, 2)
+
+    def load_cells(self) -> pd.DataFrame:
+        """
+        Reads the EV grid and sorts it by AGS.
+
+        Returns:
+            pd.DataFrame: The cells with the columns ags, lon, lat, x, y and EV
+        """
+        df = pd.read_parquet(self.path(GRID_FILE), columns=['ags', 'x_mp_100m', 'y_mp_100m', 'EV'])
+        # after the transformation to EPSG:4326 x holds the latitude and y the longitude
+        cells = pd.DataFrame({'ags': df['ags'].astype(str).values,
+                              'lon': df['y_mp_100m'].values,
+                              'lat': df['x_mp_100m'].values,
+                              'EV': df['EV'].values})
+        xy = self.to_metric(cells['lon'].values, cells['lat'].values)
+        cells['x'], cells['y'] = xy[:, 0], xy[:, 1]
+        return cells.sort_values('ags', kind='stable').reset_index(drop=True)
+
+    def load_bubbles(self) -> pd.DataFrame:
+        """
+        Reads the bubbles without a charging station, weights them with the EVs
+        of the cells inside of them and sorts them by AGS.
+
+        Returns:
+            pd.DataFrame: The bubbles with the columns ags, lon, lat, x, y and EV
+        """
+        hulls = gpd.GeoSeries.from_wkt(pd.read_csv(self.path(BUBBLES_FILE))['hull'], crs="EPSG:4326")
+        points = hulls.apply(geometry_to_point)
+        bubbles = pd.DataFrame({'lon': points.x.values, 'lat': points.y.values})
+        xy = self.to_metric(bubbles['lon'].values, bubbles['lat'].values)
+        bubbles['x'], bubbles['y'] = xy[:, 0], xy[:, 1]
+        if len(bubbles):
+            _, nearest = self.cell_tree.query(xy)
+            bubbles['ags'] = self.cells['ags'].values[nearest]
+        else:
+            bubbles['ags'] = pd.Series(dtype=str)
+        cells = gpd.points_from_xy(self.cells['lon'], self.cells['lat'], crs="EPSG:4326")
+        cell_idx, bubble_idx = hulls.sindex.query_bulk(cells, predicate='intersects')
+        bubbles['EV'] = np.bincount(bubble_idx, weights=self.cells['EV'].values[cell_idx],
+                                    minlength=len(bubbles))
+        return bubbles.sort_values('ags', kind='stable').reset_index(drop=True)
+
+    def load_station_distance(self) -> np.ndarray:
+        """
+        Returns the distance of every cell to the nearest existing charging station,
+        infinite if there are none.
+        """
+        if not os.path.exists(self.path(STATIONS_FILE)):
+            return np.full(len(self.cells), np.inf)
+        stations = pd.read_parquet(self.path(STATIONS_FILE))
+        return nearest_distance(self.cells[['x', 'y']].values,
+                                self.to_metric(stations['Longitude'].values, stations['Latitude'].values))
+
+    def region_rows(self, df: pd.DataFrame, region: scope.Region | None) -> np.ndarray:
+        """
+        Returns the rows of the cells or bubbles that lie in the region.
+        """
+        if region is None:
+            return np.arange(len(df))
+        rows = prefix_slices(df['ags'].values, region.ags)
+        if region.bbox is not None:
+            lon, lat = df['lon'].values[rows], df['lat'].values[rows]
+            min_lon, min_lat, max_lon, max_lat = region.bbox
+            rows = rows[(lon >= min_lon) & (lon <= max_lon) & (lat >= min_lat) & (lat <= max_lat)]
+        return rows
+
+    def cached(self, query: str, params: dict, compute) -> dict:
+        """
+        Returns the cached result of a query or computes and caches it.
+        Every caller gets its own copy, so changing a result does not change the cache.
+        """
+        key = (query, json.dumps(params, sort_keys=True))
+        result = self.cache.get(key)
+        if result is None:
+            result = compute()
+            self.cache.put(key, result)
+        return copy.deepcopy(result)
+
+    def sites(self, bubble_rows: np.ndarray, threshold: int) -> tuple[pd.DataFrame, int]:
+        """
+        Assigns the bubbles in the given order to the parking spaces.
+
+        Returns:
+            tuple[pd.DataFrame, int]: The parking spaces with the columns id, osm_id, lon, lat and count,
+                                      and the number of bubbles for which no parking space was free
+        """
+        points = self.bubbles[['x', 'y']].values[bubble_rows]
+        assigned = assignment.assign_with_capacity(self.parking_index.tree, points, threshold)
+        counts = np.bincount(assigned[assigned >= 0], minlength=len(self.parking_index))
+        ids = np.flatnonzero(counts)
+        lonlat = self.parking_index.lonlat[ids]
+        sites = pd.DataFrame({'id': ids,
+                              'osm_id': self.parking_index.ids[ids],
+                              'lon': lonlat[:, 0],
+                              'lat': lonlat[:, 1],
+                              'count': counts[ids]})
+        return sites, int((assigned < 0).sum())
+
+    def placement(self, region: scope.Region | None, chargers: int | None, threshold: int) -> tuple[pd.DataFrame, int]:
+        """
+        Places charging stations for the bubbles of the region with the most EVs.
+        All bubbles of the region are placed if `chargers` is None.
+        """
+        rows = self.region_rows(self.bubbles, region)
+        rows = rows[np.argsort(-self.bubbles['EV'].values[rows], kind='stable')]
+        if chargers is not None:
+            rows = rows[:chargers]
+        return self.sites(rows, threshold)
+
+    def place(self, chargers: int, ags: list[str] | None = None, bbox: list[float] | None = None,
+              threshold: int = 10) -> dict:
+        """
+        Places `chargers` charging stations in a region. The bubbles with the most EVs get a
+        charging station first, each at the nearest parking space that has not reached `threshold` yet.
+
+        Args:
+            chargers (int): The number of charging stations to place
+            ags (list[str], optional): The AGS prefixes of the region. Defaults to all of Germany.
+            bbox (list[float], optional): The bounding box of the region. Defaults to all of Germany.
+            threshold (int, optional): The maximum number of charging stations per parking space. Defaults to 10.
+
+        Returns:
+            dict: The parking spaces with their number of charging stations and the number of
+                  charging stations that could not be placed
+        """
+        if chargers < 0 or threshold < 1:
+            raise ValueError("The number of charging stations has to be positive and the threshold at least 1")
+        region = make_region(ags, bbox)
+
+        def compute():
+            sites, unplaced = self.placement(region, chargers, threshold)
+            return {'sites': sites.to_dict('records'), 'placed': int(sites['count'].sum()), 'unplaced': unplaced}
+        return self.cached('place', {'chargers': chargers, 'region': region_key(region), 'threshold': threshold},
+                           compute)
+
+    def cover(self, chargers: int, ags: list[str] | None = None, bbox: list[float] | None = None,
+              radius: float = COVERAGE_RADIUS) -> dict:
+        """
+        Places `chargers` charging stations in a region at the parking spaces that cover the most EVs
+        within `radius` meters that are not covered by an existing charging station yet,
+        see parkingspotfilter.max_coverage.
+
+        Args:
+            chargers (int): The number of charging stations to place
+            ags (list[str], optional): The AGS prefixes of the region. Defaults to all of Germany.
+            bbox (list[float], optional): The bounding box of the region. Defaults to all of Germany.
+            radius (float, optional): The distance in meters within which an EV is covered.
+                                      Defaults to COVERAGE_RADIUS.
+
+        Returns:
+            dict: The parking spaces with the EVs they newly cover and the covered share of the EVs
+        """
+        if chargers < 0 or radius <= 0:
+            raise ValueError("The number of charging stations and the radius have to be positive")
+        region = make_region(ags, bbox)
+
+        def compute():
+            rows = self.region_rows(self.cells, region)
+            cell_xy = self.cells[['x', 'y']].values[rows]
+            ev = self.cells['EV'].values[rows]
+            weights = np.where(self.station_distance[rows] <= radius, 0.0, ev)
+            candidates = np.arange(0)
+            if len(rows):
+                (x0, y0), (x1, y1) = cell_xy.min(axis=0) - radius, cell_xy.max(axis=0) + radius
+                xy = np.asarray(self.parking_index.xy)
+                candidates = np.flatnonzero((xy[:, 0] >= x0) & (xy[:, 0] <= x1) & (xy[:, 1] >= y0) & (xy[:, 1] <= y1))
+            chosen, gains = max_coverage.place_max_coverage(
+                cell_xy, weights, np.asarray(self.parking_index.xy)[candidates], chargers, radius, workers=1)
+            ids = candidates[chosen]
+            lonlat = self.parking_index.lonlat[ids]
+            sites = pd.DataFrame({'id': ids, 'osm_id': self.parking_index.ids[ids],
+                                  'lon': lonlat[:, 0], 'lat': lonlat[:, 1], 'gain': gains})
+            total = ev.sum()
+            return {'sites': sites.to_dict('records'),
+                    'covered_before': float(ev[weights == 0].sum() / total) if total else 0.0,
+                    'covered': float((ev[weights == 0].sum() + gains.sum()) / total) if total else 0.0}
+        return self.cached('cover', {'chargers': chargers, 'region': region_key(region), 'radius': radius}, compute)
+
+    def assign(self, ags: list[str] | None = None, bbox: list[float] | None = None, threshold: int = 10) -> dict:
+        """
+        Assigns all bubbles of a region to parking spaces, like the parking stage does for a whole run.
+
+        Args:
+            ags (list[str], optional): The AGS prefixes of the region. Defaults to all of Germany.
+            bbox (list[float], optional): The bounding box of the region. Defaults to all of Germany.
+            threshold (int, optional): The maximum number of charging stations per parking space. Defaults to 10.
+
+        Returns:
+            dict: The parking spaces with their number of charging stations and the number of
+                  bubbles that could not be assigned
+        """
+        if threshold < 1:
+            raise ValueError("The threshold has to be at least 1")
+        region = make_region(ags, bbox)
+
+        def compute():
+            rows = self.region_rows(self.bubbles, region)
+            sites, unassigned = self.sites(rows, threshold)
+            return {'sites': sites.to_dict('records'), 'bubbles': len(rows), 'unassigned': unassigned}
+        return self.cached('assign', {'region': region_key(region), 'threshold': threshold}, compute)
+
+    def coverage(self, ags: list[str] | None = None, bbox: list[float] | None = None, chargers: int | None = None,
+                 threshold: int = 10, radius: float = COVERAGE_RADIUS) -> dict:
+        """
+        Measures how far the EVs of a region are from the nearest charging station,
+        planned by `place` (or `assign` if `chargers` is None) or existing.
+
+        Args:
+            ags (list[str], optional): The AGS prefixes of the region. Defaults to all of Germany.
+            bbox (list[float], optional): The bounding box of the region. Defaults to all of Germany.
+            chargers (int, optional): The number of planned charging stations. Defaults to all bubbles.
+            threshold (int, optional): The maximum number of charging stations per parking space. Defaults to 10.
+            radius (float, optional): The distance in meters within which an EV is covered.
+                                      Defaults to COVERAGE_RADIUS.
+
+        Returns:
+            dict: The EV weighted mean and percentiles of the distance and the covered share of the EVs,
+                  see evaluation.coverage
+        """
+        if (chargers is not None and chargers < 0) or threshold < 1 or radius <= 0:
+            raise ValueError("The number of charging stations has to be positive, the threshold at least 1 "
+                             "and the radius positive")
+        region = make_region(ags, bbox)
+
+        def compute():
+            sites, _ = self.placement(region, chargers, threshold)
+            rows = self.region_rows(self.cells, region)
+            planned = nearest_distance(self.cells[['x', 'y']].values[rows],
+                                       self.to_metric(sites['lon'].values, sites['lat'].values))
+            distance = np.minimum(self.station_distance[rows], planned)
+            return dict(weighted_statistics(distance, self.cells['EV'].values[rows], radius),
+                        radius=radius, planned_sites=len(sites))
+        return self.cached('coverage', {'region': region_key(region), 'chargers': chargers,
+                                        'threshold': threshold, 'radius': radius}, compute)
+
+    def stats(self) -> dict:
+        """
+        Returns the size of the loaded data and the usage of the cache.
+        """
+        return {'cells': len(self.cells), 'bubbles': len(self.bubbles), 'parking_spaces': len(self.parking_index),
+                'load_seconds': self.load_seconds, 'cached': len(self.cache),
+                'hits': self.cache.hits, 'misses': self.cache.misses}
+
+
+def make_region(ags: list[str] | None, bbox: list[float] | None) -> scope.Region | None:
+    """
+    Returns the region of a query, None for all of Germany.
+
+    Raises:
+        ValueError: If the bounding box is invalid
+    """
+    if not ags and bbox is None:
+        return None
+    return scope.Region(ags, bbox)
+
+
+def region_key(region: scope.Region | None) -> dict | None:
+    return region.to_dict() if region is not None else None
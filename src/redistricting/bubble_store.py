@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import sys
+from typing import Callable
+
+import pandas as pd
+
+from helper import executor, handoff
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+
+"""
+This module recomputes the bubbles of the Kreise whose EV estimates changed and reuses the others.
+
+The cells of the EV grid are partitioned by Kreis (the first five digits of the AGS). The bubbles of every
+partition are kept in the bubble store ./datasets/generated/bubble_store/<algorithm>/<Kreis>.csv together
+with a manifest of the digests of the cells they were computed from. An update only computes the bubbles
+of the partitions whose cells (id, coordinates and EV) changed, e.g. after a new FZ27 release changed the
+estimates of a few Kreise, with helper.executor in parallel processes. The partitions of Kreise that
+no longer have cells are removed. Afterwards the bubbles of all partitions are spliced into the usual
+bubble file, so the following stages do not notice the difference.
+
+The bubbles of the store never cross the border of a Kreis, so they differ from the ones of a national run.
+Deleting the store computes all partitions again.
+"""
+
+STORE_PATH = './datasets/generated/bubble_store'
+MANIFEST_FILE = 'manifest.json'
+# the cells of a Kreis form one partition
+PARTITION_DIGITS = 5
+# the columns of the cells the bubbles are computed from
+DIGEST_COLUMNS = ['id', 'x_mp_100m', 'y_mp_100m', 'EV']
+
+
+def partition_cells(df: pd.DataFrame) -> dict[str, pd.DataFrame]:
+    """
+    Splits the cells of the EV grid into their Kreise.
+    The cells of a partition are sorted by their id, so the bubbles do not depend on the order of the file.
+
+    Returns:
+        dict[str, pd.DataFrame]: The cells of every Kreis
+    """
+    keys = df['ags'].astype(str).str[:PARTITION_DIGITS].values
+    return {key: cells.sort_values('id').reset_index(drop=True) for key, cells in df.groupby(keys)}
+
+
+def digest(cells: pd.DataFrame, settings: str = '') -> str:
+    """
+    Returns a hash of the cells a partition is computed from and the settings of the algorithm.
+    """
+    hashed = pd.util.hash_pandas_object(cells[DIGEST_COLUMNS], index=False).values
+    return hashlib.sha1(hashed.tobytes() + settings.encode()).hexdigest()
+
+
+def partition_file(directory: str, key: str) -> str:
+    return os.path.join(directory, f'{key}.csv')
+
+
+def load_manifest(directory: str) -> dict[str, str]:
+    """
+    Returns the digests of the partitions in the store, empty if there is no store yet.
+    """
+    path = os.path.join(directory, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def write_json(value: dict, path: str) -> None:
+    with open(path, 'w') as f:
+        json.dump(value, f, sort_keys=True)
+
+
+def update_bubbles(df: pd.DataFrame, algorithm: str, find_bubbles: Callable[[pd.DataFrame], pd.DataFrame],
+                   output: str, path: str = STORE_PATH, workers: int | None = None,
+                   parameters: dict | None = None) -> list[str]:
+    """
+    Computes the bubbles of the changed partitions, stores them and writes the bubbles of all partitions to `output`.
+
+    Args:
+        df (pd.DataFrame): The cells of the EV grid
+        algorithm (str): The name of the bubble algorithm, every algorithm has its own store
+        find_bubbles (Callable[[pd.DataFrame], pd.DataFrame]): Returns the bubbles (column 'hull') of cells,
+                                                               it has to be picklable for processes
+        output (str): The bubble file of the algorithm, e.g. './datasets/generated/hulls_split.csv'
+        path (str, optional): The directory of the store. Defaults to STORE_PATH.
+        workers (int, optional): The number of worker processes. Defaults to helper.executor.
+        parameters (dict, optional): The settings of the algorithm, all partitions are computed again if they change.
+
+    Returns:
+        list[str]: The recomputed partitions
+    """
+    directory = os.path.join(path, algorithm)
+    os.makedirs(directory, exist_ok=True)
+    manifest = load_manifest(directory)
+    cells = partition_cells(df)
+    settings = json.dumps(parameters or {}, sort_keys=True)
+    digests = {key: digest(partition, settings) for key, partition in cells.items()}
+    changed = [key for key in sorted(cells)
+               if manifest.get(key) != digests[key] or not os.path.exists(partition_file(directory, key))]
+
+    recomputed = dict(zip(changed, executor.get_executor('redistricting', workers).map(
+        find_bubbles, [cells[key] for key in changed])))
+    for key, hulls in recomputed.items():
+        handoff.put(partition_file(directory, key), hulls, handoff.write_wkt_csv)
+    for key in set(manifest) - set(cells):
+        if os.path.exists(partition_file(directory, key)):
+            os.remove(partition_file(directory, key))
+    # the manifest is written after the partitions, by the same writer with the in-memory handoff
+    handoff.put(os.path.join(directory, MANIFEST_FILE), digests, write_json)
+
+    parts = [recomputed[key] if key in recomputed else handoff.read_wkt_csv(partition_file(directory, key))
+             for key in sorted(cells)]
+    hulls = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame({'hull': []})
+    handoff.put(output, hulls, handoff.write_wkt_csv)
+    return changed
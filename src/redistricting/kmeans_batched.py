@@ -1,39 +1,106 @@
-import csv
+from functools import partial
 
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-import shapely.wkt
-from halo import Halo
+from pyproj import Transformer
 from scipy.spatial import ConvexHull
 from shapely.geometry import LineString, MultiPoint, Point, Polygon
 from sklearn.cluster import MiniBatchKMeans
 
+from helper import handoff, telemetry
+from redistricting import bubble_store
 
-def run_kmeans_batched() -> None:
+HULLS_FILE = './datasets/generated/hulls_batched.csv'
+# default number of EVs per cluster
+EV_PER_CLUSTER = 10
+# the weighted fit leaves out (super-)cells with less EVs, their cells still join the nearest cluster
+DEMAND_EPSILON = 0.01
+# edge lengths in meters of the super-cells the weighted fit can run on, 100 keeps the cells of the grid
+CELL_SIZES = [100, 200, 500]
+
+
+def super_cells(data: np.ndarray, cell_size: int = 100) -> np.ndarray:
     """
-    The method performs the calculation of the bubbles using the Kmeans Batched
+    Aggregates the cells to super-cells of `cell_size` meters in EPSG:3035.
+    A super-cell has the EVs of its cells and lies at their EV weighted centre.
+
+    Args:
+        data (np.ndarray): The coordinates and EVs of the cells (y_mp_100m, x_mp_100m, EV)
+        cell_size (int, optional): The edge length of the super-cells, one of CELL_SIZES. Defaults to 100.
+
+    Returns:
+        np.ndarray: The coordinates and EVs of the super-cells
     """
-    spinner = Halo("Loading")
-    spinner.start("Reading Dataset")
-    df = pd.read_parquet("./datasets/generated/cleared_ev.parquet")
-    data = df[['y_mp_100m', 'x_mp_100m', 'EV']].values
-    spinner.succeed()
+    if cell_size not in CELL_SIZES:
+        raise ValueError(f"The super-cells have to be one of {', '.join(map(str, CELL_SIZES))} meters")
+    if cell_size == 100 or not len(data):
+        return data
+    # after the transformation to EPSG:4326 x holds the latitude and y the longitude
+    x, y = Transformer.from_crs("EPSG:4326", "EPSG:3035", always_xy=True).transform(data[:, 0], data[:, 1])
+    keys = np.column_stack([np.floor(x / cell_size), np.floor(y / cell_size)]).astype(np.int64)
+    _, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    ev = np.bincount(inverse, weights=data[:, 2])
+    # super-cells without EVs lie at the centre of their cells
+    weights = np.where(ev[inverse] > 0, data[:, 2], 1.0)
+    total = np.bincount(inverse, weights=weights)
+    return np.column_stack([np.bincount(inverse, weights=weights * data[:, 0]) / total,
+                            np.bincount(inverse, weights=weights * data[:, 1]) / total,
+                            ev])
+
+
+def fit_points(data: np.ndarray, epsilon: float = DEMAND_EPSILON, cell_size: int = 100) -> np.ndarray | None:
+    """
+    Returns the points the weighted fit runs on: the super-cells with at least `epsilon` EVs.
+    If no super-cell has that many EVs, all super-cells with EVs are used.
 
-    # Set the number of clusters to the total sum of 'ev' values divided by 10
-    num_clusters = int(np.sum(data[:, 2]) / 10)
+    Returns:
+        np.ndarray | None: The coordinates and EVs of the points, None if no cell has EVs,
+                           the clusters are fitted to the cells without weights then
+    """
+    points = super_cells(data, cell_size)
+    demand = points[points[:, 2] >= epsilon]
+    if not len(demand):
+        demand = points[points[:, 2] > 0]
+    return demand if len(demand) else None
+
+
+def cluster(data: np.ndarray, points: np.ndarray | None = None,
+            ev_per_cluster: float = EV_PER_CLUSTER) -> tuple[np.ndarray, int]:
+    """
+    Clusters the cells with MiniBatchKMeans.
+    With `points` the clusters are fitted to them, weighted with their EVs, and every cell joins the nearest cluster.
+
+    Args:
+        data (np.ndarray): The coordinates and EVs of the cells
+        points (np.ndarray, optional): The coordinates and EVs of the weighted fit, see `fit_points`.
+                                       Defaults to an unweighted fit to the cells.
+        ev_per_cluster (float, optional): The number of EVs per cluster. Defaults to EV_PER_CLUSTER.
 
-    spinner.start("Running MiniBatchKmeans")
-    kmeans = MiniBatchKMeans(n_clusters=num_clusters,
-                             batch_size=1000, n_init='auto').fit(data[:, :2])
-    spinner.succeed()
-    labels = kmeans.labels_
+    Returns:
+        tuple[np.ndarray, int]: The cluster of every cell and the number of clusters
+    """
+    fitted = data if points is None else points
+    # Set the number of clusters to the total sum of 'ev' values divided by `ev_per_cluster`
+    # (at least one and at most one per point, for the cells of a single Kreis)
+    num_clusters = min(max(int(np.nansum(data[:, 2]) / ev_per_cluster), 1), len(fitted))
+    kmeans = MiniBatchKMeans(n_clusters=num_clusters, batch_size=1000, n_init='auto')
+    if points is None:
+        return kmeans.fit(data[:, :2]).labels_, num_clusters
+    kmeans.fit(points[:, :2], sample_weight=points[:, 2])
+    return kmeans.predict(data[:, :2]), num_clusters
+
+
+def convex_hulls(data: np.ndarray, labels: np.ndarray, num_clusters: int) -> pd.DataFrame:
+    """
+    Returns the convex hulls of the clusters, lines and points for clusters of two and one cells.
 
+    Returns:
+        pd.DataFrame: The bubbles in the column 'hull'
+    """
     convex_hulls = []
     points = []
     lines = []
-
-    spinner.start("Computing Convex Hulls")
     for i in range(num_clusters):
         cluster = data[labels == i]
         if len(cluster) < 3:
@@ -48,23 +115,78 @@ def run_kmeans_batched() -> None:
         else:
             hull = ConvexHull(cluster[:, :2])
             convex_hulls.append(Polygon(cluster[hull.vertices, :2]))
+    return pd.DataFrame({'hull': convex_hulls + lines + points})
+
+
+def find_bubbles(df: pd.DataFrame, weighted: bool = False, epsilon: float = DEMAND_EPSILON,
+                 cell_size: int = 100, ev_per_cluster: float = EV_PER_CLUSTER) -> pd.DataFrame:
+    """
+    Clusters the given cells into bubbles, used by the bubble store for the cells of a Kreis.
+    See `run_kmeans_batched` for the arguments.
+
+    Returns:
+        pd.DataFrame: The bubbles in the column 'hull'
+    """
+    data = df[['y_mp_100m', 'x_mp_100m', 'EV']].values
+    points = fit_points(data, epsilon, cell_size) if weighted else None
+    return convex_hulls(data, *cluster(data, points, ev_per_cluster))
+
+
+def run_kmeans_batched(incremental: bool = False, weighted: bool = False, epsilon: float = DEMAND_EPSILON,
+                       cell_size: int = 100, ev_per_cluster: float = EV_PER_CLUSTER) -> None:
+    """
+    The method performs the calculation of the bubbles using the Kmeans Batched
+
+    Args:
+        incremental (bool, optional): Only cluster the Kreise whose cells changed since the last
+                                      incremental run, see redistricting.bubble_store. Defaults to False.
+        weighted (bool, optional): Fit the clusters to the EVs instead of the cells: weighted with the EVs,
+                                   without (super-)cells below `epsilon` EVs and on super-cells of `cell_size`
+                                   meters. Every cell joins the nearest cluster. Defaults to False.
+        epsilon (float, optional): The EVs below which the weighted fit leaves out a (super-)cell.
+                                   Defaults to DEMAND_EPSILON.
+        cell_size (int, optional): The edge length of the super-cells of the weighted fit, one of CELL_SIZES.
+                                   Defaults to 100, the cells of the grid.
+        ev_per_cluster (float, optional): The number of EVs per cluster, the size of the bubbles.
+                                          Defaults to EV_PER_CLUSTER.
+    """
+    if incremental:
+        with telemetry.step("Clustering The Changed Kreise") as step:
+            df = handoff.read_parquet("./datasets/generated/cleared_ev.parquet")
+            parameters = {'ev_per_cluster': ev_per_cluster}
+            if weighted:
+                parameters.update(weighted=weighted, epsilon=epsilon, cell_size=cell_size)
+            changed = bubble_store.update_bubbles(
+                df, 'kmeans_batched', partial(find_bubbles, weighted=weighted, epsilon=epsilon, cell_size=cell_size,
+                                              ev_per_cluster=ev_per_cluster),
+                HULLS_FILE, parameters=parameters)
+            step.rows_in = len(df)
+            step.rows_out = len(changed)
+        print(f"Recomputed the bubbles of {len(changed)} Kreise")
+        return
+
+    with telemetry.step("Reading Dataset") as step:
+        df = handoff.read_parquet("./datasets/generated/cleared_ev.parquet")
+        data = df[['y_mp_100m', 'x_mp_100m', 'EV']].values
+        step.rows_out = len(data)
+
+    points = None
+    if weighted:
+        with telemetry.step("Aggregating The Demand Of The Cells", rows_in=len(data)) as step:
+            points = fit_points(data, epsilon, cell_size)
+            step.rows_out = len(data if points is None else points)
+
+    with telemetry.step("Running MiniBatchKmeans", rows_in=len(data if points is None else points)) as step:
+        labels, num_clusters = cluster(data, points, ev_per_cluster)
+        step.rows_out = num_clusters
+
+    with telemetry.step("Computing Convex Hulls", rows_in=num_clusters) as step:
+        hulls = convex_hulls(data, labels, num_clusters)
+        step.rows_out = len(hulls)
 
-    wkt_hulls = [shapely.wkt.dumps(hull) for hull in convex_hulls]
-    wkt_lines = [shapely.wkt.dumps(line) for line in lines]
-    wkt_points = [shapely.wkt.dumps(point) for point in points]
-    spinner.succeed()
-
-    spinner.start("Saving Bubbles To Disk")
-    with open('./datasets/generated/hulls_batched.csv', 'w', newline='') as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(['hull'])
-        for wkt in wkt_hulls:
-            writer.writerow([wkt])
-        for wkt in wkt_lines:
-            writer.writerow([wkt])
-        for wkt in wkt_points:
-            writer.writerow([wkt])
-    spinner.succeed()
+    with telemetry.step("Saving Bubbles To Disk"):
+        # with the in-memory handoff the file is written in the background, see helper.handoff
+        handoff.put(HULLS_FILE, hulls, handoff.write_wkt_csv)
 
 
 # # Compute the number of ev in each cluster
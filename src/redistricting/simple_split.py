@@ -1,14 +1,19 @@
-import csv
+from functools import partial
 
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-import shapely.wkt
-from halo import Halo
 from scipy.spatial import ConvexHull
 from shapely import wkt
 from shapely.geometry import LineString, Point, Polygon
 
+from helper import handoff, telemetry
+from redistricting import bubble_store
+
+HULLS_FILE = './datasets/generated/hulls_split.csv'
+TREE_FILE = './datasets/generated/split_tree.npz'
+# an area is not split further, if both of its halves have less EVs
+EV_THRESHOLD = 8
+
 
 def add_bubble(split: pd.DataFrame, bubbles: dict) -> dict:
     """
@@ -24,14 +29,20 @@ def add_bubble(split: pd.DataFrame, bubbles: dict) -> dict:
     Returns:
         dict: The bubbles incremented by the shape resulting out of the split
     """
-    data = split[['y_mp_100m', 'x_mp_100m', 'EV']].values
-    if len(split) > 2:
+    return add_cells(split[['y_mp_100m', 'x_mp_100m', 'EV']].values, bubbles)
+
+
+def add_cells(data: np.ndarray, bubbles: dict) -> dict:
+    """
+    Adds the shape of the cells `data` (y, x, EV) to the bubbles, see `add_bubble`.
+    """
+    if len(data) > 2:
         hull = ConvexHull(data[:, :2])
         bubbles["polygons"].append(Polygon(data[hull.vertices, :2]))
-    elif len(split) == 2:
+    elif len(data) == 2:
         line = LineString(data)
         bubbles["lines"].append(line)
-    elif len(split) == 1:
+    elif len(data) == 1:
         point = Point(data[0])
         bubbles["points"].append(point)
     return bubbles
@@ -56,10 +67,11 @@ def sort(split: pd.DataFrame, sort_towards_x: bool) -> pd.DataFrame:
 
 def split_area(split: pd.DataFrame,
                #    sort_towards_x: bool = True,
-               bubbles: dict = {"polygons": [], "lines": [], "points": [], }) -> dict:
+               bubbles: dict = {"polygons": [], "lines": [], "points": [], },
+               threshold: float = EV_THRESHOLD) -> dict:
     """
     This function recursively divides the given area in half until there 
-    are less than 16 electric cars in two halves or the area cannot be divided further. 
+    are less than `threshold` electric cars in both halves or the area cannot be divided further. 
     The method decides whether to divide in x or y direction 
     based on the distance of the x or y extreme points. 
     If a sub-area cannot be further divided, then it is returned as a "bubble".
@@ -69,6 +81,7 @@ def split_area(split: pd.DataFrame,
         sort_towards_x (bool, optional): The direction towards 
                                          the split will be sorted. Defaults to True.
         bubbles (_type_, optional): All already found bubbles. Defaults to {"polygons": [], "lines": [], "points": [], }.
+        threshold (float, optional): The EVs per half below which the area is not split. Defaults to EV_THRESHOLD.
 
     Returns:
         dict: All found bubbles
@@ -83,40 +96,161 @@ def split_area(split: pd.DataFrame,
         else:
             split = sort(split, False)
         first, second = np.array_split(split, 2)
-        if first['EV'].sum() < 8 and second['EV'].sum() < 8:
+        if first['EV'].sum() < threshold and second['EV'].sum() < threshold:
             bubbles = add_bubble(split, bubbles)
         else:
-            split_area(first, bubbles)
-            split_area(second, bubbles)
+            split_area(first, bubbles, threshold)
+            split_area(second, bubbles, threshold)
     return bubbles
 
 
 def save_bubbles(
         bubbles: dict = {"polygons": [], "lines": [], "points": [], }) -> None:
     """
-    The method saves all found bubbles in WKT format to a CSV file
+    The method saves all found bubbles in WKT format to a CSV file.
+    With the in-memory handoff the bubbles are passed on as shapely objects
+    and the file is written in the background, see helper.handoff.
     Args:
         bubbles (_type_, optional): Bubbles to save. Defaults to {"polygons": [], "lines": [], "points": [], }.
     """
-    wkt_hulls = [shapely.wkt.dumps(hull) for hull in bubbles['polygons']]
-    wkt_lines = [shapely.wkt.dumps(line) for line in bubbles['lines']]
-    wkt_points = [shapely.wkt.dumps(point) for point in bubbles['points']]
+    handoff.put(HULLS_FILE, bubble_frame(bubbles), handoff.write_wkt_csv)
+
+
+def bubble_frame(bubbles: dict) -> pd.DataFrame:
+    """
+    Returns the found bubbles as a table with the shapes in the column 'hull'.
+    """
+    return pd.DataFrame({'hull': bubbles['polygons'] + bubbles['lines'] + bubbles['points']})
+
+
+def find_bubbles(df: pd.DataFrame, threshold: float = EV_THRESHOLD) -> pd.DataFrame:
+    """
+    Splits the area of the given cells into bubbles, used by the bubble store for the cells of a Kreis.
+
+    Args:
+        df (pd.DataFrame): The cells of the EV grid
+        threshold (float, optional): The EVs per half below which an area is not split. Defaults to EV_THRESHOLD.
+
+    Returns:
+        pd.DataFrame: The bubbles in the column 'hull'
+    """
+    return bubble_frame(split_area(df, {"polygons": [], "lines": [], "points": [], }, threshold))
+
+
+def build_split_tree(df: pd.DataFrame) -> dict[str, np.ndarray]:
+    """
+    Splits the area of the given cells like `split_area`, but down to single cells and without a threshold,
+    and records the complete split tree, so the bubbles of any threshold can be cut from it.
+
+    The cells are kept in one permutation `order`, every node of the tree covers the contiguous range
+    `start` to `stop` of it, sorted like `split_area` sorts the area of the node. The nodes are numbered
+    in the order `split_area` visits them, `left` and `right` are the nodes of the two halves (-1 for a single
+    cell) and `ev` the EVs of the node, summed like `split_area` sums the halves.
+
+    Args:
+        df (pd.DataFrame): The cells of the EV grid
+
+    Returns:
+        dict[str, np.ndarray]: The arrays of the tree, the cells (y, x, EV) in `cells` and their digest
+    """
+    cells = df[['y_mp_100m', 'x_mp_100m', 'EV']].to_numpy(dtype=np.float64)
+    n = len(cells)
+    order = np.arange(n, dtype=np.int64)
+    nodes = max(2 * n - 1, 0)
+    start, stop = np.zeros(nodes, dtype=np.int64), np.zeros(nodes, dtype=np.int64)
+    left, right = np.full(nodes, -1, dtype=np.int64), np.full(nodes, -1, dtype=np.int64)
+    ev = np.zeros(nodes, dtype=np.float64)
 
-    with open('./datasets/generated/hulls_split.csv', 'w', newline='') as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(['hull'])
-        for wkt in wkt_hulls:
-            writer.writerow([wkt])
-        for wkt in wkt_lines:
-            writer.writerow([wkt])
-        for wkt in wkt_points:
-            writer.writerow([wkt])
+    count = 0
+    # (start, stop, EVs, parent, is the first half) of the areas still to split, the first half on top
+    stack = [(0, n, cells[:, 2].sum(), -1, False)] if n else []
+    while stack:
+        first, last, total, parent, is_first = stack.pop()
+        node = count
+        count += 1
+        start[node], stop[node], ev[node] = first, last, total
+        if parent >= 0:
+            if is_first:
+                left[parent] = node
+            else:
+                right[parent] = node
+        if last - first == 1:
+            continue
+        area = order[first:last]
+        x, y = cells[area, 1], cells[area, 0]
+        key = x if x.max() - x.min() > y.max() - y.min() else y
+        area = area[np.argsort(key, kind='quicksort')]
+        order[first:last] = area
+        # np.array_split puts the extra cell into the first half
+        middle = (last - first + 1) // 2
+        stack.append((first + middle, last, cells[area[middle:], 2].sum(), node, False))
+        stack.append((first, first + middle, cells[area[:middle], 2].sum(), node, True))
+    return {'order': order, 'start': start, 'stop': stop, 'left': left, 'right': right, 'ev': ev,
+            'cells': cells, 'digest': np.array(bubble_store.digest(df))}
+
+
+def cut_split_tree(tree: dict[str, np.ndarray], threshold: float = EV_THRESHOLD) -> list[int]:
+    """
+    Returns the nodes of the split tree that are the bubbles of `threshold`, in the order of `split_area`:
+    the single cells and the nodes whose halves both have less EVs than `threshold`, without their descendants.
+    """
+    left, right, ev = tree['left'], tree['right'], tree['ev']
+    bubbles = []
+    stack = [0] if len(ev) else []
+    while stack:
+        node = stack.pop()
+        if left[node] < 0 or (ev[left[node]] < threshold and ev[right[node]] < threshold):
+            bubbles.append(node)
+        else:
+            stack.append(right[node])
+            stack.append(left[node])
+    return bubbles
+
+
+def tree_bubbles(tree: dict[str, np.ndarray], threshold: float = EV_THRESHOLD) -> pd.DataFrame:
+    """
+    Returns the bubbles of `threshold` cut from the split tree, the same areas `split_area` finds.
+
+    Returns:
+        pd.DataFrame: The bubbles in the column 'hull'
+    """
+    bubbles = {"polygons": [], "lines": [], "points": [], }
+    for node in cut_split_tree(tree, threshold):
+        add_cells(tree['cells'][tree['order'][tree['start'][node]:tree['stop'][node]]], bubbles)
+    return bubble_frame(bubbles)
+
+
+def write_split_tree(tree: dict[str, np.ndarray], path: str) -> None:
+    with open(path, 'wb') as f:
+        np.savez(f, **tree)
+
+
+def read_split_tree(path: str) -> dict[str, np.ndarray]:
+    with np.load(path) as f:
+        return {name: f[name] for name in f.files}
+
+
+def load_split_tree(df: pd.DataFrame) -> dict[str, np.ndarray]:
+    """
+    Returns the persisted split tree of the cells, a new one if there is none or the cells changed.
+    """
+    try:
+        tree = handoff.get(TREE_FILE, read_split_tree)
+        if str(tree['digest']) == bubble_store.digest(df):
+            return tree
+    except FileNotFoundError:
+        pass
+    tree = build_split_tree(df)
+    handoff.put(TREE_FILE, tree, write_split_tree)
+    return tree
 
 
 def plot_bubbles() -> None:
     """
     This method allows to plot the saved bubbles using matplotlib.
     """
+    import matplotlib.pyplot as plt
+
     df = pd.read_csv('./datasets/generated/hulls_split.csv')
     polygon_col_name = 'hull'
     df[polygon_col_name] = df[polygon_col_name].apply(lambda x: wkt.loads(x))
@@ -128,15 +262,33 @@ def plot_bubbles() -> None:
     plt.show()
 
 
-def run_splitting() -> None:
+def run_splitting(incremental: bool = False, threshold: float = EV_THRESHOLD) -> None:
     """
     This method runs all necessary steps to perform the simple split algorithm.
+    The split tree of the cells is built once and persisted, the bubbles of a threshold are cut from it,
+    so other thresholds do not split the area again.
+
+    Args:
+        incremental (bool, optional): Only split the Kreise whose cells changed since the last
+                                      incremental run, see redistricting.bubble_store. Defaults to False.
+        threshold (float, optional): The EVs per half below which an area is not split. Defaults to EV_THRESHOLD.
     """
-    spinner = Halo("Loading")
-    spinner.start(text="Recursively Splitting The Area To Find Bubbles")
-    df = pd.read_parquet("./datasets/generated/cleared_ev.parquet")
-    bubbles = split_area(df)
-    spinner.succeed()
-    spinner.start("Saving The Bubbles")
-    save_bubbles(bubbles)
-    spinner.succeed()
+    if incremental:
+        with telemetry.step("Splitting The Changed Kreise") as step:
+            df = handoff.read_parquet("./datasets/generated/cleared_ev.parquet")
+            changed = bubble_store.update_bubbles(df, 'simple_split', partial(find_bubbles, threshold=threshold),
+                                                  HULLS_FILE, parameters={'threshold': threshold})
+            step.rows_in = len(df)
+            step.rows_out = len(changed)
+        print(f"Recomputed the bubbles of {len(changed)} Kreise")
+        return
+    with telemetry.step("Recursively Splitting The Area Into The Split Tree") as step:
+        df = handoff.read_parquet("./datasets/generated/cleared_ev.parquet")
+        tree = load_split_tree(df)
+        step.rows_in = len(df)
+        step.rows_out = len(tree['ev'])
+    with telemetry.step("Cutting The Bubbles From The Split Tree") as step:
+        hulls = tree_bubbles(tree, threshold)
+        step.rows_out = len(hulls)
+    with telemetry.step("Saving The Bubbles"):
+        handoff.put(HULLS_FILE, hulls, handoff.write_wkt_csv)
@@ -0,0 +1,360 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import traceback
+
+from helper import handoff, scope, stages, telemetry, workspace
+from validation import validation
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+
+"""
+This module runs the pipeline without any user interaction, e.g. in batch jobs or CI.
+
+The run is configured with a JSON or YAML file and/or command line flags, flags win over the file.
+A run can be limited to a region given by AGS prefixes and/or a bounding box,
+it then works in ./regions/<key> below the working directory, see helper.scope.
+A named workspace isolates the outputs of a scenario in ./runs/<name> below that directory and shares
+the prepared grid, EV estimates and parking index read-only, so scenarios can run at the same time,
+see helper.workspace.
+Any subset or range of stages can be run. After every stage the completed stages are saved,
+so a failed run can be resumed with --resume from the first stage that did not complete.
+
+    python src/runner.py --config run.json
+    python src/runner.py --algorithm kmeans_batched --threshold 4 --from parking --to viz
+    python src/runner.py --config run.json --resume
+    python src/runner.py --ags 07235 --threshold 4
+    python src/runner.py --ags 07235 --placement max_coverage --chargers 200
+    python src/runner.py --ags 07235 --workspace kmeans-4 --algorithm kmeans_batched --threshold 4
+    python src/runner.py --handoff memory --threshold 4
+    python src/runner.py --incremental --from bubbles --threshold 4
+    python src/runner.py --stages bubbles --split-threshold 12
+    python src/runner.py --algorithm kmeans_batched --kmeans-weighted --kmeans-cell-size 200
+"""
+
+# the bubble stage runs simple_split or kmeans_batched, depending on the algorithm
+PIPELINE = ['data_helper', 'ev', 'bubbles', 'parking', 'sweep', 'coverage', 'viz']
+ALGORITHMS = {'simple_split': 1, 'kmeans_batched': 2}
+# edge lengths in meters of the super-cells of the weighted K-Means, see redistricting.kmeans_batched
+CELL_SIZES = [100, 200, 500]
+# how the parking stage places the charging stations
+PLACEMENTS = ['bubbles', 'max_coverage']
+# stages that read the shared parking artifacts, a workspace prepares them in its base directory first
+SHARED_PARKING_STAGES = ['parking', 'sweep', 'coverage']
+# files: the stages read the results of the previous stages from their files,
+# memory: the results are handed over in memory and written in the background, see helper.handoff
+HANDOFFS = ['files', 'memory']
+# stages that read the results of the previous stages from their files in any case
+FILE_STAGES = ['viz']
+DEFAULT_CONFIG = {
+    # bubble algorithm, simple_split or kmeans_batched
+    'algorithm': 'simple_split',
+    # only recompute the bubbles of the Kreise whose EV estimates changed, see redistricting.bubble_store
+    'incremental': False,
+    # simple_split does not split an area further, if both halves have less EVs
+    'split_threshold': 8,
+    # kmeans_batched fits the clusters to the EVs: weighted with the EVs, without (super-)cells below
+    # `kmeans_epsilon` EVs and on super-cells of `kmeans_cell_size` meters
+    'kmeans_weighted': False,
+    'kmeans_epsilon': 0.01,
+    'kmeans_cell_size': 100,
+    # EVs per K-Means cluster, the size of the kmeans_batched bubbles
+    'kmeans_ev_per_cluster': 10,
+    # maximum number of charging stations per parking space
+    'threshold': 10,
+    # maximum numbers of charging stations compared by the sweep stage, the stage is skipped if empty
+    'thresholds': [],
+    # bubbles: one charging station per bubble, max_coverage: `chargers` charging stations that cover
+    # the most EVs within `radius` meters, the bubble stage is skipped
+    'placement': 'bubbles',
+    'chargers': None,
+    # meters within which a charging station covers an EV, used by max_coverage and the coverage stage
+    'radius': 1000,
+    # assign the bubbles to the parking spaces in parallel tiles
+    'sharded': False,
+    # directory with the datasets folder, all relative paths are relative to it
+    'workdir': '.',
+    'maps_path': './maps',
+    'trace_path': telemetry.TRACE_PATH,
+    # stages to run, defaults to all stages of PIPELINE
+    'stages': None,
+    # region of the run, {'ags': [prefixes], 'bbox': [min_lon, min_lat, max_lon, max_lat]}, defaults to Germany
+    'region': None,
+    # name of the workspace ./runs/<name> the outputs of the run are isolated in, defaults to no workspace
+    'workspace': None,
+    # how the stages hand their results to the next stages, one of HANDOFFS
+    'handoff': 'files',
+    # write the results of the memory handoff to their files, the viz stage and --resume need them
+    'persist': True,
+}
+STATE_FILE = './datasets/generated/run_state.json'
+
+
+def load_config(path: str) -> dict:
+    """
+    Reads a run configuration from a JSON or YAML file.
+    """
+    with open(path, 'r') as f:
+        if path.endswith(('.yml', '.yaml')):
+            import yaml
+            return yaml.safe_load(f) or {}
+        return json.load(f)
+
+
+def make_config(overrides: dict) -> dict:
+    """
+    Completes a configuration with the defaults and checks its values.
+
+    Raises:
+        ValueError: If a key is unknown or a value is invalid
+    """
+    unknown = set(overrides) - set(DEFAULT_CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown configuration keys: {', '.join(sorted(unknown))}")
+    config = dict(DEFAULT_CONFIG, **overrides)
+    if config['algorithm'] not in ALGORITHMS:
+        raise ValueError(f"The algorithm has to be one of {', '.join(ALGORITHMS)}")
+    if float(config['split_threshold']) <= 0:
+        raise ValueError("The split threshold has to be positive")
+    if float(config['kmeans_epsilon']) < 0:
+        raise ValueError("The demand epsilon can not be negative")
+    if int(config['kmeans_cell_size']) not in CELL_SIZES:
+        raise ValueError(f"The super-cells have to be one of {', '.join(map(str, CELL_SIZES))} meters")
+    if float(config['kmeans_ev_per_cluster']) <= 0:
+        raise ValueError("The EVs per cluster have to be positive")
+    if int(config['threshold']) < 1 or any(int(value) < 1 for value in config['thresholds']):
+        raise ValueError("The maximum number of charging stations has to be at least 1")
+    if config['placement'] not in PLACEMENTS:
+        raise ValueError(f"The placement has to be one of {', '.join(PLACEMENTS)}")
+    if config['placement'] == 'max_coverage' and (config['chargers'] is None or int(config['chargers']) < 1):
+        raise ValueError("The max_coverage placement needs the number of charging stations")
+    if config['stages'] is not None:
+        unknown = set(config['stages']) - set(PIPELINE)
+        if unknown:
+            raise ValueError(f"Unknown stages: {', '.join(sorted(unknown))}")
+    if config['region'] is not None:
+        # raises a ValueError for an invalid region
+        scope.Region(**config['region'])
+    if config['workspace'] is not None:
+        # raises a ValueError for an invalid name
+        workspace.Workspace(config['workspace'])
+    if config['handoff'] not in HANDOFFS:
+        raise ValueError(f"The handoff has to be one of {', '.join(HANDOFFS)}")
+    if not config['persist'] and (config['handoff'] != 'memory' or config['workspace'] is not None):
+        raise ValueError("Only the memory handoff of a run without workspace can skip writing the results")
+    return config
+
+
+def select_stages(config: dict, start: str | None = None, stop: str | None = None) -> list[str]:
+    """
+    Returns the stages to run in pipeline order.
+
+    Args:
+        config (dict): The run configuration, its 'stages' limit the selection
+        start (str, optional): The first stage of the range. Defaults to the first stage.
+        stop (str, optional): The last stage of the range. Defaults to the last stage.
+    """
+    first = PIPELINE.index(start) if start else 0
+    last = PIPELINE.index(stop) if stop else len(PIPELINE) - 1
+    selected = config['stages'] if config['stages'] is not None else PIPELINE
+    return [name for name in PIPELINE[first:last + 1]
+            if name in selected and (name != 'sweep' or config['thresholds'])
+            and (name != 'bubbles' or config['placement'] == 'bubbles')]
+
+
+def config_digest(config: dict) -> str:
+    """
+    Returns a hash of the settings that change the results of the stages.
+    """
+    relevant = {key: config[key] for key in ['algorithm', 'incremental', 'split_threshold', 'kmeans_weighted', 'kmeans_epsilon',
+                                             'kmeans_cell_size', 'kmeans_ev_per_cluster', 'threshold', 'thresholds',
+                                             'sharded', 'maps_path', 'region', 'placement', 'chargers', 'radius']}
+    return hashlib.sha1(json.dumps(relevant, sort_keys=True).encode()).hexdigest()
+
+
+def load_state(digest: str) -> list[str]:
+    """
+    Returns the stages completed by the last run with the same configuration.
+    """
+    if not os.path.exists(STATE_FILE):
+        return []
+    with open(STATE_FILE, 'r') as f:
+        state = json.load(f)
+    if state.get('config') != digest:
+        print("The configuration changed since the last run, all selected stages are run")
+        return []
+    return state['completed']
+
+
+def save_state(digest: str, completed: list[str]) -> None:
+    with open(STATE_FILE, 'w') as f:
+        json.dump({'config': digest, 'completed': completed}, f)
+
+
+def run_pipeline_stage(name: str, config: dict, space: workspace.Workspace | None = None) -> None:
+    """
+    Runs one stage of PIPELINE with the settings of the configuration.
+    In a workspace the base stages run in the base directory and the shared
+    parking artifacts are prepared there before the stages that read them.
+    """
+    if space is not None and name in workspace.BASE_STAGES:
+        with space.shared():
+            run_pipeline_stage(name, config)
+        return
+    if space is not None and name in SHARED_PARKING_STAGES:
+        with space.shared():
+            stages.run_stage('shared_parking')
+    algorithm = ALGORITHMS[config['algorithm']]
+    if name == 'bubbles':
+        if config['algorithm'] == 'simple_split':
+            stages.run_stage('simple_split', incremental=bool(config['incremental']),
+                             threshold=float(config['split_threshold']))
+        else:
+            stages.run_stage('kmeans_batched', incremental=bool(config['incremental']),
+                             weighted=bool(config['kmeans_weighted']), epsilon=float(config['kmeans_epsilon']),
+                             cell_size=int(config['kmeans_cell_size']),
+                             ev_per_cluster=float(config['kmeans_ev_per_cluster']))
+    elif name == 'parking' and config['placement'] == 'max_coverage':
+        stages.run_stage('max_coverage', int(config['chargers']), float(config['radius']))
+    elif name == 'parking':
+        stages.run_stage('parking', algorithm, sharded=config['sharded'],
+                         threshold=int(config['threshold']))
+    elif name == 'sweep':
+        stages.run_stage('sweep', algorithm, [int(value) for value in config['thresholds']])
+    elif name == 'coverage':
+        stages.run_stage('coverage', float(config['radius']))
+    elif name == 'viz':
+        stages.run_stage('viz', config['maps_path'])
+    else:
+        stages.run_stage(name)
+
+
+def run(config: dict, selected: list[str], resume: bool = False) -> list[str]:
+    """
+    Runs the selected stages in the working directory of the configuration.
+    The working directory of the caller is restored afterwards.
+
+    Args:
+        config (dict): The complete run configuration
+        selected (list[str]): The stages to run
+        resume (bool, optional): Skip the stages completed by the last run. Defaults to False.
+
+    Returns:
+        list[str]: The stages that were run
+    """
+    cwd = os.getcwd()
+    try:
+        os.chdir(config['workdir'])
+        region = None
+        if config['region'] is not None:
+            region = scope.Region(**config['region'])
+            os.chdir(scope.prepare_workdir(region))
+        space = None
+        if config['workspace'] is not None:
+            space = workspace.Workspace(config['workspace'])
+            os.chdir(space.prepare())
+        validation.create_directories()
+        if 'data_helper' in selected and not validation.check_datasets():
+            raise FileNotFoundError("The datasets are incomplete, lookup the README.md")
+
+        digest = config_digest(config)
+        completed = load_state(digest) if resume else []
+        run_stages = [name for name in selected if name not in completed]
+        memory = config['handoff'] == 'memory'
+        if memory and not config['persist'] and set(run_stages) & set(FILE_STAGES):
+            raise ValueError(f"The stages {', '.join(FILE_STAGES)} read the results from their files, "
+                             "they can not run without writing them")
+        scope.set_region(region)
+        if memory:
+            handoff.enable(config['persist'])
+        try:
+            for name in run_stages:
+                print('\033[1m' + f'Stage: {name}' + '\033[0m')
+                if memory and name in FILE_STAGES:
+                    handoff.flush()
+                with telemetry.stage(name):
+                    run_pipeline_stage(name, config, space)
+                completed.append(name)
+                # the results of the memory handoff are only complete on disk after the writer is done
+                if not memory:
+                    save_state(digest, completed)
+        finally:
+            scope.set_region(None)
+            if memory:
+                handoff.disable()
+                if config['persist']:
+                    save_state(digest, completed)
+            telemetry.write_trace(config['trace_path'])
+    finally:
+        os.chdir(cwd)
+    return run_stages
+
+
+def parse_args(argv: list[str] | None = None) -> tuple[dict, argparse.Namespace]:
+    parser = argparse.ArgumentParser(description='Run the pipeline without user interaction.')
+    parser.add_argument('--config', help='JSON or YAML file with the run configuration')
+    parser.add_argument('--algorithm', choices=list(ALGORITHMS))
+    parser.add_argument('--incremental', action='store_true', default=None,
+                        help='only recompute the bubbles of the Kreise whose EV estimates changed')
+    parser.add_argument('--split-threshold', dest='split_threshold', type=float,
+                        help='EVs per half below which simple_split does not split an area further')
+    parser.add_argument('--kmeans-weighted', dest='kmeans_weighted', action='store_true', default=None,
+                        help='fit the K-Means clusters to the EVs instead of the cells')
+    parser.add_argument('--kmeans-epsilon', dest='kmeans_epsilon', type=float,
+                        help='EVs below which the weighted K-Means leaves out a (super-)cell')
+    parser.add_argument('--kmeans-cell-size', dest='kmeans_cell_size', type=int, choices=CELL_SIZES,
+                        help='edge length in meters of the super-cells of the weighted K-Means')
+    parser.add_argument('--kmeans-ev-per-cluster', dest='kmeans_ev_per_cluster', type=float,
+                        help='EVs per K-Means cluster, the size of the kmeans_batched bubbles')
+    parser.add_argument('--threshold', type=int,
+                        help='maximum number of charging stations per parking space')
+    parser.add_argument('--thresholds', type=int, nargs='+',
+                        help='maximum numbers of charging stations compared by the sweep stage')
+    parser.add_argument('--sharded', action='store_true', default=None)
+    parser.add_argument('--placement', choices=PLACEMENTS)
+    parser.add_argument('--chargers', type=int, help='number of charging stations placed by max_coverage')
+    parser.add_argument('--radius', type=float, help='meters within which a charging station covers an EV')
+    parser.add_argument('--workdir')
+    parser.add_argument('--maps-path', dest='maps_path')
+    parser.add_argument('--trace-path', dest='trace_path')
+    parser.add_argument('--ags', nargs='+', help='limit the run to the AGS prefixes, e.g. 07235')
+    parser.add_argument('--bbox', type=float, nargs=4, metavar=('MIN_LON', 'MIN_LAT', 'MAX_LON', 'MAX_LAT'),
+                        help='limit the run to the bounding box')
+    parser.add_argument('--handoff', choices=HANDOFFS,
+                        help='hand the results of the stages over in files or in memory')
+    parser.add_argument('--no-persist', dest='persist', action='store_false', default=None,
+                        help='do not write the results of the memory handoff to files')
+    parser.add_argument('--workspace', help='isolate the outputs of the run in ./runs/<name>')
+    parser.add_argument('--stages', nargs='+', choices=PIPELINE, help='only run these stages')
+    parser.add_argument('--from', dest='start', choices=PIPELINE, help='first stage to run')
+    parser.add_argument('--to', dest='stop', choices=PIPELINE, help='last stage to run')
+    parser.add_argument('--resume', action='store_true',
+                        help='skip the stages completed by the last run with the same configuration')
+    args = parser.parse_args(argv)
+
+    overrides = load_config(args.config) if args.config else {}
+    for key in DEFAULT_CONFIG:
+        if getattr(args, key, None) is not None:
+            overrides[key] = getattr(args, key)
+    if args.ags or args.bbox:
+        overrides['region'] = {'ags': args.ags, 'bbox': args.bbox}
+    return make_config(overrides), args
+
+
+def main(argv: list[str] | None = None) -> int:
+    config, args = parse_args(argv)
+    selected = select_stages(config, args.start, args.stop)
+    try:
+        run(config, selected, args.resume)
+    except Exception:
+        traceback.print_exc()
+        print("The run failed. Continue it with --resume")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+from parkingspotfilter.assignment import assign_sharded, assign_with_capacity  # noqa: E402
+
+
+class TestAssignSharded(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.parking_xy = rng.uniform(0, 200_000, size=(400, 2))
+        self.points = rng.uniform(0, 200_000, size=(1000, 2))
+        self.tree = cKDTree(self.parking_xy)
+
+    def test_capacity_is_respected_globally(self):
+        assigned = assign_sharded(self.tree, self.parking_xy, self.points, 3,
+                                  workers=1, tile_size=20_000, halo=2_000)
+        self.assertTrue((assigned >= 0).all())
+        self.assertLessEqual(np.bincount(assigned).max(), 3)
+
+    def test_result_is_independent_of_workers(self):
+        serial = assign_sharded(self.tree, self.parking_xy, self.points, 3,
+                                workers=1, tile_size=20_000, halo=2_000)
+        parallel = assign_sharded(self.tree, self.parking_xy, self.points, 3,
+                                  workers=2, tile_size=20_000, halo=2_000)
+        np.testing.assert_array_equal(serial, parallel)
+
+    def test_without_capacity_pressure_nearest_is_chosen(self):
+        distance, nearest = self.tree.query(self.points)
+        # every nearest parking space lies inside the halo
+        self.assertLess(distance.max(), 20_000)
+        assigned = assign_sharded(self.tree, self.parking_xy, self.points, len(self.points),
+                                  workers=1, tile_size=50_000, halo=20_000)
+        unsharded = assign_with_capacity(self.tree, self.points, len(self.points))
+        np.testing.assert_array_equal(unsharded, nearest)
+        np.testing.assert_array_equal(assigned, nearest)
+
+    def test_nearest_beyond_the_halo(self):
+        distance, nearest = self.tree.query(self.points)
+        beyond = distance > 5_000
+        self.assertTrue(beyond.any())
+        assigned = assign_sharded(self.tree, self.parking_xy, self.points, len(self.points),
+                                  workers=1, tile_size=50_000, halo=5_000)
+        np.testing.assert_array_equal(assigned[~beyond], nearest[~beyond])
+        # Only bubbles whose nearest parking space lies beyond the halo may differ
+        self.assertGreater((assigned == nearest).mean(), 0.95)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+import geopandas as gpd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+from visualization.bubble_pyramid import build_bubble_pyramid, tile_xy  # noqa: E402
+
+
+class TestBuildBubblePyramid(unittest.TestCase):
+    def setUp(self):
+        self.__tmp = tempfile.TemporaryDirectory()
+        self.hulls = gpd.GeoSeries.from_wkt([
+            'POLYGON ((9 50, 9.002 50, 9.002 50.002, 9 50.002, 9 50))',
+            'POLYGON ((9 50, 9.2 50, 9.2 50.2, 9.1 50.25, 9.0 50.2, 9 50))',
+            'LINESTRING (13.4 52.5, 13.401 52.5)',
+        ])
+
+    def tearDown(self):
+        self.__tmp.cleanup()
+
+    def read_tile(self, key):
+        with open(os.path.join(self.__tmp.name, 'layer', f'{key}.js')) as f:
+            content = f.read()
+        prefix = f'powerUpTiles["layer"]("{key}",'
+        self.assertTrue(content.startswith(prefix))
+        return json.loads(content[len(prefix):-3])
+
+    def test_tile_xy(self):
+        x, y = tile_xy([13.4], [52.5], 12)
+        self.assertEqual((x[0], y[0]), (2200, 1343))
+
+    def test_levels(self):
+        meta = build_bubble_pyramid(self.hulls, 'layer', self.__tmp.name, [6, 12])
+        self.assertEqual(meta['levels'], [6, 12])
+        self.assertIn('12/2200/1343', meta['tiles'])
+        x, y = tile_xy([9.1], [50.125], 12)
+        low = self.read_tile('6/33/21')['geometries']
+        high = self.read_tile(f'12/{x[0]}/{y[0]}')['geometries']
+        # At zoom 6 the small bubble is smaller than a pixel
+        self.assertEqual([g['type'] for g in low], ['Point', 'Polygon'])
+        self.assertEqual(high[0]['type'], 'Polygon')
+        self.assertLessEqual(len(low[1]['coordinates'][0]), len(high[0]['coordinates'][0]) + 1)
+
+    def test_bubbles_are_in_every_tile_they_intersect(self):
+        meta = build_bubble_pyramid(self.hulls, 'layer', self.__tmp.name, [12])
+        x0, y0 = tile_xy([9.0], [50.25], 12)
+        x1, y1 = tile_xy([9.2], [50.0], 12)
+        for x in range(x0[0], x1[0] + 1):
+            for y in range(y0[0], y1[0] + 1):
+                with self.subTest(x=x, y=y):
+                    self.assertIn(1, self.read_tile(f'12/{x}/{y}')['ids'])
+        self.assertEqual(len(meta['tiles']), (x1[0] - x0[0] + 1) * (y1[0] - y0[0] + 1) + 1)
+        # the small bubble lies in the corner tile of the large one
+        self.assertEqual(self.read_tile(f'12/{x0[0]}/{y1[0]}')['ids'], [0, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
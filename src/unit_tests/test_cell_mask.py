@@ -0,0 +1,104 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+from helper import scope  # noqa: E402
+from helper.data_helper import read_grid_file  # noqa: E402
+
+
+class TestCellMask(unittest.TestCase):
+    def setUp(self):
+        # a row of cells along the x axis, the first ten in Kreis 07235, the rest in 07231
+        self.x = np.arange(20) * 500 + 4_100_000
+        self.y = np.full(20, 2_950_000)
+        self.ags = pd.Series(['07235001'] * 10 + ['07231001'] * 10)
+
+    def test_halo(self):
+        region = scope.Region(ags=['07235'])
+        mask = region.cell_mask(self.x, self.y, self.ags)
+        # the region ends at the 10th cell, the halo reaches 2km = 4 cells further
+        self.assertEqual(list(np.flatnonzero(mask)), list(range(14)))
+        self.assertTrue(region.candidate_mask(self.x, self.y, self.ags).all())
+
+    def test_raw_grid_ags_are_corrected(self):
+        region = scope.Region(ags=['07235'])
+        with tempfile.TemporaryDirectory() as tmp:
+            file_name = os.path.join(tmp, 'grid.csv')
+            # the raw grid still has the old AGS 079... of Trier-Saarburg
+            rows = [f'id{i};0;0;{x};{y};0;0;0;0;0;0;{ags}' for i, (x, y, ags)
+                    in enumerate(zip(self.x, self.y, ['07935001'] * 10 + ['07231001'] * 10))]
+            with open(file_name, 'w') as f:
+                f.write('\n'.join(rows) + '\n')
+            rows_in, df = read_grid_file(file_name, region)
+        self.assertEqual(rows_in, 20)
+        self.assertEqual(df[11].iloc[0], '07235001')
+        mask = region.cell_mask(df[3], df[4], df[11])
+        self.assertEqual(list(np.flatnonzero(mask)), list(range(14)))
+
+    def test_other_land(self):
+        region = scope.Region(ags=['09162'])
+        self.assertFalse(region.cell_mask(self.x, self.y, self.ags).any())
+        self.assertFalse(region.candidate_mask(self.x, self.y, self.ags).any())
+
+    def test_bbox(self):
+        region = scope.Region(bbox=[9.0, 50.0, 9.5, 50.5])
+        x0, y0, x1, y1 = region.metric_bbox()
+        x = np.array([x0 - 5_000, x0 - 1_000, x0 + 500, x1 - 500, x1 + 1_000])
+        y = np.full(5, (y0 + y1) / 2)
+        mask = region.cell_mask(x, y, pd.Series(['07235001'] * 5))
+        self.assertEqual(list(mask), [False, True, True, True, True])
+        self.assertEqual(list(region.contains([8.9, 9.2], [50.2, 50.2])), [False, True])
+
+    def test_cells_are_read_once(self):
+        region = scope.Region(ags=['07235'])
+        with tempfile.TemporaryDirectory() as tmp:
+            cwd = os.getcwd()
+            os.chdir(tmp)
+            try:
+                os.makedirs('./datasets/generated')
+                # x holds the latitude, y the longitude
+                pd.DataFrame({'x_mp_100m': [50.0, 50.0], 'y_mp_100m': [9.0, 9.1],
+                              'ags': ['07235001', '07231001']}).to_parquet('./datasets/generated/cleared_ev.parquet')
+                with mock.patch.object(pd, 'read_parquet', wraps=pd.read_parquet) as read_parquet:
+                    self.assertEqual(list(region.contains([9.01, 9.09], [50.0, 50.0])), [True, False])
+                    self.assertEqual(list(region.contains([8.9], [50.1])), [True])
+                    min_lon, min_lat, max_lon, max_lat = region.lonlat_bounds(0)
+                self.assertEqual(read_parquet.call_count, 1)
+                self.assertAlmostEqual(min_lon, 9.0)
+                self.assertAlmostEqual(max_lon, 9.1)
+            finally:
+                os.chdir(cwd)
+
+    def test_parquet_filters(self):
+        region = scope.Region(ags=['07235', '09162'])
+        with tempfile.TemporaryDirectory() as tmp:
+            file_name = os.path.join(tmp, 'grid.parquet')
+            pd.DataFrame({'ags': ['06411000', '07235001', '08111000', '09162000', '10041100']}).to_parquet(file_name)
+            df = pd.read_parquet(file_name, filters=region.parquet_filters())
+        self.assertEqual(list(df['ags']), ['07235001', '09162000'])
+
+    def test_invalid_region(self):
+        with self.assertRaises(ValueError):
+            scope.Region()
+        with self.assertRaises(ValueError):
+            scope.Region(bbox=[10, 50, 9, 51])
+
+    def test_workdir_links_datasets(self):
+        with tempfile.TemporaryDirectory() as root:
+            os.makedirs(os.path.join(root, 'datasets'))
+            open(os.path.join(root, 'datasets', 'export.geojson'), 'w').close()
+            workdir = scope.prepare_workdir(scope.Region(ags=['07235'], root=root))
+            self.assertEqual(workdir, os.path.join(root, 'regions', 'ags-07235'))
+            self.assertTrue(os.path.islink(os.path.join(workdir, 'datasets', 'export.geojson')))
+            self.assertTrue(os.path.isdir(os.path.join(workdir, 'datasets', 'generated')))
+
+
+if __name__ == '__main__':
+    unittest.main()
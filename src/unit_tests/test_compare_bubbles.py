@@ -0,0 +1,50 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+from benchmark import differential  # noqa: E402
+
+
+class TestCompareBubbles(unittest.TestCase):
+    def setUp(self):
+        self.hulls = pd.Series(['POLYGON ((8 50, 8.01 50, 8.01 50.01, 8 50))',
+                                'LINESTRING (9 51, 9.001 51.001)',
+                                'POINT (10 52)'])
+
+    def test_order_and_ring_start_do_not_matter(self):
+        candidate = pd.Series(['POINT (10 52)',
+                               'POLYGON ((8.01 50, 8.01 50.01, 8 50, 8.01 50))',
+                               'LINESTRING (9 51, 9.001 51.001)'])
+        result = differential.compare_bubbles(self.hulls, candidate)
+        self.assertTrue(result['equal'])
+        self.assertEqual(result['max_distance_m'], 0.0)
+
+    def test_moved_and_missing_bubbles(self):
+        candidate = pd.Series(['POLYGON ((8 50, 8.01 50, 8.01 50.02, 8 50))', 'POINT (10 52)'])
+        result = differential.compare_bubbles(self.hulls, candidate)
+        self.assertFalse(result['equal'])
+        self.assertEqual((result['missing'], result['extra']), (2, 1))
+
+    def test_compare_tables(self):
+        reference = pd.DataFrame({'id': ['a', 'b', 'c'], 'EV': [1.0, 2.0, 3.0],
+                                  'name': pd.array(['x', pd.NA, 'z'], dtype='string')})
+        candidate = reference.iloc[[2, 0, 1]].reset_index(drop=True)
+        candidate['EV'] = candidate['EV'] * (1 + 1e-12)
+        self.assertTrue(differential.compare_tables(reference, candidate, 'id')['equal'])
+
+        candidate = reference.iloc[:2].copy()
+        candidate.loc[1, 'EV'] = 2.5
+        result = differential.compare_tables(reference, candidate, 'id')
+        self.assertEqual((result['missing'], result['mismatched'], result['columns']), (1, 1, ['EV']))
+        self.assertTrue(np.isclose(result['max_abs_diff'], 0.5))
+        # without key the rows are matched by sorting
+        self.assertTrue(differential.compare_tables(reference, reference.iloc[::-1])['equal'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+from redistricting.simple_split import (build_split_tree, cut_split_tree, find_bubbles,  # noqa: E402
+                                        read_split_tree, tree_bubbles, write_split_tree)
+
+
+class TestCutSplitTree(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.cells = pd.DataFrame({'id': [f'cell-{i}' for i in range(300)],
+                                   'x_mp_100m': 49.7 + rng.uniform(0, 0.03, 300),
+                                   'y_mp_100m': 6.6 + rng.uniform(0, 0.028, 300),
+                                   'EV': rng.exponential(0.4, 300)})
+        self.tree = build_split_tree(self.cells)
+
+    def test_the_tree_covers_every_cell(self):
+        self.assertEqual(len(self.tree['ev']), 2 * len(self.cells) - 1)
+        self.assertEqual(sorted(self.tree['order']), list(range(len(self.cells))))
+        self.assertAlmostEqual(self.tree['ev'][0], self.cells['EV'].sum())
+        for node in cut_split_tree(self.tree, 0):
+            self.assertEqual(self.tree['stop'][node] - self.tree['start'][node], 1)
+
+    def test_cuts_are_the_bubbles_of_split_area(self):
+        for threshold in [0.5, 2, 8, 40]:
+            with self.subTest(threshold=threshold):
+                expected = find_bubbles(self.cells, threshold)['hull']
+                result = tree_bubbles(self.tree, threshold)['hull']
+                self.assertEqual(len(result), len(expected))
+                self.assertTrue(all(a.equals(b) for a, b in zip(result, expected)))
+
+    def test_the_tree_is_persisted(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'split_tree.npz')
+            write_split_tree(self.tree, path)
+            tree = read_split_tree(path)
+        self.assertEqual(str(tree['digest']), str(self.tree['digest']))
+        self.assertEqual(cut_split_tree(tree, 8), cut_split_tree(self.tree, 8))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+from parkingspotfilter.parking import filter_parking_spaces, iter_features  # noqa: E402
+
+
+class TestFilterParkingSpaces(unittest.TestCase):
+    def setUp(self):
+        self.__tmp = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.__tmp.name, 'export.geojson')
+        self.target = os.path.join(self.__tmp.name, 'filtered.geojson')
+        self.features = [
+            {"type": "Feature", "id": f"way/{i}",
+             "properties": {"@id": f"way/{i}", "access": access, "amenity": "parking", "surface": "asphalt"},
+             "geometry": {"type": "Point", "coordinates": [9.0 + i / 100, 50.0]}}
+            for i, access in enumerate(["yes", "private", "customers", "no", "electric_vehicle"])
+        ]
+        self.features.append({"type": "Feature", "properties": {},
+                              "geometry": {"type": "Point", "coordinates": [9.0, 50.0]}})
+        with open(self.source, 'w') as f:
+            json.dump({"type": "FeatureCollection", "generator": "overpass-turbo",
+                       "features": self.features}, f, indent=2)
+
+    def tearDown(self):
+        self.__tmp.cleanup()
+
+    def test_iter_features_across_chunks(self):
+        with open(self.source, 'r') as f:
+            self.assertEqual(list(iter_features(f, chunk_size=7)), self.features)
+
+    def test_iter_features_empty_collection(self):
+        f = io.StringIO('{"type": "FeatureCollection", "features": []}')
+        self.assertEqual(list(iter_features(f)), [])
+
+    def test_iter_features_of_the_top_level_object(self):
+        content = json.dumps({"type": "FeatureCollection",
+                              "note": "the \"features\": [] of the export",
+                              "metadata": {"features": [{"type": "Feature", "properties": {}}], "count": 12345},
+                              "features": self.features[:2], "bbox": [9.0, 50.0, 9.1, 50.0]})
+        for chunk_size in [1, 7, 1 << 20]:
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(list(iter_features(io.StringIO(content), chunk_size)), self.features[:2])
+        self.assertEqual(list(iter_features(io.StringIO('{"type": "FeatureCollection"}'))), [])
+        with self.assertRaises(ValueError):
+            list(iter_features(io.StringIO('[{"features": []}]')))
+
+    def test_filter(self):
+        filter_parking_spaces(self.source, self.target)
+        with open(self.target, 'r') as f:
+            result = json.load(f)
+        self.assertEqual([feature["id"] for feature in result["features"]],
+                         ["way/0", "way/2", "way/4"])
+        self.assertEqual(result["features"][0]["properties"],
+                         {"@id": "way/0", "access": "yes"})
+
+
+if __name__ == '__main__':
+    unittest.main()
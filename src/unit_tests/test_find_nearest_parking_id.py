@@ -0,0 +1,66 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+from parkingspotfilter.parking import ParkingService  # noqa: E402
+
+
+class TestFindNearestParkingId(unittest.TestCase):
+    def setUp(self):
+        self.__tmp = tempfile.TemporaryDirectory()
+        self.__cwd = os.getcwd()
+        os.chdir(self.__tmp.name)
+        os.makedirs('./datasets/generated')
+        pd.DataFrame({'hull': [
+            'POINT (9.0 50.0)',
+            'POINT (9.001 50.0)',
+            'LINESTRING (9.0 50.0, 9.002 50.0)',
+        ]}).to_csv('./datasets/generated/filtered_bubbles.csv', index=False)
+        features = [
+            {"type": "Feature", "properties": {"id": "node/1", "access": "yes"},
+             "geometry": {"type": "Point", "coordinates": [9.0, 50.0]}},
+            {"type": "Feature", "properties": {"id": "node/2", "access": "yes"},
+             "geometry": {"type": "Point", "coordinates": [9.1, 50.0]}},
+        ]
+        with open('./datasets/generated/filtered_parking_spaces.geojson', 'w') as f:
+            json.dump({"type": "FeatureCollection", "features": features}, f)
+        self.service = ParkingService('./datasets/generated/filtered_bubbles.csv',
+                                      './datasets/generated/filtered_parking_spaces.geojson')
+        self.service.threshold_max_stations = 1
+
+    def tearDown(self):
+        os.chdir(self.__cwd)
+        self.__tmp.cleanup()
+
+    def test_full_parking_spaces_are_skipped(self):
+        hulls = self.service.bubbles_df['hull']
+        self.assertEqual(self.service.find_nearest_parking_id(hulls[0]), 0)
+        self.assertEqual(self.service.find_nearest_parking_id(hulls[1]), 1)
+        # every parking space is full
+        self.assertEqual(self.service.find_nearest_parking_id(hulls[2]), -1)
+        with self.assertRaises(ValueError):
+            self.service.find_nearest_point_ckdtree(hulls[2])
+
+    def test_assign_matches_the_single_search(self):
+        self.service.threshold_max_stations = 2
+        self.service.assign()
+        self.assertEqual(self.service.bubbles_df['parking_id'].tolist(), [0, 0, 1])
+        self.service.threshold_max_stations = 1
+        with self.assertRaises(ValueError):
+            self.service.assign()
+
+    def test_bubbles_without_parking_space_are_not_saved(self):
+        self.service.bubbles_df['parking_id'] = [0, 0, -1]
+        self.service.unify_charging_points()
+        result = pd.read_parquet('./datasets/generated/charging_points.parquet')
+        self.assertEqual((result['osm_id'].tolist(), result['count'].tolist()), (['node/1'], [2]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import os
+import sys
+import tempfile
+import unittest
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+from benchmark.synthetic import generate_datasets  # noqa: E402
+from validation import validation  # noqa: E402
+
+
+class TestGenerateDatasets(unittest.TestCase):
+    def setUp(self):
+        self.__tmp = tempfile.TemporaryDirectory()
+        self.__cwd = os.getcwd()
+        self.cells = generate_datasets(self.__tmp.name, kreise=3, cells_per_kreis=500, seed=1)
+        os.chdir(self.__tmp.name)
+
+    def tearDown(self):
+        os.chdir(self.__cwd)
+        self.__tmp.cleanup()
+
+    def test_datasets_are_complete(self):
+        self.assertTrue(validation.check_datasets())
+
+    def test_census_matches_grid(self):
+        census = pd.read_csv('./datasets/Zensus_Bevoelkerung_100m-Gitter.csv', sep=';')
+        path = './datasets/DE_Grid_ETRS89-LAEA_100m/geogitter'
+        grid = pd.concat([pd.read_csv(os.path.join(path, file_name), sep=';', dtype=str, header=None)
+                          for file_name in os.listdir(path)])
+        self.assertEqual(len(census), 1500)
+        self.assertTrue(census['Gitter_ID_100m'].isin(grid[0]).all())
+        self.assertEqual(grid[11].str[:5].nunique(), 3)
+
+    def test_kreise_match_vehicle_register(self):
+        fz27 = pd.read_excel('./datasets/fz27_202207.xlsx', sheet_name='FZ 27.15',
+                             skiprows=12, dtype=str, header=None)
+        fz27.drop(fz27.tail(5).index, inplace=True)
+        municipalities = pd.read_excel('./datasets/1A_EinwohnerzahlGeschlecht.xls',
+                                       sheet_name='Tabelle_1A', skiprows=12, dtype=str)
+        kreise = set(self.cells['ags'].str[:5])
+        self.assertEqual(set(fz27[2]), kreise)
+        self.assertTrue(kreise <= set(municipalities['AGS']))
+
+    def test_same_seed_same_datasets(self):
+        with tempfile.TemporaryDirectory() as root:
+            cells = generate_datasets(root, kreise=3, cells_per_kreis=500, seed=1)
+        pd.testing.assert_frame_equal(cells, self.cells)
+
+
+if __name__ == '__main__':
+    unittest.main()
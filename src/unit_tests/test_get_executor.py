@@ -0,0 +1,72 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+from helper import executor, telemetry  # noqa: E402
+
+
+def square(value):
+    return value * value
+
+
+class TestGetExecutor(unittest.TestCase):
+    def setUp(self):
+        telemetry.clear()
+
+    def tearDown(self):
+        telemetry.clear()
+
+    def test_environment(self):
+        environment = {'POWERUP_EXECUTOR': 'threads', 'POWERUP_WORKERS': '3',
+                       'POWERUP_COVERAGE_WORKERS': '5', 'POWERUP_COVERAGE_CHUNK_SIZE': '10',
+                       'POWERUP_CHUNK_SIZE': '7'}
+        with mock.patch.dict(os.environ, environment):
+            coverage = executor.get_executor('coverage', default_kind='processes')
+            heatmap = executor.get_executor('heatmap', default_chunk_size=64)
+            # arguments win over the environment
+            explicit = executor.get_executor('coverage', workers=2, chunk_size=4, kind='processes')
+        self.assertEqual((coverage.kind, coverage.workers, coverage.chunk_size), ('threads', 5, 10))
+        # the chunk size is only set per name
+        self.assertEqual((heatmap.kind, heatmap.workers, heatmap.chunk_size), ('threads', 3, 64))
+        self.assertEqual((explicit.kind, explicit.workers, explicit.chunk_size), ('processes', 2, 4))
+        self.assertEqual(executor.get_executor('coverage', workers=1).kind, 'serial')
+
+    def test_invalid_kind(self):
+        with self.assertRaises(ValueError):
+            executor.get_executor('coverage', kind='cluster')
+
+    def test_kinds_return_the_same_results(self):
+        for kind in ['serial', 'threads', 'processes']:
+            with self.subTest(kind=kind):
+                self.assertEqual(executor.get_executor('test', 2, kind=kind).map(square, range(6)),
+                                 [0, 1, 4, 9, 16, 25])
+
+    def test_chunks(self):
+        self.assertEqual(executor.get_executor('test', 2, 4).chunks(10), [(0, 4), (4, 8), (8, 10)])
+        self.assertEqual(executor.get_executor('test', 2).chunks(10), [(0, 10)])
+        self.assertEqual(executor.get_executor('test', 2, 4).chunks(0), [])
+
+    def test_tasks_are_recorded(self):
+        with telemetry.stage('coverage'):
+            with telemetry.step('Querying'):
+                executor.get_executor('test', 2, kind='threads').map(square, range(3))
+        tasks = telemetry.task_records()
+        self.assertEqual([(task['stage'], task['step'], task['kind'], task['task']) for task in tasks],
+                         [('coverage', 'Querying', 'threads', index) for index in range(3)])
+        self.assertTrue(all(task['wall_s'] >= 0 for task in tasks))
+
+    def test_tasks_advance_the_progress(self):
+        for kind in ['serial', 'threads', 'processes']:
+            with self.subTest(kind=kind):
+                progress = telemetry.Progress(None, 'Squaring', 6)
+                with mock.patch.object(telemetry, 'progress', return_value=progress) as create:
+                    executor.get_executor('test', 2, kind=kind).map(square, range(6))
+                create.assert_called_once_with(6)
+                self.assertEqual(progress.count, 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
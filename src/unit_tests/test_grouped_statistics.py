@@ -0,0 +1,50 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+from evaluation import coverage  # noqa: E402
+
+
+def reference_percentile(distance, weights, q):
+    order = np.argsort(distance, kind='stable')
+    share = np.cumsum(weights[order]) / weights.sum()
+    return distance[order][np.searchsorted(share, q / 100)]
+
+
+class TestGroupedStatistics(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.codes = rng.integers(0, 7, 500)
+        self.distance = rng.uniform(0, 3_000, 500)
+        self.weights = rng.gamma(1, 0.5, 500)
+
+    def test_matches_reference(self):
+        result = coverage.grouped_statistics(self.codes, self.distance, self.weights, radius=1_000)
+        for group in range(7):
+            mask = self.codes == group
+            distance, weights = self.distance[mask], self.weights[mask]
+            row = result.iloc[group]
+            self.assertEqual(row['cells'], mask.sum())
+            self.assertAlmostEqual(row['mean'], np.average(distance, weights=weights))
+            self.assertAlmostEqual(row['covered'], weights[distance <= 1_000].sum() / weights.sum())
+            for q in coverage.QUANTILES:
+                self.assertEqual(row[f'p{q}'], reference_percentile(distance, weights, q))
+
+    def test_weighted_statistics_without_chargers(self):
+        distance = coverage.nearest_distance(np.zeros((3, 2)), np.empty((0, 2)))
+        result = coverage.weighted_statistics(distance, np.ones(3))
+        self.assertEqual((result['cells'], result['covered'], result['p50']), (3, 0.0, None))
+
+    def test_chunks_match_single_query(self):
+        rng = np.random.default_rng(2)
+        points, chargers = rng.uniform(0, 10_000, (1_000, 2)), rng.uniform(0, 10_000, (50, 2))
+        expected = np.min(np.linalg.norm(points[:, None] - chargers[None], axis=2), axis=1)
+        np.testing.assert_allclose(coverage.nearest_distance(points, chargers, chunk_size=64, workers=4), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+from parkingspotfilter.parking_index import load_parking_index  # noqa: E402
+
+
+class TestLoadParkingIndex(unittest.TestCase):
+    def setUp(self):
+        self.__tmp = tempfile.TemporaryDirectory()
+        self.json_file = os.path.join(self.__tmp.name, 'parking.geojson')
+        self.index_path = os.path.join(self.__tmp.name, 'parking_index')
+        features = [
+            {"type": "Feature", "properties": {"id": "node/1", "access": "yes"},
+             "geometry": {"type": "Point", "coordinates": [9.0, 50.0]}},
+            {"type": "Feature", "properties": {"id": "way/2", "access": "yes"},
+             "geometry": {"type": "Polygon", "coordinates": [[[9.1, 50.0], [9.101, 50.0], [9.101, 50.001], [9.1, 50.001], [9.1, 50.0]]]}},
+            {"type": "Feature", "properties": {"id": "node/3", "access": "customers"},
+             "geometry": {"type": "Point", "coordinates": [9.0, 50.1]}},
+        ]
+        with open(self.json_file, 'w') as f:
+            json.dump({"type": "FeatureCollection", "features": features}, f)
+
+    def tearDown(self):
+        self.__tmp.cleanup()
+
+    def test_index_is_metric(self):
+        parking_index = load_parking_index(self.json_file, self.index_path)
+        self.assertEqual(len(parking_index), 3)
+        self.assertEqual(list(parking_index.ids), ['node/1', 'way/2', 'node/3'])
+        # 0.1 degrees of latitude are ~11.1km, 0.1 degrees of longitude at 50°N only ~7.2km
+        dist, idx = parking_index.tree.query(
+            parking_index.to_metric(9.0, 50.0)[0], k=3)
+        self.assertEqual(list(idx), [0, 1, 2])
+        self.assertAlmostEqual(dist[1] / 1000, 7.2, delta=0.2)
+        self.assertAlmostEqual(dist[2] / 1000, 11.1, delta=0.2)
+
+    def test_index_is_reused(self):
+        load_parking_index(self.json_file, self.index_path)
+        tree_file = os.path.join(self.index_path, 'tree.pickle')
+        mtime = os.stat(tree_file).st_mtime_ns
+        parking_index = load_parking_index(self.json_file, self.index_path)
+        self.assertEqual(os.stat(tree_file).st_mtime_ns, mtime)
+        self.assertIsInstance(parking_index.xy, np.memmap)
+
+    def test_attributes(self):
+        load_parking_index(self.json_file, self.index_path)
+        attributes = load_parking_index(self.json_file, self.index_path).attributes()
+        self.assertEqual(attributes['access'].tolist(), ['yes', 'yes', 'customers'])
+        self.assertTrue(attributes['name'].isna().all())
+
+
+if __name__ == '__main__':
+    unittest.main()
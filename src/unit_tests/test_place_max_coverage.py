@@ -0,0 +1,65 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+from parkingspotfilter import max_coverage  # noqa: E402
+
+
+class TestPlaceMaxCoverage(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        # towns far apart from each other, so the parking spaces form several components
+        towns = rng.uniform(0, 100_000, (6, 2))
+        self.cells = towns[rng.integers(0, 6, 3_000)] + rng.normal(0, 1_000, (3_000, 2))
+        self.weights = rng.gamma(1, 0.5, 3_000)
+        self.candidates = self.cells[rng.choice(3_000, 300, replace=False)] + rng.normal(0, 100, (300, 2))
+
+    def test_matches_plain_greedy(self):
+        indptr, indices = max_coverage.coverage_lists(self.cells, self.candidates, 800)
+        lists = [indices[indptr[i]:indptr[i + 1]] for i in range(len(self.candidates))]
+        covered = np.zeros(len(self.weights), dtype=bool)
+        expected = []
+        for _ in range(20):
+            gains = [self.weights[cells[~covered[cells]]].sum() for cells in lists]
+            expected.append(int(np.argmax(gains)))
+            covered[lists[expected[-1]]] = True
+        chosen, gains = max_coverage.place_max_coverage(self.cells, self.weights, self.candidates, 20, 800, workers=1)
+        self.assertEqual(chosen.tolist(), expected)
+        self.assertTrue(np.all(np.diff(gains) <= 0))
+
+    def test_coverage_lists(self):
+        indptr, indices = max_coverage.coverage_lists(self.cells, self.candidates[:5], 800)
+        for i in range(5):
+            distance = np.linalg.norm(self.cells - self.candidates[i], axis=1)
+            self.assertEqual(sorted(indices[indptr[i]:indptr[i + 1]].tolist()),
+                             np.flatnonzero(distance <= 800).tolist())
+
+    def test_workers_do_not_change_result(self):
+        serial = max_coverage.place_max_coverage(self.cells, self.weights, self.candidates, 40, 800, workers=1)
+        parallel = max_coverage.place_max_coverage(self.cells, self.weights, self.candidates, 40, 800, workers=3)
+        np.testing.assert_array_equal(serial[0], parallel[0])
+        np.testing.assert_allclose(serial[1], parallel[1])
+
+    def test_covered_cells_have_no_gain(self):
+        chosen, gains = max_coverage.place_max_coverage(self.cells, np.zeros(len(self.cells)),
+                                                        self.candidates, 10, 800, workers=1)
+        self.assertEqual((len(chosen), len(gains)), (0, 0))
+
+    def test_candidates_without_cells(self):
+        # the last parking space covers no cell
+        candidates = np.vstack([self.cells[:10], [[1e6, 1e6]]])
+        for workers in [1, 3]:
+            with self.subTest(workers=workers):
+                chosen, gains = max_coverage.place_max_coverage(self.cells, self.weights, candidates, 5, 800,
+                                                                workers=workers)
+                self.assertEqual(len(chosen), 5)
+                self.assertNotIn(10, chosen.tolist())
+                self.assertTrue(np.all(gains > 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+from planning.server import make_server  # noqa: E402
+from planning.service import PlanningService  # noqa: E402
+
+
+class TestPlanningService(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.__tmp = tempfile.TemporaryDirectory()
+        generated = os.path.join(cls.__tmp.name, 'datasets', 'generated')
+        os.makedirs(generated)
+        # two Kreise of 10 x 10 cells, 07235 around 9.0°E and 07111 around 9.2°E
+        lon, lat = np.meshgrid(np.arange(10) * 0.0014, np.arange(10) * 0.0009)
+        cells = []
+        for ags, offset, ev in [('07235001', 9.0, 0.5), ('07111001', 9.2, 0.1)]:
+            cells.append(pd.DataFrame({'id': [f'{ags}-{i}' for i in range(100)], 'ags': ags,
+                                       'x_mp_100m': 50.0 + lat.ravel(), 'y_mp_100m': offset + lon.ravel(),
+                                       'Einwohner': 10, 'EV': ev}))
+        pd.concat(cells, ignore_index=True).to_parquet(os.path.join(generated, 'cleared_ev.parquet'))
+        pd.DataFrame({'hull': [
+            'POLYGON ((9.0 50.0, 9.006 50.0, 9.006 50.004, 9.0 50.004, 9.0 50.0))',
+            'POLYGON ((9.007 50.005, 9.0126 50.005, 9.0126 50.0081, 9.007 50.0081, 9.007 50.005))',
+            'POLYGON ((9.2 50.0, 9.2126 50.0, 9.2126 50.0081, 9.2 50.0081, 9.2 50.0))',
+        ]}).to_csv(os.path.join(generated, 'filtered_bubbles.csv'), index=False)
+        features = [{"type": "Feature", "properties": {"id": f"node/{i}", "access": "yes"},
+                     "geometry": {"type": "Point", "coordinates": coordinates}}
+                    for i, coordinates in enumerate([[9.003, 50.002], [9.01, 50.006], [9.206, 50.004]])]
+        with open(os.path.join(generated, 'filtered_parking_spaces.geojson'), 'w') as f:
+            json.dump({"type": "FeatureCollection", "features": features}, f)
+        cls.service = PlanningService(cls.__tmp.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.__tmp.cleanup()
+
+    def test_place(self):
+        result = self.service.place(1, ags=['07235'], threshold=1)
+        self.assertEqual(([site['osm_id'] for site in result['sites']], result['placed'], result['unplaced']),
+                         (['node/0'], 1, 0))
+        # the bubbles with the most EVs get a charging station first, the full parking space is skipped
+        result = self.service.place(3, threshold=1)
+        self.assertEqual((result['placed'], result['unplaced']), (3, 0))
+        with self.assertRaises(ValueError):
+            self.service.place(-1)
+
+    def test_assign(self):
+        result = self.service.assign(ags=['07111'])
+        self.assertEqual(([site['osm_id'] for site in result['sites']], result['bubbles']), (['node/2'], 1))
+        result = self.service.assign(threshold=1)
+        self.assertEqual((result['bubbles'], result['unassigned']), (3, 0))
+
+    def test_coverage(self):
+        result = self.service.coverage(ags=['07235'], radius=2000)
+        self.assertEqual(result['planned_sites'], 2)
+        self.assertAlmostEqual(result['covered'], 1.0)
+        for arguments in [{'chargers': -1}, {'threshold': 0}, {'radius': 0}]:
+            with self.subTest(**arguments):
+                with self.assertRaises(ValueError):
+                    self.service.coverage(**arguments)
+
+    def test_results_are_copies(self):
+        result = self.service.assign()
+        result['sites'].clear()
+        self.assertEqual(len(self.service.assign()['sites']), 3)
+
+    def test_server(self):
+        server = make_server(self.service, port=0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            url = f'http://127.0.0.1:{server.server_port}'
+            with urlopen(f'{url}/place?chargers=1&ags=07111&threshold=1') as response:
+                self.assertEqual([site['osm_id'] for site in json.load(response)['sites']], ['node/2'])
+            with self.assertRaises(HTTPError) as error:
+                urlopen(f'{url}/coverage?chargers=-1')
+            self.assertEqual(error.exception.code, 400)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+import runner  # noqa: E402
+from helper import workspace  # noqa: E402
+
+
+class TestPrepareWorkspace(unittest.TestCase):
+    def setUp(self):
+        self.__tmp = tempfile.TemporaryDirectory()
+        self.__cwd = os.getcwd()
+        self.base = os.path.realpath(self.__tmp.name)
+        os.makedirs(os.path.join(self.base, 'datasets', 'generated'))
+        for name in ['datasets/export.geojson', 'datasets/generated/cleared_ev.parquet',
+                     'datasets/generated/filtered_bubbles.csv']:
+            with open(os.path.join(self.base, name), 'w') as f:
+                f.write('base')
+
+    def tearDown(self):
+        os.chdir(self.__cwd)
+        self.__tmp.cleanup()
+
+    def read(self, *parts):
+        with open(os.path.join(*parts)) as f:
+            return f.read()
+
+    def test_shares_base_artifacts_and_isolates_outputs(self):
+        first = workspace.Workspace('first', self.base).prepare()
+        second = workspace.Workspace('second', self.base).prepare()
+        self.assertEqual(first, os.path.join(self.base, 'runs', 'first'))
+        for path in [first, second]:
+            self.assertTrue(os.path.islink(os.path.join(path, 'datasets', 'export.geojson')))
+            self.assertEqual(self.read(path, 'datasets', 'generated', 'cleared_ev.parquet'), 'base')
+            # outputs of a scenario are not shared
+            self.assertFalse(os.path.exists(os.path.join(path, 'datasets', 'generated', 'filtered_bubbles.csv')))
+        with open(os.path.join(first, 'datasets', 'generated', 'filtered_bubbles.csv'), 'w') as f:
+            f.write('first')
+        self.assertFalse(os.path.exists(os.path.join(second, 'datasets', 'generated', 'filtered_bubbles.csv')))
+        self.assertEqual(self.read(self.base, 'datasets', 'generated', 'filtered_bubbles.csv'), 'base')
+
+    def test_shared_links_new_artifacts(self):
+        space = workspace.Workspace('first', self.base)
+        os.chdir(space.prepare())
+        with space.shared() as base:
+            self.assertEqual(os.getcwd(), base)
+            with open('./datasets/generated/charging_stations.parquet', 'w') as f:
+                f.write('stations')
+        self.assertEqual(os.getcwd(), space.path)
+        self.assertEqual(self.read('datasets', 'generated', 'charging_stations.parquet'), 'stations')
+
+    def test_invalid_name(self):
+        for name in ['', '..', '../other', 'a/b']:
+            with self.assertRaises(ValueError):
+                workspace.Workspace(name, self.base)
+        with self.assertRaises(ValueError):
+            runner.make_config({'workspace': '../other'})
+
+    def test_runner_runs_base_stages_in_base(self):
+        calls = []
+
+        def run_stage(name, *args, **kwargs):
+            calls.append((name, os.getcwd()))
+
+        config = runner.make_config({'workdir': self.base, 'workspace': 'kmeans', 'algorithm': 'kmeans_batched'})
+        with mock.patch.object(runner.stages, 'run_stage', side_effect=run_stage):
+            runner.run(config, ['ev', 'bubbles', 'parking'])
+        path = os.path.join(self.base, 'runs', 'kmeans')
+        self.assertEqual(calls, [('ev', self.base), ('kmeans_batched', path),
+                                 ('shared_parking', self.base), ('parking', path)])
+        self.assertTrue(os.path.exists(os.path.join(path, 'datasets', 'generated', 'run_state.json')))
+        self.assertFalse(os.path.exists(os.path.join(self.base, 'datasets', 'generated', 'run_state.json')))
+
+
+if __name__ == '__main__':
+    unittest.main()
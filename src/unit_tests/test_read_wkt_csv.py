@@ -0,0 +1,60 @@
+import os
+import sys
+import tempfile
+import unittest
+
+import pandas as pd
+import shapely.wkt
+from shapely.geometry import LineString, Point
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+from helper import handoff  # noqa: E402
+
+
+class TestReadWktCsv(unittest.TestCase):
+    def setUp(self):
+        self.__tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.__tmp.name, 'hulls_split.csv')
+        self.hulls = pd.DataFrame({'hull': [LineString([(9, 50), (9.5, 50.5)]), Point(10, 51)]})
+
+    def tearDown(self):
+        handoff.disable()
+        self.__tmp.cleanup()
+
+    def test_without_handoff_the_file_is_used(self):
+        handoff.put(self.path, self.hulls, handoff.write_wkt_csv)
+        self.assertTrue(os.path.exists(self.path))
+        result = handoff.read_wkt_csv(self.path)
+        self.assertTrue(all(a.equals(b) for a, b in zip(result['hull'], self.hulls['hull'])))
+        # the WKT of the file is written unchanged
+        other = os.path.join(self.__tmp.name, 'filtered_bubbles.csv')
+        handoff.write_wkt_csv(result, other)
+        with open(self.path) as f, open(other) as g:
+            self.assertEqual(f.read(), g.read())
+
+    def test_memory_handoff_writes_in_background(self):
+        handoff.enable()
+        handoff.put(self.path, self.hulls, handoff.write_wkt_csv)
+        self.assertIs(handoff.read_wkt_csv(self.path), self.hulls)
+        handoff.flush()
+        self.assertEqual(pd.read_csv(self.path)['hull'].tolist(), [shapely.wkt.dumps(hull) for hull in self.hulls['hull']])
+        self.assertFalse(os.path.exists(f'{self.path}.tmp'))
+
+    def test_without_persistence_nothing_is_written(self):
+        handoff.enable(persist=False)
+        handoff.put(self.path, self.hulls, handoff.write_wkt_csv)
+        self.assertIs(handoff.read_wkt_csv(self.path), self.hulls)
+        handoff.disable()
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_write_errors_are_raised(self):
+        handoff.enable()
+        handoff.put(os.path.join(self.__tmp.name, 'missing', 'cleared_ev.parquet'), pd.DataFrame({'EV': [1.0]}),
+                    handoff.write_parquet)
+        with self.assertRaises(OSError):
+            handoff.flush()
+
+
+if __name__ == '__main__':
+    unittest.main()
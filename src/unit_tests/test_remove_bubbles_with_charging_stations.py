@@ -0,0 +1,59 @@
+import os
+import sys
+import tempfile
+import unittest
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+from parkingspotfilter.parking import remove_bubbles_with_charging_stations  # noqa: E402
+
+
+class TestRemoveBubblesWithChargingStations(unittest.TestCase):
+    def setUp(self):
+        self.__tmp = tempfile.TemporaryDirectory()
+        self.__cwd = os.getcwd()
+        os.chdir(self.__tmp.name)
+        os.makedirs('./datasets/generated')
+        pd.DataFrame({'hull': [
+            'POLYGON ((9 50, 9.1 50, 9.1 50.1, 9 50.1, 9 50))',
+            'POLYGON ((10 50, 10.1 50, 10.1 50.1, 10 50.1, 10 50))',
+            'POLYGON ((11 50, 11.1 50, 11.1 50.1, 11 50.1, 11 50))',
+            'LINESTRING (12 50, 12.1 50)',
+        ]}).to_csv('./datasets/generated/hulls_split.csv', index=False)
+        self.write_register(['A;50,05;9,05', 'B;50,05;11,05 ', 'C;50,05;11,06', 'D;;'])
+
+    def write_register(self, rows):
+        register = ['Ladesäulenregister'] + [''] * 9 + ['Betreiber;Breitengrad;Längengrad'] + rows
+        with open('./datasets/Ladesaeulenregister.csv', 'w', encoding='latin_1') as f:
+            f.write('\n'.join(register) + '\n')
+
+    def tearDown(self):
+        os.chdir(self.__cwd)
+        self.__tmp.cleanup()
+
+    def test_remove(self):
+        remove_bubbles_with_charging_stations(1)
+        result = pd.read_csv('./datasets/generated/filtered_bubbles.csv')
+        self.assertEqual(list(result['hull']), [
+            'POLYGON ((10 50, 10.1 50, 10.1 50.1, 10 50.1, 10 50))',
+            'LINESTRING (12 50, 12.1 50)',
+        ])
+        stations = pd.read_parquet('./datasets/generated/charging_stations.parquet')
+        self.assertEqual(len(stations), 3)
+        self.assertEqual(stations['Longitude'].tolist(), [9.05, 11.05, 11.06])
+
+    def test_a_new_register_is_prepared_again(self):
+        remove_bubbles_with_charging_stations(1)
+        self.write_register(['A;50,05;9,05', 'E;50,05;10,05'])
+        remove_bubbles_with_charging_stations(1)
+        result = pd.read_csv('./datasets/generated/filtered_bubbles.csv')
+        self.assertEqual(list(result['hull']), [
+            'POLYGON ((11 50, 11.1 50, 11.1 50.1, 11 50.1, 11 50))',
+            'LINESTRING (12 50, 12.1 50)',
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+from visualization.heatmap_tiles import render_heatmap_tiles  # noqa: E402
+
+
+class TestRenderHeatmapTiles(unittest.TestCase):
+    def setUp(self):
+        self.__tmp = tempfile.TemporaryDirectory()
+        self.__cwd = os.getcwd()
+        os.chdir(self.__tmp.name)
+        os.makedirs('./datasets/generated')
+        rng = np.random.default_rng(0)
+        self.df = pd.DataFrame({'x_mp_100m': rng.uniform(50, 51, 200),
+                                'y_mp_100m': rng.uniform(8, 10, 200),
+                                'Einwohner': rng.integers(1, 50, 200).astype(float)})
+        self.df['EV'] = self.df['Einwohner'] * 0.01
+        self.df.to_parquet('./datasets/generated/cleared_ev.parquet')
+
+    def tearDown(self):
+        os.chdir(self.__cwd)
+        self.__tmp.cleanup()
+
+    def test_only_changed_tiles_are_rendered(self):
+        rendered = render_heatmap_tiles('./tiles', zooms=[5, 9], workers=1)
+        self.assertGreater(rendered, 4)
+        self.assertTrue(os.path.exists('./tiles/ev/5/16/10.png'))
+        self.assertTrue(os.path.exists('./tiles/population/5/16/10.png'))
+        self.assertEqual(render_heatmap_tiles('./tiles', zooms=[5, 9], workers=1), 0)
+
+        # one cell with a median value changes, that is one tile per zoom level of the EV layer
+        i = int(np.argsort(self.df['EV'].values)[100])
+        self.df.loc[i, 'EV'] += 0.001
+        self.df.to_parquet('./datasets/generated/cleared_ev.parquet')
+        self.assertEqual(render_heatmap_tiles('./tiles', zooms=[5, 9], workers=1), 2)
+
+    def test_small_changes_of_the_colour_scale_keep_the_tiles(self):
+        rendered = render_heatmap_tiles('./tiles', zooms=[5, 9], workers=1)
+        # the two densest cells move the 99.5th percentile, only their tiles change
+        top = np.argsort(self.df['EV'].values)[-2:]
+        self.df.loc[top, 'EV'] *= 1.02
+        self.df.to_parquet('./datasets/generated/cleared_ev.parquet')
+        self.assertLessEqual(render_heatmap_tiles('./tiles', zooms=[5, 9], workers=1), 4)
+        self.assertGreater(rendered, 4)
+
+if __name__ == '__main__':
+    unittest.main()
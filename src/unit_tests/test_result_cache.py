@@ -0,0 +1,34 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+from planning.service import ResultCache, prefix_slices  # noqa: E402
+
+
+class TestResultCache(unittest.TestCase):
+    def test_least_recently_used_is_evicted(self):
+        cache = ResultCache(maxsize=2)
+        cache.put('a', {'value': 1})
+        cache.put('b', {'value': 2})
+        self.assertEqual(cache.get('a'), {'value': 1})
+        cache.put('c', {'value': 3})
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), {'value': 1})
+        self.assertEqual(cache.get('c'), {'value': 3})
+        self.assertEqual(len(cache), 2)
+        self.assertEqual((cache.hits, cache.misses), (3, 1))
+
+    def test_prefix_slices(self):
+        ags = np.array(['01001', '01002', '01101', '02000', '07235001', '07235002', '07236'], dtype=object)
+        self.assertEqual(prefix_slices(ags, ['07235']).tolist(), [4, 5])
+        self.assertEqual(prefix_slices(ags, ['02', '010']).tolist(), [0, 1, 3])
+        self.assertEqual(prefix_slices(ags, ['09']).tolist(), [])
+        self.assertEqual(prefix_slices(ags, []).tolist(), list(range(len(ags))))
+
+
+if __name__ == '__main__':
+    unittest.main()
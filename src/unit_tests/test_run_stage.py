@@ -0,0 +1,46 @@
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+from helper import stages  # noqa: E402
+
+SRC_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir))
+# seconds the startup imports may take
+IMPORT_BUDGET = 0.5
+
+
+class TestRunStage(unittest.TestCase):
+    def startup(self, module: str) -> dict:
+        script = (f"import sys, time, json; start = time.perf_counter(); import {module}; "
+                  "print(json.dumps({'seconds': time.perf_counter() - start, 'modules': list(sys.modules)}))")
+        result = subprocess.run([sys.executable, '-c', script], cwd=SRC_PATH,
+                                capture_output=True, text=True, check=True)
+        return json.loads(result.stdout)
+
+    def test_main_does_not_import_heavy_modules(self):
+        modules = self.startup('main')['modules']
+        self.assertEqual([module for module in stages.HEAVY_MODULES if module in modules], [])
+        self.assertFalse(any(module.split('.')[0] in stages.HEAVY_MODULES for module in modules))
+
+    def test_main_import_budget(self):
+        seconds = min(self.startup('main')['seconds'] for _ in range(3))
+        self.assertLess(seconds, IMPORT_BUDGET)
+
+    def test_stage_modules_exist(self):
+        for module_name, function_name in stages.STAGES.values():
+            path = os.path.join(SRC_PATH, *module_name.split('.')) + '.py'
+            self.assertTrue(os.path.exists(path), path)
+            with open(path, 'r') as f:
+                self.assertIn(f"def {function_name}(", f.read())
+
+    def test_unknown_stage(self):
+        with self.assertRaises(ValueError):
+            stages.run_stage('unknown')
+
+
+if __name__ == '__main__':
+    unittest.main()
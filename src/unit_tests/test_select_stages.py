@@ -0,0 +1,88 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+import runner  # noqa: E402
+
+
+class TestSelectStages(unittest.TestCase):
+    def setUp(self):
+        self.__tmp = tempfile.TemporaryDirectory()
+        self.__cwd = os.getcwd()
+        self.config = runner.make_config({'workdir': self.__tmp.name, 'threshold': 3})
+
+    def tearDown(self):
+        os.chdir(self.__cwd)
+        self.__tmp.cleanup()
+
+    def test_range(self):
+        self.assertEqual(runner.select_stages(self.config, 'bubbles', 'parking'), ['bubbles', 'parking'])
+        # the sweep only runs if thresholds are configured
+        self.assertEqual(runner.select_stages(self.config, 'parking'), ['parking', 'coverage', 'viz'])
+        config = runner.make_config({'thresholds': [2, 4], 'stages': ['ev', 'sweep']})
+        self.assertEqual(runner.select_stages(config), ['ev', 'sweep'])
+
+    def test_max_coverage_skips_bubbles(self):
+        config = runner.make_config({'placement': 'max_coverage', 'chargers': 200})
+        self.assertEqual(runner.select_stages(config), ['data_helper', 'ev', 'parking', 'coverage', 'viz'])
+        with self.assertRaises(ValueError):
+            runner.make_config({'placement': 'max_coverage'})
+
+    def test_invalid_config(self):
+        with self.assertRaises(ValueError):
+            runner.make_config({'algorithm': 'unknown'})
+        with self.assertRaises(ValueError):
+            runner.make_config({'treshold': 3})
+        with self.assertRaises(ValueError):
+            runner.make_config({'threshold': 0})
+
+    def test_cli_overrides_config_file(self):
+        config_file = os.path.join(self.__tmp.name, 'run.json')
+        with open(config_file, 'w') as f:
+            json.dump({'algorithm': 'kmeans_batched', 'threshold': 5}, f)
+        config, args = runner.parse_args(['--config', config_file, '--threshold', '7', '--from', 'parking'])
+        self.assertEqual((config['algorithm'], config['threshold'], args.start), ('kmeans_batched', 7, 'parking'))
+
+    def test_resume_after_failure(self):
+        calls = []
+
+        def run_stage(name, *args, **kwargs):
+            calls.append(name)
+            if name == 'parking' and calls.count('parking') == 1:
+                raise RuntimeError()
+
+        selected = ['bubbles', 'parking', 'viz']
+        with mock.patch.object(runner.stages, 'run_stage', side_effect=run_stage):
+            with self.assertRaises(RuntimeError):
+                runner.run(self.config, selected)
+            self.assertEqual(runner.run(self.config, selected, resume=True), ['parking', 'viz'])
+            # a changed configuration runs all stages again
+            config = dict(self.config, threshold=4)
+            self.assertEqual(runner.run(config, selected, resume=True), selected)
+        self.assertEqual(calls, ['simple_split', 'parking', 'parking', 'viz', 'simple_split', 'parking', 'viz'])
+        self.assertTrue(os.path.exists(os.path.join(self.__tmp.name, f"{self.config['trace_path']}.csv")))
+
+    def test_working_directory_is_restored(self):
+        os.chdir(self.__tmp.name)
+        for name in ['first', 'second']:
+            os.makedirs(name)
+        with mock.patch.object(runner.stages, 'run_stage'):
+            for name in ['first', 'second']:
+                runner.run(runner.make_config({'workdir': name}), ['bubbles'])
+                self.assertEqual(os.getcwd(), os.path.realpath(self.__tmp.name))
+            # the working directory is also restored after a failure
+            with mock.patch.object(runner.validation, 'check_datasets', return_value=False):
+                with self.assertRaises(FileNotFoundError):
+                    runner.run(runner.make_config({'workdir': 'first'}), ['data_helper'])
+        self.assertEqual(os.getcwd(), os.path.realpath(self.__tmp.name))
+        for name in ['first', 'second']:
+            self.assertTrue(os.path.isdir(os.path.join(self.__tmp.name, name, 'datasets', 'generated')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+import pandas as pd
+from pyproj import Transformer
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+from redistricting.kmeans_batched import cluster, find_bubbles, fit_points, super_cells  # noqa: E402
+
+
+class TestSuperCells(unittest.TestCase):
+    def setUp(self):
+        # a 10 x 10 block of 100m cells in EPSG:3035, in the (longitude, latitude, EV) columns of the pipeline
+        x, y = np.meshgrid(np.arange(10) * 100 + 4_100_050, np.arange(10) * 100 + 3_000_050)
+        lon, lat = Transformer.from_crs("EPSG:3035", "EPSG:4326", always_xy=True).transform(x.ravel(), y.ravel())
+        ev = np.zeros(100)
+        ev[:50] = 0.5
+        ev[50:] = 0.001
+        self.data = np.column_stack([lon, lat, ev])
+
+    def test_the_grid_is_kept_for_100m(self):
+        np.testing.assert_array_equal(super_cells(self.data, 100), self.data)
+
+    def test_super_cells_keep_the_evs(self):
+        for cell_size, count in [(200, 25), (500, 4)]:
+            with self.subTest(cell_size=cell_size):
+                points = super_cells(self.data, cell_size)
+                self.assertEqual(len(points), count)
+                self.assertAlmostEqual(points[:, 2].sum(), self.data[:, 2].sum())
+
+    def test_super_cells_lie_at_the_ev_weighted_centre(self):
+        data = self.data[[0, 1, 10, 11]].copy()
+        data[:, 2] = [3.0, 1.0, 0.0, 0.0]
+        point = super_cells(data, 200)[0]
+        np.testing.assert_allclose(point[:2], (0.75 * data[0, :2] + 0.25 * data[1, :2]))
+        data[:, 2] = 0.0
+        np.testing.assert_allclose(super_cells(data, 200)[0, :2], data[:, :2].mean(axis=0))
+
+    def test_invalid_cell_size(self):
+        with self.assertRaises(ValueError):
+            super_cells(self.data, 300)
+
+    def test_cells_without_demand_are_left_out_of_the_fit(self):
+        self.assertEqual(len(fit_points(self.data, 0.01)), 50)
+        # without a cell above the epsilon all cells with EVs are used
+        self.assertEqual(len(fit_points(self.data, 10)), 100)
+        self.data[50:, 2] = 0.0
+        self.assertEqual(len(fit_points(self.data, 10)), 50)
+
+    def test_cells_without_evs_are_clustered_unweighted(self):
+        for ev in [0.0, np.nan]:
+            with self.subTest(ev=ev):
+                self.data[:, 2] = ev
+                self.assertIsNone(fit_points(self.data, 0.01, 200))
+                df = pd.DataFrame(self.data, columns=['y_mp_100m', 'x_mp_100m', 'EV'])
+                self.assertEqual(len(find_bubbles(df, weighted=True)), len(find_bubbles(df)))
+
+    def test_every_cell_joins_a_cluster(self):
+        points = fit_points(self.data, 0.01, 200)
+        labels, num_clusters = cluster(self.data, points)
+        self.assertEqual(num_clusters, 2)
+        self.assertEqual(len(labels), len(self.data))
+        df = pd.DataFrame(self.data, columns=['y_mp_100m', 'x_mp_100m', 'EV'])
+        self.assertEqual(len(find_bubbles(df, weighted=True, cell_size=200)), 2)
+
+    def test_ev_per_cluster(self):
+        # 25.05 EVs in total
+        self.assertEqual(cluster(self.data, ev_per_cluster=5)[1], 5)
+        self.assertEqual(cluster(self.data, ev_per_cluster=1)[1], 25)
+        df = pd.DataFrame(self.data, columns=['y_mp_100m', 'x_mp_100m', 'EV'])
+        self.assertEqual(len(find_bubbles(df, ev_per_cluster=25)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+from parkingspotfilter.assignment import assign_with_capacity, sweep_max_stations  # noqa: E402
+
+
+class TestSweepMaxStations(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.tree = cKDTree(rng.uniform(0, 10_000, size=(50, 2)))
+        self.points = rng.uniform(0, 10_000, size=(300, 2))
+
+    def test_sweep_matches_separate_runs(self):
+        assignments, summary = sweep_max_stations(self.tree, self.points, [6, 10, 300], k=4)
+        for threshold in [6, 10, 300]:
+            np.testing.assert_array_equal(
+                assignments[threshold], assign_with_capacity(self.tree, self.points, threshold))
+        self.assertEqual(summary['threshold'].tolist(), [6, 10, 300])
+        self.assertEqual(summary['unassigned'].tolist(), [0, 0, 0])
+        self.assertEqual(summary.loc[0, 'used_lots'], 50)
+        # A higher capacity lets more bubbles use their nearest parking space
+        self.assertTrue(summary['mean_distance'].is_monotonic_decreasing)
+
+    def test_not_enough_parking_spaces(self):
+        _, summary = sweep_max_stations(self.tree, self.points, [5])
+        self.assertEqual(summary.loc[0, 'unassigned'], 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import sys
+import tempfile
+import unittest
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+from redistricting import simple_split  # noqa: E402
+from redistricting.bubble_store import update_bubbles  # noqa: E402
+
+
+class TestUpdateBubbles(unittest.TestCase):
+    def setUp(self):
+        self.__tmp = tempfile.TemporaryDirectory()
+        self.store = os.path.join(self.__tmp.name, 'bubble_store')
+        self.output = os.path.join(self.__tmp.name, 'hulls_split.csv')
+        rows = []
+        for kreis, lat in [('07235', 49.7), ('07111', 50.3)]:
+            for i in range(40):
+                rows.append({'id': f'{kreis}-{i}', 'ags': f'{kreis}001',
+                             'x_mp_100m': lat + (i // 8) * 0.001, 'y_mp_100m': 6.6 + (i % 8) * 0.0014, 'EV': 1.5})
+        self.cells = pd.DataFrame(rows)
+
+    def tearDown(self):
+        self.__tmp.cleanup()
+
+    def update(self, cells):
+        return update_bubbles(cells, 'simple_split', simple_split.find_bubbles, self.output, self.store, workers=1)
+
+    def read_output(self):
+        return pd.read_csv(self.output)['hull'].tolist()
+
+    def test_all_kreise_are_computed_first(self):
+        self.assertEqual(self.update(self.cells), ['07111', '07235'])
+        expected = pd.concat([simple_split.find_bubbles(self.cells[self.cells['ags'].str.startswith(kreis)])
+                              for kreis in ['07111', '07235']], ignore_index=True)
+        self.assertEqual(len(self.read_output()), len(expected))
+
+    def test_only_changed_kreise_are_recomputed(self):
+        self.update(self.cells)
+        before = self.read_output()
+        # the order of the cells does not matter
+        self.assertEqual(self.update(self.cells.sample(frac=1, random_state=0)), [])
+        self.assertEqual(self.read_output(), before)
+
+        changed = self.cells.copy()
+        changed.loc[changed['ags'] == '07235001', 'EV'] = 4.0
+        self.assertEqual(self.update(changed), ['07235'])
+        after = self.read_output()
+        unchanged = len(simple_split.find_bubbles(self.cells[self.cells['ags'] == '07111001']))
+        self.assertEqual(after[:unchanged], before[:unchanged])
+        self.assertNotEqual(after, before)
+
+    def test_removed_kreise_are_dropped(self):
+        self.update(self.cells)
+        remaining = self.cells[self.cells['ags'] == '07111001']
+        self.assertEqual(self.update(remaining), [])
+        self.assertFalse(os.path.exists(os.path.join(self.store, 'simple_split', '07235.csv')))
+        self.assertEqual(len(self.read_output()), len(simple_split.find_bubbles(remaining)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+from visualization import regions  # noqa: E402
+from visualization.regions import write_regions  # noqa: E402
+
+
+class TestWriteRegions(unittest.TestCase):
+    def setUp(self):
+        self.__tmp = tempfile.TemporaryDirectory()
+        self.__cwd = os.getcwd()
+        os.chdir(self.__tmp.name)
+        os.makedirs('./datasets/generated')
+        # x holds the latitude, y the longitude
+        pd.DataFrame({'x_mp_100m': [50.0, 50.0, 52.5],
+                      'y_mp_100m': [8.0, 8.01, 13.4],
+                      'ags': ['06412000', '06412000', '11000000']}
+                     ).to_parquet('./datasets/generated/cleared_ev.parquet')
+        self.points = pd.DataFrame({'id': [0, 1], 'lon': [8.005, 13.41], 'lat': [50.001, 52.5],
+                                    'count': [2, 1]})
+        self.points.to_parquet('./datasets/generated/charging_points.parquet')
+        pd.DataFrame({'hull': ['POLYGON ((8 50, 8.01 50, 8.01 50.01, 8 50))', 'POINT (13.4 52.5)']}
+                     ).to_csv('./datasets/generated/hulls_split.csv', index=False)
+
+    def tearDown(self):
+        os.chdir(self.__cwd)
+        self.__tmp.cleanup()
+
+    def test_only_changed_regions_are_written(self):
+        self.assertEqual(write_regions('./regions'), 2)
+        self.assertTrue(os.path.exists('./regions/06/06412.js'))
+        self.assertTrue(os.path.exists('./regions/11/11000.js'))
+        self.assertTrue(os.path.exists('./regions/index.html'))
+        self.assertEqual(write_regions('./regions'), 0)
+
+        self.points.loc[1, 'count'] = 3
+        self.points.to_parquet('./datasets/generated/charging_points.parquet')
+        self.assertEqual(write_regions('./regions'), 1)
+        with open('./regions/11/11000.js') as f:
+            self.assertIn('[52.5,13.41,3]', f.read())
+
+    def test_unchanged_inputs_are_not_read(self):
+        write_regions('./regions')
+        with mock.patch.object(regions, 'region_inputs', side_effect=AssertionError):
+            self.assertEqual(write_regions('./regions'), 0)
+        os.remove('./regions/06/06412.js')
+        self.assertEqual(write_regions('./regions'), 1)
+
+    def test_the_lookup_is_cached(self):
+        write_regions('./regions')
+        self.points.loc[0, 'count'] = 5
+        self.points.to_parquet('./datasets/generated/charging_points.parquet')
+        with mock.patch.object(regions.KreisLookup, 'build', side_effect=AssertionError):
+            self.assertEqual(write_regions('./regions'), 1)
+        # new cells rebuild the lookup
+        cells = pd.read_parquet('./datasets/generated/cleared_ev.parquet')
+        cells.loc[2, 'ags'] = '11001000'
+        cells.to_parquet('./datasets/generated/cleared_ev.parquet')
+        self.assertEqual(write_regions('./regions'), 1)
+        self.assertTrue(os.path.exists('./regions/11/11001.js'))
+        self.assertFalse(os.path.exists('./regions/11/11000.js'))
+
+
+if __name__ == '__main__':
+    unittest.main()
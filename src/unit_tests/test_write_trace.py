@@ -0,0 +1,83 @@
+import csv
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+from helper import telemetry  # noqa: E402
+
+
+class TestWriteTrace(unittest.TestCase):
+    def setUp(self):
+        self.__tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.__tmp.name, 'trace')
+        telemetry.clear()
+
+    def tearDown(self):
+        telemetry.clear()
+        self.__tmp.cleanup()
+
+    def test_steps_are_recorded(self):
+        with telemetry.stage('ev'):
+            with telemetry.step('Reading', rows_in=10) as step:
+                telemetry.rows(rows_out=7)
+                data = bytearray(8 * 2 ** 20)
+                del data
+            with telemetry.step('Skipped') as step:
+                step.skip()
+        telemetry.write_trace(self.path)
+
+        with open(f'{self.path}.json', 'r') as f:
+            records = json.load(f)
+        self.assertEqual([(r['stage'], r['step'], r['status']) for r in records],
+                         [('ev', 'Reading', 'ok'), ('ev', 'Skipped', 'skipped'), ('ev', None, 'ok')])
+        self.assertEqual((records[0]['rows_in'], records[0]['rows_out']), (10, 7))
+        # the stage contains its steps
+        self.assertGreaterEqual(records[2]['wall_s'], records[0]['wall_s'] + records[1]['wall_s'])
+        self.assertGreaterEqual(records[2]['peak_rss_mb'], records[0]['peak_rss_mb'])
+        with open(f'{self.path}.csv', 'r') as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(list(rows[0]), telemetry.TRACE_COLUMNS)
+        self.assertEqual(len(rows), 3)
+
+    def test_failed_step_is_recorded(self):
+        with self.assertRaises(ValueError):
+            with telemetry.step('Failing'):
+                raise ValueError()
+        self.assertEqual(telemetry.records()[0]['status'], 'failed')
+
+    def test_rows_outside_of_step(self):
+        telemetry.rows(1, 2)
+        self.assertEqual(telemetry.records(), [])
+
+    def test_progress_is_throttled(self):
+        class Spinner:
+            updates = 0
+
+            @property
+            def text(self):
+                return None
+
+            @text.setter
+            def text(self, text):
+                self.updates += 1
+                self.last = text
+
+        spinner = Spinner()
+        progress = telemetry.Progress(spinner, 'Counting', 100_000, interval=0.5)
+        for _ in range(100_000):
+            progress.advance()
+        self.assertEqual(progress.count, 100_000)
+        self.assertLess(spinner.updates, 10)
+        self.assertEqual(spinner.last, "Counting (100000/100000)")
+        # outside of a step the progress is only counted
+        progress = telemetry.progress(3)
+        progress.advance(3)
+        self.assertEqual(progress.count, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
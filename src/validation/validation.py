@@ -1,3 +1,4 @@
+import hashlib
 import os
 
 
@@ -67,3 +68,20 @@ def check_generated(file_path: str) -> bool:
     file_exists = os.path.exists(os.path.join(dir_path, file_name))
 
     return file_exists
+
+
+def file_fingerprint(file_path: str) -> str:
+    """
+    Creates a cheap fingerprint of a file from its size and modification time.
+    Generated artifacts store the fingerprint of the file they were built from,
+    so they can be rebuilt as soon as the source file changes.
+
+    Args:
+        file_path (str): The path to the file to fingerprint.
+
+    Returns:
+        A hex digest identifying the current version of the file.
+    """
+    stat = os.stat(file_path)
+    key = f"{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha1(key.encode()).hexdigest()
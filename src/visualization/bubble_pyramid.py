@@ -0,0 +1,301 @@
+import json
+import math
+import os
+import shutil
+import sys
+
+import folium
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from branca.element import MacroElement
+from jinja2 import Template
+
+from validation import validation
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+
+"""
+This module precomputes a zoom dependent pyramid of the bubbles for the visualization.
+
+For every level the bubbles are simplified with a tolerance of half a pixel (topology preserving),
+their coordinates are quantised to a tenth of a pixel and they are written into static
+XYZ tiles under ./maps/bubbles/<layer>/<z>/<x>/<y>.js.
+Bubbles smaller than a pixel are written as points.
+A bubble is written into every tile its bounding box intersects, the ids of the bubbles are stored next to
+the geometries so the map draws a bubble only once when several of its tiles are in view.
+The tiles contain a GeoJSON GeometryCollection wrapped into a function call, so the map can load them with
+script tags and still works when it is opened directly from the file system.
+"""
+
+PYRAMID_PATH = './maps/bubbles'
+# Zoom levels with their own geometries, the level below the current zoom is shown
+PYRAMID_LEVELS = [6, 8, 10, 12]
+# Version of the tile format, pyramids written with another version are rebuilt
+PYRAMID_VERSION = 2
+
+
+def pixel_size(zoom: int) -> float:
+    """
+    Returns the width of a 256px web map pixel in degrees at the given zoom level.
+    """
+    return 360 / (256 * 2 ** zoom)
+
+
+def tile_xy(lon: np.ndarray, lat: np.ndarray, zoom: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the XYZ tile columns and rows of EPSG:4326 coordinates at the given zoom level.
+    """
+    n = 2 ** zoom
+    lat_rad = np.radians(lat)
+    x = np.floor((np.asarray(lon) + 180) / 360 * n).astype(np.int64)
+    y = np.floor((1 - np.log(np.tan(lat_rad) + 1 / np.cos(lat_rad)) / np.pi) / 2 * n).astype(np.int64)
+    return np.clip(x, 0, n - 1), np.clip(y, 0, n - 1)
+
+
+def intersecting_tiles(bounds: pd.DataFrame, zoom: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Returns every tile intersected by the bounding boxes, as the positions of the boxes with
+    the XYZ tile columns and rows at the given zoom level.
+
+    Args:
+        bounds (pd.DataFrame): The bounding boxes with the columns minx, miny, maxx and maxy
+        zoom (int): The zoom level
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: The positions of the boxes, the tile columns and rows
+    """
+    # tile rows grow to the south, the north edge has the smallest row
+    x0, y0 = tile_xy(bounds['minx'].values, bounds['maxy'].values, zoom)
+    x1, y1 = tile_xy(bounds['maxx'].values, bounds['miny'].values, zoom)
+    width = x1 - x0 + 1
+    counts = width * (y1 - y0 + 1)
+    ids = np.repeat(np.arange(len(bounds)), counts)
+    offset = np.arange(len(ids)) - np.repeat(np.cumsum(counts) - counts, counts)
+    return ids, x0[ids] + offset % width[ids], y0[ids] + offset // width[ids]
+
+
+def quantise_coords(coords, decimals: int) -> list:
+    """
+    Rounds coordinates and removes consecutive duplicates created by the rounding.
+    """
+    result = []
+    for x, y in coords:
+        point = [round(x, decimals), round(y, decimals)]
+        if not result or result[-1] != point:
+            result.append(point)
+    return result
+
+
+def quantised_geometry(geometry, decimals: int, pixel: float) -> dict:
+    """
+    Converts a bubble into a GeoJSON geometry with quantised coordinates.
+    Bubbles smaller than a pixel and polygons and lines that collapse
+    to a single point through the quantisation are returned as points.
+
+    Args:
+        geometry (Point | LineString | Polygon): The simplified bubble
+        decimals (int): The number of decimals that are kept
+        pixel (float): The size of a pixel in degrees
+
+    Returns:
+        dict: The GeoJSON geometry
+    """
+    minx, miny, maxx, maxy = geometry.bounds
+    if maxx - minx < pixel and maxy - miny < pixel:
+        return {'type': 'Point',
+                'coordinates': [round((minx + maxx) / 2, decimals), round((miny + maxy) / 2, decimals)]}
+    if geometry.geom_type == 'Polygon':
+        ring = quantise_coords(geometry.exterior.coords, decimals)
+        if len(ring) >= 4:
+            return {'type': 'Polygon', 'coordinates': [ring]}
+        return {'type': 'Point', 'coordinates': ring[0]}
+    if geometry.geom_type == 'LineString':
+        line = quantise_coords(geometry.coords, decimals)
+        if len(line) >= 2:
+            return {'type': 'LineString', 'coordinates': line}
+        return {'type': 'Point', 'coordinates': line[0]}
+    return {'type': 'Point', 'coordinates': quantise_coords(geometry.coords, decimals)[0]}
+
+
+def build_bubble_pyramid(hulls: gpd.GeoSeries, layer: str, path: str = PYRAMID_PATH,
+                         levels: list[int] = PYRAMID_LEVELS) -> dict:
+    """
+    Writes the tiles of all levels of the pyramid for one bubble layer.
+
+    Args:
+        hulls (gpd.GeoSeries): The bubbles in EPSG:4326
+        layer (str): The name of the layer, used as directory name
+        path (str, optional): The root directory of the pyramids. Defaults to PYRAMID_PATH.
+        levels (list[int], optional): The zoom levels of the pyramid. Defaults to PYRAMID_LEVELS.
+
+    Returns:
+        dict: The levels and the keys "z/x/y" of all tiles that were written
+    """
+    layer_path = os.path.join(path, layer)
+    if os.path.exists(layer_path):
+        shutil.rmtree(layer_path)
+    bounds = hulls.bounds
+    tiles = []
+    for zoom in levels:
+        simplified = hulls.simplify(pixel_size(zoom) / 2, preserve_topology=True)
+        decimals = math.ceil(-math.log10(pixel_size(zoom) / 10))
+        positions, x, y = intersecting_tiles(bounds, zoom)
+        groups = pd.Series(positions).groupby([x, y])
+        for (tile_x, tile_y), ids in groups:
+            key = f"{zoom}/{tile_x}/{tile_y}"
+            geometries = [quantised_geometry(simplified.iloc[i], decimals, pixel_size(zoom))
+                          for i in ids.values]
+            tile_file = os.path.join(layer_path, f"{key}.js")
+            os.makedirs(os.path.dirname(tile_file), exist_ok=True)
+            with open(tile_file, 'w') as f:
+                f.write(f"powerUpTiles[{json.dumps(layer)}]({json.dumps(key)},")
+                json.dump({'type': 'GeometryCollection', 'geometries': geometries,
+                           'ids': ids.values.tolist()}, f, separators=(',', ':'))
+                f.write(');\n')
+            tiles.append(key)
+    return {'levels': levels, 'version': PYRAMID_VERSION, 'tiles': tiles}
+
+
+def load_bubble_pyramid(csv_file: str, layer: str, path: str = PYRAMID_PATH) -> dict:
+    """
+    Returns the pyramid of the bubbles in `csv_file`. It is only rebuilt
+    if the bubbles changed since it was written.
+
+    Args:
+        csv_file (str): The CSV file with the bubbles in WKT format
+        layer (str): The name of the layer
+        path (str, optional): The root directory of the pyramids. Defaults to PYRAMID_PATH.
+
+    Returns:
+        dict: The levels and the keys of all tiles of the pyramid
+    """
+    fingerprint = validation.file_fingerprint(csv_file)
+    meta_path = os.path.join(path, f"{layer}.json")
+    if os.path.exists(meta_path):
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        if meta['fingerprint'] == fingerprint and meta['levels'] == PYRAMID_LEVELS \
+                and meta.get('version') == PYRAMID_VERSION:
+            return meta
+    df = pd.read_csv(csv_file)
+    meta = build_bubble_pyramid(gpd.GeoSeries.from_wkt(df['hull']), layer, path)
+    meta['fingerprint'] = fingerprint
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f)
+    return meta
+
+
+class TiledBubbles(MacroElement):
+    """
+    Loads the tiles of a bubble pyramid into its parent FeatureGroup.
+    Only the tiles of the current level that are in view are loaded,
+    already loaded tiles are kept until the level changes. Bubbles that are
+    part of several loaded tiles are drawn once.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function () {
+            var group = {{ this._parent.get_name() }};
+            var levels = {{ this.levels|tojson }};
+            var available = new Set({{ this.tiles|tojson }});
+            var style = {{ this.style|tojson }};
+            var loaded = {};
+            var drawn = {};
+            var current = null;
+            var map = null;
+            window.powerUpTiles = window.powerUpTiles || {};
+            window.powerUpTiles[{{ this.layer|tojson }}] = function (key, data) {
+                if (key.split('/')[0] != current) { return; }
+                var geometries = data.geometries.filter(function (geometry, i) {
+                    if (drawn[data.ids[i]]) { return false; }
+                    drawn[data.ids[i]] = true;
+                    return true;
+                });
+                group.addLayer(L.geoJSON({type: 'GeometryCollection', geometries: geometries}, {
+                    style: function () { return style; },
+                    pointToLayer: function (feature, latlng) {
+                        return L.circleMarker(latlng, Object.assign({radius: 2}, style));
+                    }
+                }));
+            };
+            function level(zoom) {
+                var result = levels[0];
+                levels.forEach(function (z) { if (z <= zoom) { result = z; } });
+                return result;
+            }
+            function tileX(lon, z) {
+                return Math.floor((lon + 180) / 360 * Math.pow(2, z));
+            }
+            function tileY(lat, z) {
+                var rad = lat * Math.PI / 180;
+                return Math.floor((1 - Math.log(Math.tan(rad) + 1 / Math.cos(rad)) / Math.PI) / 2 * Math.pow(2, z));
+            }
+            function update() {
+                if (!map) { return; }
+                var z = level(map.getZoom());
+                if (z !== current) {
+                    group.clearLayers();
+                    loaded = {};
+                    drawn = {};
+                    current = z;
+                }
+                var bounds = map.getBounds();
+                for (var x = tileX(bounds.getWest(), z); x <= tileX(bounds.getEast(), z); x++) {
+                    for (var y = tileY(bounds.getNorth(), z); y <= tileY(bounds.getSouth(), z); y++) {
+                        var key = z + '/' + x + '/' + y;
+                        if (loaded[key] || !available.has(key)) { continue; }
+                        loaded[key] = true;
+                        var script = document.createElement('script');
+                        script.src = {{ this.url|tojson }} + '/' + key + '.js';
+                        document.head.appendChild(script);
+                    }
+                }
+            }
+            function attach() {
+                map = group._map;
+                map.on('moveend', update);
+                update();
+            }
+            function detach() {
+                if (map) { map.off('moveend', update); }
+                map = null;
+                current = null;
+            }
+            group.on('add', attach);
+            group.on('remove', detach);
+            if (group._map) { attach(); }
+        })();
+        {% endmacro %}
+        """)
+
+    def __init__(self, layer: str, url: str, meta: dict, style: dict) -> None:
+        super().__init__()
+        self._name = 'TiledBubbles'
+        self.layer = layer
+        self.url = url
+        self.levels = meta['levels']
+        self.tiles = meta['tiles']
+        self.style = style
+
+
+def add_bubble_pyramid(folium_map: folium.Map, csv_file: str, layer: str, name: str,
+                       style: dict, maps_path: str = './maps') -> None:
+    """
+    Adds a bubble layer to the map that loads the pyramid level matching the current zoom.
+
+    Args:
+        folium_map (folium.Map): The map to add the layer to
+        csv_file (str): The CSV file with the bubbles in WKT format
+        layer (str): The name of the layer in the pyramid
+        name (str): The name of the layer in the layer control
+        style (dict): The Leaflet style of the bubbles
+        maps_path (str, optional): The directory the map is saved to. Defaults to './maps'.
+    """
+    path = os.path.join(maps_path, 'bubbles')
+    meta = load_bubble_pyramid(csv_file, layer, path)
+    group = folium.FeatureGroup(name=name, show=False)
+    group.add_child(TiledBubbles(layer, f"bubbles/{layer}", meta, style))
+    group.add_to(folium_map)
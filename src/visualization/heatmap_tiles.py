@@ -0,0 +1,197 @@
+import hashlib
+import json
+import math
+import os
+import sys
+
+import folium
+import numpy as np
+import pandas as pd
+from matplotlib import colormaps
+from PIL import Image
+
+from helper import executor
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+
+"""
+This module renders the 100m grid in cleared_ev.parquet into an offline XYZ PNG pyramid.
+
+Every zoom level is rasterized with numpy binning: the cells are projected to web mercator
+pixels and their values are summed per pixel with np.bincount. The sum is divided by the
+ground area of a pixel, so the colours show the density per km² on every zoom level.
+Tiles are rendered in parallel worker processes. A manifest stores a hash of the cells of
+every tile, so a tile is only rendered again if its cells changed. The hashes are compared
+while the tiles are binned, only the cells of changed tiles are kept for rendering.
+The colour scale is rounded to SCALE_STEP decades, so small changes of the densest cells
+do not render every tile again.
+"""
+
+TILES_PATH = './maps/tiles'
+HEATMAP_ZOOMS = list(range(5, 13))
+# column in cleared_ev.parquet and colormap per layer
+HEATMAP_LAYERS = {'ev': ('EV', 'inferno'),
+                  'population': ('Einwohner', 'viridis')}
+TILE_SIZE = 256
+# ground resolution of a pixel in meters at zoom level 0 and the equator
+EQUATOR_RESOLUTION = 156543.03392
+# decades the upper bound of the log10 colour scale is rounded up to
+SCALE_STEP = 0.25
+
+
+def mercator_pixels(lon: np.ndarray, lat: np.ndarray, zoom: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the global web mercator pixel coordinates of EPSG:4326 coordinates.
+    """
+    size = TILE_SIZE * 2 ** zoom
+    lat_rad = np.radians(lat)
+    px = (np.asarray(lon) + 180) / 360 * size
+    py = (1 - np.log(np.tan(lat_rad) + 1 / np.cos(lat_rad)) / np.pi) / 2 * size
+    return np.floor(px).astype(np.int64), np.floor(py).astype(np.int64)
+
+
+def pixel_area_km2(tile_y: int, zoom: int) -> float:
+    """
+    Returns the ground area of a pixel in the middle of the given tile row in km².
+    """
+    n = 2 ** zoom
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (tile_y + 0.5) / n))))
+    resolution = EQUATOR_RESOLUTION * np.cos(np.radians(lat)) / n
+    return (resolution / 1000) ** 2
+
+
+def render_tile(task: tuple) -> None:
+    """
+    Rasterizes the cells of one tile into a PNG file. Runs in a worker process.
+
+    Args:
+        task (tuple): The tile file, the pixel indices and values of the cells inside the tile,
+                      the ground area of a pixel, the colormap and the log10 colour scale bounds
+    """
+    tile_file, pixels, values, area, colormap, vmin, vmax = task
+    grid = np.bincount(pixels, weights=values, minlength=TILE_SIZE * TILE_SIZE) / area
+    scaled = (np.log10(np.maximum(grid, 10 ** vmin)) - vmin) / (vmax - vmin)
+    rgba = colormaps[colormap](np.clip(scaled, 0, 1), bytes=True)
+    rgba[:, 3] = np.where(grid > 0, 180, 0)
+    os.makedirs(os.path.dirname(tile_file), exist_ok=True)
+    Image.fromarray(rgba.reshape(TILE_SIZE, TILE_SIZE, 4), 'RGBA').save(tile_file, optimize=True)
+
+
+def render_tasks(task_batch: list) -> None:
+    """
+    Renders a batch of tiles, so the process pool is not flooded with tiny tasks.
+    """
+    for task in task_batch:
+        render_tile(task)
+
+
+def tile_tasks(lon: np.ndarray, lat: np.ndarray, values: np.ndarray, layer: str,
+               colormap: str, vmin: float, vmax: float, path: str, zooms: list[int],
+               manifest: dict | None = None) -> tuple[dict, list]:
+    """
+    Bins the cells into the tiles of all zoom levels.
+
+    Args:
+        manifest (dict, optional): The hashes of the last run per tile key. Defaults to rendering every tile.
+
+    Returns:
+        tuple[dict, list]: The hash of the input per tile key "layer/z/x/y" and
+                           the render tasks of the tiles that changed since the last run
+    """
+    manifest = manifest or {}
+    digests, tasks = {}, []
+    for zoom in zooms:
+        px, py = mercator_pixels(lon, lat, zoom)
+        tile_x, tile_y = px // TILE_SIZE, py // TILE_SIZE
+        pixels = (py % TILE_SIZE) * TILE_SIZE + px % TILE_SIZE
+        order = np.lexsort((pixels, tile_y, tile_x))
+        keys = np.column_stack([tile_x[order], tile_y[order]])
+        starts = np.flatnonzero(np.r_[True, (keys[1:] != keys[:-1]).any(axis=1)])
+        for start, end in zip(starts, np.r_[starts[1:], len(order)]):
+            x, y = keys[start]
+            ids = order[start:end]
+            key = f"{layer}/{zoom}/{x}/{y}"
+            digest = hashlib.sha1(pixels[ids].tobytes())
+            digest.update(values[ids].tobytes())
+            digest.update(f"{colormap}:{vmin}:{vmax}".encode())
+            digests[key] = digest.hexdigest()
+            tile_file = os.path.join(path, f"{key}.png")
+            if manifest.get(key) != digests[key] or not os.path.exists(tile_file):
+                tasks.append((tile_file, pixels[ids], values[ids], pixel_area_km2(y, zoom), colormap, vmin, vmax))
+    return digests, tasks
+
+
+def render_heatmap_tiles(path: str = TILES_PATH, zooms: list[int] = HEATMAP_ZOOMS,
+                         workers: int | None = None, batch_size: int | None = None) -> int:
+    """
+    Renders the EV density and population pyramids of cleared_ev.parquet.
+    Only tiles whose cells changed since the last run are rendered,
+    tiles without cells are removed.
+
+    Args:
+        path (str, optional): The root directory of the tiles. Defaults to TILES_PATH.
+        zooms (list[int], optional): The rendered zoom levels. Defaults to HEATMAP_ZOOMS.
+        workers (int, optional): The number of worker processes.
+                                 Defaults to POWERUP_WORKERS or the number of cores, see helper.executor.
+        batch_size (int, optional): The number of tiles per task. Defaults to POWERUP_HEATMAP_CHUNK_SIZE or 64.
+
+    Returns:
+        int: The number of rendered tiles
+    """
+    columns = ['x_mp_100m', 'y_mp_100m'] + [column for column, _ in HEATMAP_LAYERS.values()]
+    df = pd.read_parquet('./datasets/generated/cleared_ev.parquet', columns=columns)
+    # after the transformation to EPSG:4326 x holds the latitude and y the longitude
+    lat, lon = df['x_mp_100m'].values, df['y_mp_100m'].values
+
+    manifest_path = os.path.join(path, 'manifest.json')
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+
+    digests, changed = {}, []
+    for layer, (column, colormap) in HEATMAP_LAYERS.items():
+        values = df[column].fillna(0).clip(lower=0).values.astype(np.float64)
+        # colour scale over three orders of magnitude below the densest cells (100 cells per km²)
+        vmax = float(np.log10(max(np.percentile(values[values > 0], 99.5) * 100, 1e-6))) \
+            if (values > 0).any() else 0.0
+        vmax = round(math.ceil(vmax / SCALE_STEP) * SCALE_STEP, 3)
+        layer_digests, layer_tasks = tile_tasks(lon, lat, values, layer, colormap,
+                                                round(vmax - 3, 3), vmax, path, zooms, manifest)
+        digests.update(layer_digests)
+        changed.extend(layer_tasks)
+
+    for key in set(manifest) - set(digests):
+        tile_file = os.path.join(path, f"{key}.png")
+        if os.path.exists(tile_file):
+            os.remove(tile_file)
+
+    tile_executor = executor.get_executor('heatmap', workers, batch_size, default_chunk_size=64)
+    tile_executor.map(render_tasks, [changed[start:stop] for start, stop in tile_executor.chunks(len(changed))])
+
+    os.makedirs(path, exist_ok=True)
+    with open(manifest_path, 'w') as f:
+        json.dump(digests, f)
+    return len(changed)
+
+
+def add_heatmap_layers(folium_map: folium.Map, url: str = 'tiles', zooms: list[int] = HEATMAP_ZOOMS) -> None:
+    """
+    Adds the rendered pyramids as tile layers to the map.
+    The tiles are referenced relative to the map, so no server or internet connection is needed.
+
+    Args:
+        folium_map (folium.Map): The map to add the layers to
+        url (str, optional): The path of the tiles relative to the map. Defaults to 'tiles'.
+        zooms (list[int], optional): The rendered zoom levels. Defaults to HEATMAP_ZOOMS.
+    """
+    names = {'ev': 'EV Density', 'population': 'Population Density'}
+    for layer in HEATMAP_LAYERS:
+        folium.TileLayer(tiles=f"{url}/{layer}/{{z}}/{{x}}/{{y}}.png",
+                         attr='Zensus 2011, KBA FZ27',
+                         name=names[layer],
+                         overlay=True,
+                         show=False,
+                         min_zoom=min(zooms),
+                         max_native_zoom=max(zooms)).add_to(folium_map)
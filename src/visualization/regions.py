@@ -0,0 +1,320 @@
+import hashlib
+import json
+import os
+import pickle
+import sys
+
+import folium
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from branca.element import MacroElement
+from jinja2 import Template
+from pyproj import Transformer
+from scipy.spatial import cKDTree
+
+from helper import telemetry
+from validation import validation
+
+from .bubble_pyramid import quantised_geometry
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+
+"""
+This module writes the map output sharded by Bundesland and Kreis.
+
+Every charging point and bubble is assigned to the Kreis (first five digits of the AGS)
+of the nearest populated 100m cell. The data of every Kreis is written into its own file
+./maps/regions/<land>/<kreis>.js, the index page ./maps/regions/index.html only contains
+the extent of every Kreis and loads the data of a Kreis when it is zoomed into.
+A manifest stores a hash of the input rows of every Kreis, so only the files of
+changed Kreise are written again. It also stores the fingerprints of the input files,
+if none of them changed the inputs are not read at all.
+The lookup of the Kreise is persisted in ./datasets/generated/kreis_lookup and keyed
+by the fingerprint of cleared_ev.parquet, so it is only rebuilt when the cells change.
+"""
+
+REGIONS_PATH = './maps/regions'
+LOOKUP_PATH = './datasets/generated/kreis_lookup'
+CELLS_FILE = './datasets/generated/cleared_ev.parquet'
+POINTS_FILE = './datasets/generated/charging_points.parquet'
+# bubble files and their colour on the map
+BUBBLE_LAYERS = {'hulls_split.csv': '#00aa00', 'hulls_batched.csv': '#0000aa'}
+# the data of a Kreis is loaded from this zoom level on
+REGION_ZOOM = 9
+# coordinates in the region files are quantised to about a meter
+DECIMALS = 5
+
+
+class KreisLookup:
+    """
+    Finds the Kreis of coordinates through the nearest populated cell of the 100m grid.
+    """
+
+    def __init__(self, tree: cKDTree, kreis: np.ndarray) -> None:
+        self.tree = tree
+        self.kreis = kreis
+        self.transformer = Transformer.from_crs(
+            "EPSG:4326", "EPSG:3035", always_xy=True)
+
+    @classmethod
+    def build(cls) -> 'KreisLookup':
+        """
+        Builds the lookup from the populated cells in cleared_ev.parquet.
+        """
+        df = pd.read_parquet(CELLS_FILE, columns=['x_mp_100m', 'y_mp_100m', 'ags'])
+        transformer = Transformer.from_crs("EPSG:4326", "EPSG:3035", always_xy=True)
+        # after the transformation to EPSG:4326 x holds the latitude and y the longitude
+        x, y = transformer.transform(df['y_mp_100m'].values, df['x_mp_100m'].values)
+        return cls(cKDTree(np.column_stack([x, y])), df['ags'].str[:5].values.astype(np.str_))
+
+    @classmethod
+    def cached(cls, path: str = LOOKUP_PATH) -> 'KreisLookup':
+        """
+        Returns the persisted lookup if it was built from the current cleared_ev.parquet,
+        otherwise the lookup is built and persisted.
+
+        Args:
+            path (str, optional): The directory of the persisted lookup. Defaults to LOOKUP_PATH.
+
+        Returns:
+            KreisLookup: The lookup of the current cells
+        """
+        fingerprint = validation.file_fingerprint(CELLS_FILE)
+        meta_path = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            if meta['fingerprint'] == fingerprint:
+                with open(os.path.join(path, 'tree.pickle'), 'rb') as f:
+                    tree = pickle.load(f)
+                return cls(tree, np.load(os.path.join(path, 'kreis.npy')))
+            os.remove(meta_path)
+        lookup = cls.build()
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'kreis.npy'), lookup.kreis)
+        with open(os.path.join(path, 'tree.pickle'), 'wb') as f:
+            pickle.dump(lookup.tree, f, protocol=pickle.HIGHEST_PROTOCOL)
+        # The meta file is written last, so an interrupted save is never picked up
+        with open(meta_path, 'w') as f:
+            json.dump({'fingerprint': fingerprint}, f)
+        return lookup
+
+    def to_metric(self, lon: np.ndarray, lat: np.ndarray) -> np.ndarray:
+        x, y = self.transformer.transform(lon, lat)
+        return np.column_stack([x, y])
+
+    def __call__(self, lon: np.ndarray, lat: np.ndarray) -> np.ndarray:
+        """
+        Returns the five digit Kreis key of every coordinate.
+        """
+        if len(lon) == 0:
+            return np.empty(0, dtype=object)
+        _, idx = self.tree.query(self.to_metric(lon, lat))
+        return self.kreis[idx]
+
+
+def region_inputs(lookup: KreisLookup) -> dict:
+    """
+    Collects the charging points and bubbles of every Kreis.
+
+    Returns:
+        dict: Per Kreis a dict with the charging points as DataFrame and the WKT bubbles per layer
+    """
+    regions = {}
+    points = pd.read_parquet(POINTS_FILE, columns=['lat', 'lon', 'count'])
+    points['kreis'] = lookup(points['lon'].values, points['lat'].values)
+    for kreis, group in points.groupby('kreis'):
+        regions.setdefault(kreis, {'points': group[['lat', 'lon', 'count']], 'bubbles': {}})
+
+    for file_name in BUBBLE_LAYERS:
+        if not validation.check_generated(file_name):
+            continue
+        hulls = pd.read_csv(f'./datasets/generated/{file_name}')['hull']
+        bounds = gpd.GeoSeries.from_wkt(hulls).bounds
+        kreis = lookup(((bounds['minx'] + bounds['maxx']) / 2).values,
+                       ((bounds['miny'] + bounds['maxy']) / 2).values)
+        for key, group in hulls.groupby(kreis):
+            region = regions.setdefault(
+                key, {'points': points.iloc[:0][['lat', 'lon', 'count']], 'bubbles': {}})
+            region['bubbles'][file_name] = group
+    return regions
+
+
+def input_fingerprints() -> dict:
+    """
+    Returns the fingerprints of all files the regions are built from.
+    """
+    files = [CELLS_FILE, POINTS_FILE] + [f'./datasets/generated/{file_name}' for file_name in BUBBLE_LAYERS
+                                         if validation.check_generated(file_name)]
+    return {os.path.basename(file): validation.file_fingerprint(file) for file in files}
+
+
+def region_digest(region: dict) -> str:
+    """
+    Returns a hash of the input rows of a Kreis.
+    """
+    digest = hashlib.sha1(np.ascontiguousarray(region['points'].values).tobytes())
+    for file_name, hulls in sorted(region['bubbles'].items()):
+        digest.update(file_name.encode())
+        digest.update('\n'.join(hulls).encode())
+    return digest.hexdigest()
+
+
+def region_payload(region: dict) -> dict:
+    """
+    Converts the inputs of a Kreis into the data that is loaded by the index page.
+    """
+    bubbles = {}
+    for file_name, hulls in region['bubbles'].items():
+        shapes = gpd.GeoSeries.from_wkt(hulls)
+        bubbles[file_name] = {'type': 'GeometryCollection',
+                              'geometries': [quantised_geometry(shape, DECIMALS, 0) for shape in shapes]}
+    points = region['points']
+    return {'points': [[round(lat, DECIMALS), round(lon, DECIMALS), int(count)]
+                       for lat, lon, count in points.itertuples(index=False)],
+            'bubbles': bubbles}
+
+
+def region_extent(region: dict) -> list:
+    """
+    Returns the bounding box [[south, west], [north, east]] of the data of a Kreis.
+    """
+    lat = list(region['points']['lat'])
+    lon = list(region['points']['lon'])
+    for hulls in region['bubbles'].values():
+        bounds = gpd.GeoSeries.from_wkt(hulls).total_bounds
+        lon += [bounds[0], bounds[2]]
+        lat += [bounds[1], bounds[3]]
+    return [[min(lat), min(lon)], [max(lat), max(lon)]]
+
+
+class RegionLoader(MacroElement):
+    """
+    Shows the extent of every Kreis on the index page and loads the data
+    of the Kreise in view once the map is zoomed in far enough.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function () {
+            var map = {{ this._parent.get_name() }};
+            var regions = {{ this.regions|tojson }};
+            var styles = {{ this.styles|tojson }};
+            var maxCount = {{ this.max_count }};
+            var loaded = {};
+            var outlines = L.layerGroup().addTo(map);
+            window.powerUpRegion = function (kreis, data) {
+                var group = L.layerGroup();
+                Object.keys(data.bubbles).forEach(function (layer) {
+                    var style = {color: styles[layer]};
+                    group.addLayer(L.geoJSON(data.bubbles[layer], {
+                        style: function () { return style; },
+                        pointToLayer: function (feature, latlng) {
+                            return L.circleMarker(latlng, Object.assign({radius: 2}, style));
+                        }
+                    }));
+                });
+                data.points.forEach(function (row) {
+                    var t = row[2] / maxCount;
+                    var color = 'rgb(' + Math.round(255 * Math.min(1, 2 * (1 - t))) + ','
+                        + Math.round(255 * Math.min(1, 2 * t)) + ',0)';
+                    group.addLayer(L.circle([row[0], row[1]], {
+                        radius: 25, color: color, fill: true, fillColor: color
+                    }).bindPopup('# Charging_Stations: ' + row[2]));
+                });
+                group.addTo(map);
+            };
+            Object.keys(regions).forEach(function (kreis) {
+                var region = regions[kreis];
+                L.rectangle(region.extent, {weight: 1, fill: false, color: '#555555'})
+                    .bindTooltip('Kreis ' + kreis + ': ' + region.points + ' charging points')
+                    .on('click', function () { map.fitBounds(region.extent); })
+                    .addTo(outlines);
+            });
+            function update() {
+                if (map.getZoom() < {{ this.min_zoom }}) { return; }
+                var view = map.getBounds();
+                Object.keys(regions).forEach(function (kreis) {
+                    if (loaded[kreis] || !view.intersects(regions[kreis].extent)) { return; }
+                    loaded[kreis] = true;
+                    var script = document.createElement('script');
+                    script.src = regions[kreis].file + '?v=' + regions[kreis].digest;
+                    document.head.appendChild(script);
+                });
+            }
+            map.on('moveend', update);
+            update();
+        })();
+        {% endmacro %}
+        """)
+
+    def __init__(self, regions: dict, max_count: int, min_zoom: int = REGION_ZOOM) -> None:
+        super().__init__()
+        self._name = 'RegionLoader'
+        self.regions = regions
+        self.max_count = max_count
+        self.min_zoom = min_zoom
+        self.styles = BUBBLE_LAYERS
+
+
+def write_regions(path: str = REGIONS_PATH) -> int:
+    """
+    Writes the data file of every changed Kreis and the index page.
+    Nothing is read if the input files did not change since the last run.
+
+    Args:
+        path (str, optional): The directory of the sharded output. Defaults to REGIONS_PATH.
+
+    Returns:
+        int: The number of Kreise whose data file was written
+    """
+    manifest_path = os.path.join(path, 'manifest.json')
+    inputs = input_fingerprints()
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as f:
+            previous_manifest = json.load(f)
+        manifest = previous_manifest.get('regions', {})
+        if previous_manifest.get('inputs') == inputs and os.path.exists(os.path.join(path, 'index.html')) \
+                and all(os.path.exists(os.path.join(path, entry['file'])) for entry in manifest.values()):
+            return 0
+
+    regions = region_inputs(KreisLookup.cached())
+
+    written = 0
+    index = {}
+    progress = telemetry.progress(len(regions))
+    for kreis, region in sorted(regions.items()):
+        file_name = f"{kreis[:2]}/{kreis}.js"
+        digest = region_digest(region)
+        previous = manifest.get(kreis)
+        if previous is None or previous['digest'] != digest \
+                or not os.path.exists(os.path.join(path, file_name)):
+            os.makedirs(os.path.join(path, kreis[:2]), exist_ok=True)
+            with open(os.path.join(path, file_name), 'w') as f:
+                f.write(f"powerUpRegion({json.dumps(kreis)},")
+                json.dump(region_payload(region), f, separators=(',', ':'))
+                f.write(');\n')
+            previous = {'digest': digest,
+                        'file': file_name,
+                        'extent': region_extent(region),
+                        'points': len(region['points'])}
+            written += 1
+        index[kreis] = previous
+        progress.advance()
+
+    for kreis in set(manifest) - set(index):
+        stale_file = os.path.join(path, manifest[kreis]['file'])
+        if os.path.exists(stale_file):
+            os.remove(stale_file)
+
+    max_count = max([int(region['points']['count'].max())
+                     for region in regions.values() if len(region['points'])] + [1])
+    index_map = folium.Map(location=[51.165691, 10.451526], zoom_start=6, prefer_canvas=True)
+    index_map.add_child(RegionLoader(index, max_count))
+    index_map.save(os.path.join(path, 'index.html'))
+    with open(manifest_path, 'w') as f:
+        json.dump({'inputs': inputs, 'regions': index}, f)
+    return written
@@ -3,13 +3,13 @@ import sys
 
 import folium
 import pandas as pd
-from folium.plugins import MarkerCluster
-from halo import Halo
-from matplotlib.colors import LinearSegmentedColormap
-from shapely.wkt import loads
+from folium.plugins import FastMarkerCluster
 
+from helper import telemetry
 from validation import validation
 
+from . import bubble_pyramid, heatmap_tiles, regions
+
 sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir))
 
 
@@ -27,90 +27,123 @@ class Visualization:
     Methods
     -------
     charging_points()
-        Generates a marker cluster on the map object that displays the charging points and their coverage.
+        Generates a client-side marker cluster on the map object that displays the charging points and their coverage.
     bubbles(path: str)
-        Generates bubble shapes on the map object based on the data file specified by `path`.
+        Generates a zoom dependent layer of bubble shapes on the map object based on the data file specified by `path`.
+    heatmap()
+        Renders the EV and population density tiles of the 100m grid and adds them as tile layers.
+    save_regions()
+        Writes the visualization sharded by Bundesland and Kreis to `MAPS_PATH`/regions.
     save()
         Saves the map object as an HTML file to the specified `MAPS_PATH` directory.
     run()
-        Runs the visualization process by calling the `charging_points`, `bubbles`, and `save` methods.
+        Runs the visualization process by calling the `charging_points`, `bubbles`, `heatmap` and `save` methods.
     """
 
-    def __init__(self) -> None:
-        self.MAPS_PATH = "./maps"
+    def __init__(self, maps_path: str = "./maps") -> None:
+        self.MAPS_PATH = maps_path
         self.map = folium.Map(
             # location of the middle of germany
             location=[51.165691, 10.451526],
             zoom_start=6,
+            # canvas rendering keeps the browser responsive with many shapes
+            prefer_canvas=True,
         )
 
     def charging_points(self) -> None:
-        df = pd.read_csv('./datasets/generated/charging_points.csv')
-
-        df['Longitude'] = df['Unnamed: 0'].apply(lambda x: loads(x).x)
-        df['Latitude'] = df['Unnamed: 0'].apply(lambda x: loads(x).y)
-
-        marker_cluster = MarkerCluster(
-            name="  Charging Points").add_to(self.map)
-        colors = [(1, 0, 0), (1, 1, 0), (0, 1, 0)]  # red to yellow to green
-        colormap = LinearSegmentedColormap.from_list('custom', colors, N=256)
-        for index, row in df.iterrows():
-            count = row['Count']
-            folium.Circle(
-                location=[row['Latitude'], row['Longitude']],
-                radius=25,
-                popup=f"# Charging_Stations: {row['Count']}",
-
-                color=colormap(count/df['Count'].max()),
-                fill=True,
-                fill_color=colormap(count/df['Count'].max())).add_to(marker_cluster)
+        """
+        Adds all charging points as one client-side clustered layer.
+        The points are embedded as a single array, the circles are created in the browser.
+        Their colour goes from red to yellow to green with the number of charging stations,
+        the maximum is computed once.
+        """
+        df = pd.read_parquet('./datasets/generated/charging_points.parquet',
+                             columns=['lat', 'lon', 'count'])
+        max_count = max(int(df['count'].max()), 1) if len(df) else 1
+        # red to yellow to green
+        callback = """
+            function (row) {
+                var t = row[2] / %d;
+                var red = Math.round(255 * Math.min(1, 2 * (1 - t)));
+                var green = Math.round(255 * Math.min(1, 2 * t));
+                var color = 'rgb(' + red + ',' + green + ',0)';
+                var circle = L.circle(new L.LatLng(row[0], row[1]), {
+                    radius: 25, color: color, fill: true, fillColor: color});
+                circle.bindPopup('# Charging_Stations: ' + row[2]);
+                return circle;
+            }""" % max_count
+        FastMarkerCluster(df.values.tolist(), callback=callback,
+                          name="  Charging Points").add_to(self.map)
 
     def bubbles(self, path: str) -> None:
-        df = pd.read_csv(f"./datasets/generated/{path}")
-        shapes = df["hull"].apply(lambda x: loads(x))
+        """
+        Adds the bubbles of the file `path` as a layer that loads simplified
+        geometries matching the current zoom level from a precomputed pyramid.
+
+        Args:
+            path (str): The file name of the bubbles in ./datasets/generated
+        """
         name = 'Bubbles Simple Split'
         if path == 'hulls_batched.csv':
             name = 'Bubbles KMeans'
-
-        def style_function(x): return {
-            'color': '#0000aa' if name == 'Bubbles KMeans' else '#00aa00'}
-        shape_group = folium.FeatureGroup(
-            name=name, show=False)
-        for shape in shapes:
-            folium.GeoJson(shape, style_function=style_function).add_to(
-                shape_group)
-        shape_group.add_to(self.map)
+        style = {'color': '#0000aa' if name == 'Bubbles KMeans' else '#00aa00'}
+        bubble_pyramid.add_bubble_pyramid(
+            self.map, f"./datasets/generated/{path}", os.path.splitext(path)[0],
+            name, style, self.MAPS_PATH)
+
+    def heatmap(self) -> None:
+        """
+        Renders the changed tiles of the EV and population density pyramids
+        of the 100m grid and adds them as tile layers.
+        """
+        telemetry.rows(rows_out=heatmap_tiles.render_heatmap_tiles(f'{self.MAPS_PATH}/tiles'))
+        heatmap_tiles.add_heatmap_layers(self.map, 'tiles')
+
+    def save_regions(self) -> None:
+        """
+        Writes the output sharded by Bundesland and Kreis with an index page
+        that loads the data of a Kreis on demand. Only changed Kreise are written.
+        """
+        telemetry.rows(rows_out=regions.write_regions(f'{self.MAPS_PATH}/regions'))
 
     def save(self) -> None:
         folium.LayerControl().add_to(self.map)
         self.map.save(f'{self.MAPS_PATH}/visualization.html')
 
     def run(self) -> None:
-        spinner = Halo("Loading")
-        spinner.start("Visualizing The Charging Points")
-        self.charging_points()
-        spinner.succeed()
-        spinner.start("Visualizing The Simple Split Bubbles")
-        if validation.check_generated('hulls_split.csv'):
-            self.bubbles('hulls_split.csv')
-            spinner.succeed()
-        else:
-            spinner.fail
-        spinner.start("Visualizing The KMeans Bubbles")
-        if validation.check_generated('hulls_batched.csv'):
-            self.bubbles('hulls_batched.csv')
-            spinner.succeed()
-        else:
-            spinner.fail()
-        spinner.start(
-            f"Saving The Visualization Under {self.MAPS_PATH}/visualization.html")
-        self.save()
-        spinner.succeed()
-
-
-def run_visualization():
+        with telemetry.step("Visualizing The Charging Points"):
+            self.charging_points()
+        with telemetry.step("Visualizing The Simple Split Bubbles") as step:
+            if validation.check_generated('hulls_split.csv'):
+                self.bubbles('hulls_split.csv')
+            else:
+                step.skip()
+        with telemetry.step("Visualizing The KMeans Bubbles") as step:
+            if validation.check_generated('hulls_batched.csv'):
+                self.bubbles('hulls_batched.csv')
+            else:
+                step.skip()
+        with telemetry.step("Rendering The EV Density Tiles") as step:
+            if validation.check_generated('cleared_ev.parquet'):
+                self.heatmap()
+            else:
+                step.skip()
+        with telemetry.step(f"Saving The Visualization Under {self.MAPS_PATH}/visualization.html"):
+            self.save()
+        with telemetry.step(f"Saving The Regional Visualization Under {self.MAPS_PATH}/regions/index.html") as step:
+            if validation.check_generated('cleared_ev.parquet'):
+                self.save_regions()
+            else:
+                step.skip()
+
+
+def run_visualization(maps_path: str = "./maps"):
     """
     Runs the visualization process by creating a Visualization object and calling its `run` method.
+
+    Args:
+        maps_path (str, optional): The directory the maps are saved to. Defaults to "./maps".
     """
-    vis = Visualization()
+    os.makedirs(maps_path, exist_ok=True)
+    vis = Visualization(maps_path)
     vis.run()